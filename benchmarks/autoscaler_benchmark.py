@@ -0,0 +1,58 @@
+"""Compares autoscaling policies with the offline simulator.
+
+Usage:
+    python benchmarks/autoscaler_benchmark.py
+    python benchmarks/autoscaler_benchmark.py --trace=recorded_trace.csv
+"""
+
+import argparse
+import logging
+
+from buildflow.runtime.managers import auto_scaler
+from buildflow.runtime.managers import autoscaler_simulator as sim
+
+_POLICIES = {
+    "utilization": auto_scaler.UtilizationPolicy,
+    "trend_aware": auto_scaler.TrendAwarePolicy,
+}
+
+
+def _synthetic_traces(duration_secs: int):
+    return {
+        "constant": sim.constant_trace(duration_secs, 200, 50),
+        "step": sim.step_trace(duration_secs, 50, 500, 50),
+        "bursty": sim.bursty_trace(duration_secs, 50, 500, 50),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trace", type=str, default="")
+    parser.add_argument("--duration_secs", type=int, default=3600)
+    parser.add_argument("--check_in_secs", type=int, default=10)
+    args = parser.parse_args()
+    # The auto scaler logs every resize.
+    logging.disable(logging.WARNING)
+
+    if args.trace:
+        traces = {args.trace: sim.load_trace(args.trace)}
+    else:
+        traces = _synthetic_traces(args.duration_secs)
+
+    print(
+        f"{'trace':<12}{'policy':<14}{'replica_secs':>14}{'peak_backlog':>14}"
+        f"{'time_to_drain':>15}{'resizes':>9}"
+    )
+    for trace_name, trace in traces.items():
+        for policy_name, policy_cls in _POLICIES.items():
+            result = sim.simulate(policy_cls(), trace, check_in_secs=args.check_in_secs)
+            drain = "-" if result.time_to_drain is None else result.time_to_drain
+            print(
+                f"{trace_name:<12}{policy_name:<14}{result.replica_seconds:>14.0f}"
+                f"{result.peak_backlog:>14.0f}{drain:>15}"
+                f"{result.num_resize_events:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Benchmarks the compiled dataclass decoders against dacite.
+
+Usage:
+    python benchmarks/decoder_benchmark.py --num_elements=100000
+"""
+
+import argparse
+import dataclasses
+import timeit
+from typing import List, Optional
+
+import dacite
+
+from buildflow.runtime import decoders
+
+
+@dataclasses.dataclass
+class Address:
+    street: str
+    city: str
+    zip_code: Optional[str] = None
+
+
+@dataclasses.dataclass
+class LineItem:
+    sku: str
+    quantity: int
+    price: float
+
+
+@dataclasses.dataclass
+class Order:
+    order_id: str
+    customer_id: int
+    shipping_address: Address
+    billing_address: Optional[Address]
+    items: List[LineItem]
+    notes: Optional[str] = None
+
+
+def _sample_order(i: int):
+    return {
+        "order_id": f"order-{i}",
+        "customer_id": i,
+        "shipping_address": {"street": "1 Main St", "city": "Springfield"},
+        "billing_address": {
+            "street": "2 Main St",
+            "city": "Springfield",
+            "zip_code": "12345",
+        },
+        "items": [
+            {"sku": f"sku-{j}", "quantity": j, "price": j * 1.5} for j in range(5)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_elements", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    elements = [_sample_order(i) for i in range(args.num_elements)]
+    decoder = decoders.get_decoder(Order)
+    assert [decoder(e) for e in elements] == [
+        dacite.from_dict(data_class=Order, data=e) for e in elements
+    ]
+
+    dacite_secs = min(
+        timeit.repeat(
+            lambda: [dacite.from_dict(data_class=Order, data=e) for e in elements],
+            number=1,
+            repeat=args.repeat,
+        )
+    )
+    compiled_secs = min(
+        timeit.repeat(
+            lambda: [decoder(e) for e in elements], number=1, repeat=args.repeat
+        )
+    )
+    print(f"elements:  {args.num_elements}")
+    print(f"dacite:    {dacite_secs:.4f}s")
+    print(f"compiled:  {compiled_secs:.4f}s")
+    print(f"speedup:   {dacite_secs / compiled_secs:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
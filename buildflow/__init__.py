@@ -4,10 +4,25 @@ from typing import Optional
 from buildflow.api import *
 from buildflow.runtime.depends import Depends, PubSub
 from buildflow.runtime.grid import DeploymentGrid
+from buildflow.runtime.managers.auto_scaler import (
+    AutoscalingPolicy,
+    LatencySLOPolicy,
+    TrendAwarePolicy,
+    UtilizationPolicy,
+)
 from buildflow.runtime.node import Node
 from buildflow.runtime.processor import Processor
 from buildflow.utils import *
 from buildflow.runtime.ray_io.bigquery_io import BigQuerySink, BigQuerySource
+from buildflow.runtime.ray_io.codecs import (
+    AvroCodec,
+    Codec,
+    Compression,
+    JsonCodec,
+    MsgPackCodec,
+    ProtobufCodec,
+    RawCodec,
+)
 from buildflow.runtime.ray_io.datawarehouse_io import DataWarehouseSink
 from buildflow.runtime.ray_io.empty_io import EmptySink, EmptySource
 from buildflow.runtime.ray_io.gcs_io import GCSFileNotifications, GCSFileEvent
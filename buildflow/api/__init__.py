@@ -2,7 +2,12 @@
 from .node import NodeAPI, NodePlan, NodeResults
 from .io import SinkType, SourceType
 from .processor import ProcessorAPI, ProcessorPlan
-from .options import AutoscalingOptions
+from .options import (
+    AutoscalingOptions,
+    BatchingOptions,
+    FlowControlOptions,
+    StageScalingOptions,
+)
 
 # NOTE: Only API code should go into this directory. Any runtime code should go
 # into the runtime directory.
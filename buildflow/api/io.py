@@ -33,6 +33,16 @@ class Source(_BaseIO):
         """Returns the actor associated with the source."""
         pass
 
+    def local_actor(self, ray_sinks, proc_input_type: Optional[Type]):
+        """Returns the source actor constructed in the current process.
+
+        This is used to fuse the source, processor, and sink of a replica into
+        a single actor. Sources that don't implement this can't be fused.
+        """
+        raise NotImplementedError(
+            f"local_actor not implemented for class {self.__class__}"
+        )
+
     def preprocess(self, element: Any) -> Any:
         return element
 
@@ -63,6 +73,12 @@ class StreamingSource(Source, DependsPublisher):
         return True
 
 
+def supports_local_actor(io_ref: _BaseIO) -> bool:
+    """Returns true if the source or sink can run in the current process."""
+    base_cls = Source if isinstance(io_ref, Source) else Sink
+    return type(io_ref).local_actor is not base_cls.local_actor
+
+
 SourceType = TypeVar("SourceType", bound=Source)
 
 
@@ -81,5 +97,15 @@ class Sink(_BaseIO):
         """Returns the actor associated with the sink."""
         pass
 
+    def local_actor(self, remote_fn: Callable, is_streaming: bool):
+        """Returns the sink actor constructed in the current process.
+
+        This is used to fuse the source, processor, and sink of a replica into
+        a single actor. Sinks that don't implement this can't be fused.
+        """
+        raise NotImplementedError(
+            f"local_actor not implemented for class {self.__class__}"
+        )
+
 
 SinkType = TypeVar("SinkType", bound=Sink)
@@ -1,10 +1,13 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Optional
 
 
 @dataclass
 class AutoscalingOptions:
-    # The minimum number of replicas to maintain.
+    # The minimum number of replicas to maintain. If this is 0 all replicas
+    # are removed once the processor has been idle for
+    # `scale_to_zero_idle_secs`, and a replica is started again as soon as the
+    # source has a backlog.
     min_replicas: int = 1
     # The maximum number of replicas to scale up to.
     max_replicas: int = 1000
@@ -15,3 +18,67 @@ class AutoscalingOptions:
     # set to false your pipeline will always maintain the same number of
     # replicas as it started with.
     autoscaling: bool = True
+    # The policy used to decide the number of replicas. This should be an
+    # instance of buildflow.runtime.managers.auto_scaler.AutoscalingPolicy, if
+    # not set the utilization based policy is used.
+    policy: Optional[Any] = None
+    # If set the source, processor, and sink stages are scaled as independent
+    # pools instead of as replicas that contain one of each. The replica
+    # options above then apply to the source stage.
+    stage_scaling: Optional["StageScalingOptions"] = None
+    # When processors compete for cluster resources, processors with a higher
+    # priority get their replicas first. Every processor is guaranteed its
+    # min_replicas before any processor gets more, as far as the cluster
+    # allows.
+    priority: int = 0
+    # The number of replicas to keep set up but idle, so they can start
+    # processing right away when we scale up instead of waiting for new
+    # actors and the processor's setup. Warm replicas hold on to their
+    # resources, and the pool is refilled in the background.
+    warm_pool_size: int = 0
+    # How long the source needs to have no backlog and no messages processed
+    # before we scale to zero. Only used if min_replicas is 0.
+    scale_to_zero_idle_secs: float = 300
+
+
+@dataclass
+class StageScalingOptions:
+    # The processor and sink pools are sized so the average number of calls in
+    # flight per actor stays close to these targets. Processors are usually
+    # CPU bound and handle a single call at a time, while sinks spend most of
+    # their time waiting on IO and can overlap many writes.
+    target_processor_load: float = 1
+    target_sink_load: float = 4
+    min_processors: int = 1
+    max_processors: int = 1000
+    min_sinks: int = 1
+    max_sinks: int = 1000
+
+
+@dataclass
+class FlowControlOptions:
+    # The max number of records a source replica may have outstanding in its
+    # sink before it stops pulling. If not set the number of records is not
+    # limited.
+    max_outstanding_records: Optional[int] = None
+    # The max number of bytes a source replica may have outstanding in its
+    # sink before it stops pulling. If not set the number of bytes is not
+    # limited.
+    max_outstanding_bytes: Optional[int] = None
+
+
+@dataclass
+class BatchingOptions:
+    # Sinks buffer the output of multiple batches and write them out together
+    # once any of the below limits is reached. If none of them are set every
+    # batch is written out as soon as it is processed.
+    # Rows are only acked once they have been written, so sources need enough
+    # batches in flight (see `max_in_flight_batches`) to fill the buffer.
+    # The number of rows to buffer before writing.
+    max_rows: Optional[int] = None
+    # The number of bytes to buffer before writing.
+    max_bytes: Optional[int] = None
+    # The max number of seconds a row can be buffered before it is written.
+    # Defaults to 1 second if only max_rows or max_bytes is set, so a buffer
+    # that never fills up is still written.
+    max_latency_secs: Optional[float] = None
@@ -1,8 +1,12 @@
 from dataclasses import dataclass
-from typing import Any, Dict, Iterable, Optional
+from typing import Any, Dict, Iterable, Optional, Union
 
 from buildflow.api.io import SourceType, SinkType
-from buildflow.api.options import AutoscalingOptions
+from buildflow.api.options import (
+    AutoscalingOptions,
+    BatchingOptions,
+    FlowControlOptions,
+)
 
 
 class ProcessorAPI:
@@ -28,6 +32,18 @@ class ProcessorAPI:
     def process(self, payload: Any):
         raise NotImplementedError("process not implemented")
 
+    # This lifecycle method is called once per batch of payloads instead of
+    # `process` if the processor is vectorized. The batch is passed as a
+    # pandas DataFrame, pyarrow Table, or list based on the type annotation of
+    # the batch argument.
+    def process_batch(self, batch: Any):
+        raise NotImplementedError("process_batch not implemented")
+
+    # Returns whether the runtime should call `process_batch` instead of
+    # `process`.
+    def is_vectorized(self) -> bool:
+        return False
+
     # Returns the arg spec of the process method.
     def processor_arg_spec(self):
         raise NotImplementedError("process not implemented")
@@ -35,9 +51,29 @@ class ProcessorAPI:
     def num_cpus(self) -> float:
         return 0.5
 
+    # Whether the source, processor, and sink of each replica should run in a
+    # single actor.
+    def fuse_replicas(self) -> bool:
+        return False
+
     def autoscaling_options(self) -> AutoscalingOptions:
         return AutoscalingOptions()
 
+    # Limits how much data a source replica can send to its sink before the
+    # sink has finished writing it.
+    def flow_control_options(self) -> FlowControlOptions:
+        return FlowControlOptions()
+
+    # The number of concurrent pull loops to run in each source replica. If
+    # not set the source's recommended number of threads is used. If set to
+    # "auto" the best value is measured at startup.
+    def source_concurrency(self) -> Optional[Union[int, str]]:
+        return None
+
+    # Controls how sinks buffer outputs across batches before writing them.
+    def batching_options(self) -> BatchingOptions:
+        return BatchingOptions()
+
 
 @dataclass
 class ProcessorPlan:
@@ -0,0 +1,195 @@
+"""Compiled decoders for converting dictionaries into dataclasses.
+
+`dacite.from_dict` inspects the type hints of a dataclass every time it is
+called. In the hot path we decode every element of every batch into the same
+dataclass, so instead we generate a specialized constructor once per type and
+cache it.
+
+Supported field types:
+    - nested dataclasses
+    - Optional[X]
+    - List[X], Tuple[X, ...], Set[X]
+    - Dict[K, V]
+Any other type is passed through as is.
+"""
+
+import dataclasses
+import threading
+import typing
+from typing import Any, Callable, Dict, Type
+
+Decoder = Callable[[Any], Any]
+
+_DECODERS: Dict[Type, Decoder] = {}
+_LOCK = threading.RLock()
+
+
+class DecodeError(ValueError):
+    def __init__(self, data_class: Type, field_name: str) -> None:
+        super().__init__(
+            f'missing value for field "{field_name}" when decoding '
+            f"{data_class.__name__}"
+        )
+        self.data_class = data_class
+        self.field_name = field_name
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _needs_decoding(decoder: Decoder) -> bool:
+    return decoder is not _identity
+
+
+def _is_optional(field_type: Any) -> bool:
+    return typing.get_origin(field_type) is typing.Union and type(
+        None
+    ) in typing.get_args(field_type)
+
+
+def _type_decoder(field_type: Any) -> Decoder:
+    """Returns a decoder for a single (possibly generic) type."""
+    if dataclasses.is_dataclass(field_type) and isinstance(field_type, type):
+        return get_decoder(field_type)
+    origin = typing.get_origin(field_type)
+    args = typing.get_args(field_type)
+    if origin is typing.Union:
+        non_none = [arg for arg in args if arg is not type(None)]
+        if len(non_none) != 1:
+            # Unions of multiple types are passed through as is.
+            return _identity
+        inner = _type_decoder(non_none[0])
+        if not _needs_decoding(inner):
+            return _identity
+
+        def decode_optional(value):
+            if value is None:
+                return None
+            return inner(value)
+
+        return decode_optional
+    if origin in (list, set, frozenset) and args:
+        inner = _type_decoder(args[0])
+        if not _needs_decoding(inner):
+            return _identity
+
+        if origin is list:
+
+            def decode_list(value):
+                return [inner(elem) for elem in value]
+
+            return decode_list
+
+        def decode_collection(value):
+            return origin(inner(elem) for elem in value)
+
+        return decode_collection
+    if origin is tuple and args:
+        if len(args) == 2 and args[1] is Ellipsis:
+            inner = _type_decoder(args[0])
+            if not _needs_decoding(inner):
+                return _identity
+
+            def decode_var_tuple(value):
+                return tuple(inner(elem) for elem in value)
+
+            return decode_var_tuple
+        inners = [_type_decoder(arg) for arg in args]
+        if not any(_needs_decoding(inner) for inner in inners):
+            return _identity
+
+        def decode_tuple(value):
+            return tuple(inner(elem) for inner, elem in zip(inners, value))
+
+        return decode_tuple
+    if origin is dict and len(args) == 2:
+        inner = _type_decoder(args[1])
+        if not _needs_decoding(inner):
+            return _identity
+
+        def decode_dict(value):
+            return {key: inner(elem) for key, elem in value.items()}
+
+        return decode_dict
+    return _identity
+
+
+def _compile(data_class: Type) -> Decoder:
+    try:
+        type_hints = typing.get_type_hints(data_class)
+    except NameError:
+        # Forward references that can't be resolved, fall back to the raw
+        # annotations.
+        type_hints = {
+            field.name: field.type for field in dataclasses.fields(data_class)
+        }
+    namespace = {
+        "_cls": data_class,
+        "_is_instance": isinstance,
+        "_DecodeError": DecodeError,
+    }
+    lines = ["def decode(data):"]
+    lines.append("    if _is_instance(data, _cls):")
+    lines.append("        return data")
+    lines.append("    try:")
+    lines.append("        return _cls(")
+    for i, field in enumerate(dataclasses.fields(data_class)):
+        if not field.init:
+            continue
+        field_type = type_hints.get(field.name, Any)
+        decoder = _type_decoder(field_type)
+        decoder_name = f"_decode_{i}"
+        namespace[decoder_name] = decoder
+        key = repr(field.name)
+        present = f"data[{key}]"
+        if _needs_decoding(decoder):
+            present = f"{decoder_name}({present})"
+        if field.default is not dataclasses.MISSING:
+            default_name = f"_default_{i}"
+            namespace[default_name] = field.default
+            value = f"{present} if {key} in data else {default_name}"
+        elif field.default_factory is not dataclasses.MISSING:
+            factory_name = f"_factory_{i}"
+            namespace[factory_name] = field.default_factory
+            value = f"{present} if {key} in data else {factory_name}()"
+        elif _is_optional(field_type):
+            # Optional fields without a default are set to None if missing.
+            value = f"data.get({key})"
+            if _needs_decoding(decoder):
+                value = f"{decoder_name}({value})"
+        else:
+            value = present
+        lines.append(f"            {field.name}={value},")
+    lines.append("        )")
+    lines.append("    except KeyError as e:")
+    lines.append("        raise _DecodeError(_cls, e.args[0]) from None")
+    exec("\n".join(lines), namespace)
+    return namespace["decode"]
+
+
+def get_decoder(data_class: Type) -> Decoder:
+    """Returns a cached decoder for `data_class`.
+
+    The decoder is compiled the first time a type is seen.
+    """
+    decoder = _DECODERS.get(data_class)
+    if decoder is not None:
+        return decoder
+    with _LOCK:
+        if data_class in _DECODERS:
+            return _DECODERS[data_class]
+        # Register a trampoline first so self referencing dataclasses can
+        # resolve their own decoder while being compiled.
+        _DECODERS[data_class] = lambda data: _DECODERS[data_class](data)
+        try:
+            _DECODERS[data_class] = _compile(data_class)
+        except Exception:
+            del _DECODERS[data_class]
+            raise
+    return _DECODERS[data_class]
+
+
+def decode(data_class: Type, data: Any) -> Any:
+    """Decodes `data` into an instance of `data_class`."""
+    return get_decoder(data_class)(data)
@@ -0,0 +1,86 @@
+import dataclasses
+from typing import Dict, List, Optional, Tuple
+import unittest
+
+import dacite
+
+from buildflow.runtime import decoders
+
+
+@dataclasses.dataclass
+class Inner:
+    value: int
+    label: Optional[str] = None
+
+
+@dataclasses.dataclass
+class Outer:
+    name: str
+    inner: Inner
+    maybe_inner: Optional[Inner]
+    inners: List[Inner]
+    inner_map: Dict[str, Inner]
+    pair: Tuple[Inner, int]
+    tags: List[str] = dataclasses.field(default_factory=list)
+    count: int = 0
+
+
+@dataclasses.dataclass
+class Node:
+    value: int
+    children: List["Node"] = dataclasses.field(default_factory=list)
+
+
+class DecodersTest(unittest.TestCase):
+    def test_matches_dacite(self):
+        data = {
+            "name": "a",
+            "inner": {"value": 1},
+            "maybe_inner": {"value": 2, "label": "two"},
+            "inners": [{"value": 3}, {"value": 4}],
+            "inner_map": {"x": {"value": 5}},
+            "pair": ({"value": 6}, 7),
+            "count": 8,
+        }
+
+        decoded = decoders.decode(Outer, data)
+
+        self.assertEqual(dacite.from_dict(data_class=Outer, data=data), decoded)
+
+    def test_optional_missing_is_none(self):
+        data = {
+            "name": "a",
+            "inner": {"value": 1},
+            "inners": [],
+            "inner_map": {},
+            "pair": ({"value": 6}, 7),
+        }
+
+        decoded = decoders.decode(Outer, data)
+
+        self.assertIsNone(decoded.maybe_inner)
+        self.assertEqual([], decoded.tags)
+        self.assertEqual(0, decoded.count)
+
+    def test_missing_required_field(self):
+        with self.assertRaisesRegex(decoders.DecodeError, '"name"'):
+            decoders.decode(Outer, {})
+
+    def test_existing_instance_is_returned(self):
+        inner = Inner(1)
+
+        self.assertIs(inner, decoders.decode(Inner, inner))
+
+    def test_decoder_is_cached(self):
+        self.assertIs(decoders.get_decoder(Inner), decoders.get_decoder(Inner))
+
+    def test_recursive_dataclass(self):
+        decoded = decoders.decode(
+            Node, {"value": 1, "children": [{"value": 2, "children": []}]}
+        )
+
+        self.assertEqual(Node(1, [Node(2, [])]), decoded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+"""Compiled encoders for converting dataclasses into sink ready values.
+
+This is the counterpart of `decoders`. Walking `__dataclass_fields__` and
+checking the type of every value for every output element is expensive in the
+hot path, so instead we generate a specialized encoder the first time a
+dataclass type is seen and cache it.
+
+Values are converted the same way for all output formats:
+    - nested dataclasses are converted to dictionaries
+    - lists, tuples and dictionaries of dataclasses are converted element wise
+    - datetime.datetime, datetime.date, datetime.time are converted to their
+      isoformat string
+Fields whose type can't be determined statically (e.g. Any) are converted by
+inspecting the value at runtime.
+"""
+
+import dataclasses
+import datetime
+import json
+import threading
+import typing
+from typing import Any, Callable, Dict, Iterable, List, Optional, Type
+
+import pyarrow as pa
+
+Encoder = Callable[[Any], Any]
+
+_DATETIME_TYPES = (datetime.datetime, datetime.date, datetime.time)
+# Types we know are already json serializable and can be passed through.
+_PRIMITIVE_TYPES = (int, float, str, bool, bytes, type(None))
+
+_ENCODERS: Dict[Type, Encoder] = {}
+_COLUMN_ENCODERS: Dict[Type, Callable[[List[Any]], List[List[Any]]]] = {}
+_LOCK = threading.RLock()
+
+_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _needs_encoding(encoder: Encoder) -> bool:
+    return encoder is not _identity
+
+
+def _encode_datetime(value: Any) -> Any:
+    return value.isoformat()
+
+
+def _encode_dynamic(value: Any) -> Any:
+    """Encodes a value whose type is only known at runtime."""
+    if isinstance(value, _DATETIME_TYPES):
+        return value.isoformat()
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return get_encoder(type(value))(value)
+    if isinstance(value, (list, tuple)):
+        return [_encode_dynamic(elem) for elem in value]
+    if isinstance(value, dict):
+        return {key: _encode_dynamic(elem) for key, elem in value.items()}
+    return value
+
+
+def _type_encoder(field_type: Any) -> Encoder:
+    """Returns an encoder for a single (possibly generic) type."""
+    if dataclasses.is_dataclass(field_type) and isinstance(field_type, type):
+        return get_encoder(field_type)
+    if field_type in _PRIMITIVE_TYPES:
+        return _identity
+    if isinstance(field_type, type) and issubclass(field_type, _DATETIME_TYPES):
+        return _encode_datetime
+    origin = typing.get_origin(field_type)
+    args = typing.get_args(field_type)
+    if origin is typing.Union:
+        non_none = [arg for arg in args if arg is not type(None)]
+        if len(non_none) != 1:
+            return _encode_dynamic
+        inner = _type_encoder(non_none[0])
+        if not _needs_encoding(inner):
+            return _identity
+
+        def encode_optional(value):
+            if value is None:
+                return None
+            return inner(value)
+
+        return encode_optional
+    if origin in (list, set, frozenset, tuple) and args:
+        if origin is tuple and not (len(args) == 2 and args[1] is Ellipsis):
+            inners = [_type_encoder(arg) for arg in args]
+            if not any(_needs_encoding(inner) for inner in inners):
+                return _identity
+
+            def encode_tuple(value):
+                return [inner(elem) for inner, elem in zip(inners, value)]
+
+            return encode_tuple
+        inner = _type_encoder(args[0])
+        if not _needs_encoding(inner):
+            return _identity
+
+        def encode_list(value):
+            return [inner(elem) for elem in value]
+
+        return encode_list
+    if origin is dict and len(args) == 2:
+        inner = _type_encoder(args[1])
+        if not _needs_encoding(inner):
+            return _identity
+
+        def encode_dict(value):
+            return {key: inner(elem) for key, elem in value.items()}
+
+        return encode_dict
+    return _encode_dynamic
+
+
+def _field_encoders(data_class: Type) -> List[typing.Tuple[str, Encoder]]:
+    try:
+        type_hints = typing.get_type_hints(data_class)
+    except NameError:
+        # Forward references that can't be resolved, fall back to the raw
+        # annotations.
+        type_hints = {
+            field.name: field.type for field in dataclasses.fields(data_class)
+        }
+    return [
+        (field.name, _type_encoder(type_hints.get(field.name, Any)))
+        for field in dataclasses.fields(data_class)
+    ]
+
+
+def _compile(data_class: Type) -> Encoder:
+    namespace = {}
+    lines = ["def encode(obj):", "    return {"]
+    for i, (name, encoder) in enumerate(_field_encoders(data_class)):
+        value = f"obj.{name}"
+        if _needs_encoding(encoder):
+            encoder_name = f"_encode_{i}"
+            namespace[encoder_name] = encoder
+            value = f"{encoder_name}({value})"
+        lines.append(f"        {name!r}: {value},")
+    lines.append("    }")
+    exec("\n".join(lines), namespace)
+    return namespace["encode"]
+
+
+def _compile_columns(data_class: Type) -> Callable[[List[Any]], List[List[Any]]]:
+    namespace = {}
+    lines = ["def encode_columns(objs):", "    return ["]
+    for i, (name, encoder) in enumerate(_field_encoders(data_class)):
+        value = f"obj.{name}"
+        if _needs_encoding(encoder):
+            encoder_name = f"_encode_{i}"
+            namespace[encoder_name] = encoder
+            value = f"{encoder_name}({value})"
+        lines.append(f"        [{value} for obj in objs],")
+    lines.append("    ]")
+    exec("\n".join(lines), namespace)
+    return namespace["encode_columns"]
+
+
+def _get_cached(cache: Dict[Type, Any], data_class: Type, compile_fn: Callable):
+    encoder = cache.get(data_class)
+    if encoder is not None:
+        return encoder
+    with _LOCK:
+        if data_class in cache:
+            return cache[data_class]
+        # Register a trampoline first so self referencing dataclasses can
+        # resolve their own encoder while being compiled.
+        cache[data_class] = lambda data: cache[data_class](data)
+        try:
+            cache[data_class] = compile_fn(data_class)
+        except Exception:
+            del cache[data_class]
+            raise
+    return cache[data_class]
+
+
+def get_encoder(data_class: Type) -> Encoder:
+    """Returns a cached encoder that converts `data_class` into a dictionary.
+
+    The encoder is compiled the first time a type is seen.
+    """
+    return _get_cached(_ENCODERS, data_class, _compile)
+
+
+def encode(value: Any) -> Any:
+    """Encodes a dataclass instance into a json compatible dictionary.
+
+    Anything that isn't a dataclass is returned unchanged.
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return get_encoder(type(value))(value)
+    return value
+
+
+def to_json_bytes(value: Any) -> bytes:
+    """Encodes a dataclass instance or dictionary as utf-8 json."""
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        value = get_encoder(type(value))(value)
+    return _JSON_ENCODER.encode(value).encode("utf-8")
+
+
+def to_record_batch(values: Iterable[Any]) -> Optional[pa.RecordBatch]:
+    """Encodes a list of dataclass instances of the same type as arrow columns.
+
+    Returns None if the values aren't all instances of the same dataclass, in
+    which case the caller should fall back to row based conversion.
+    """
+    values = list(values)
+    if not values:
+        return None
+    data_class = type(values[0])
+    if not dataclasses.is_dataclass(data_class):
+        return None
+    if any(type(value) is not data_class for value in values):
+        return None
+    encode_columns = _get_cached(_COLUMN_ENCODERS, data_class, _compile_columns)
+    columns = encode_columns(values)
+    names = [field.name for field in dataclasses.fields(data_class)]
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column) for column in columns], names=names
+    )
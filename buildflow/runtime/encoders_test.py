@@ -0,0 +1,101 @@
+import dataclasses
+import datetime
+import json
+from typing import Any, Dict, List, Optional
+import unittest
+
+from buildflow.runtime import encoders
+
+
+@dataclasses.dataclass
+class Inner:
+    value: int
+    created: datetime.date
+
+
+@dataclasses.dataclass
+class Outer:
+    name: str
+    timestamp: datetime.datetime
+    time_of_day: Optional[datetime.time]
+    inner: Inner
+    inners: List[Inner]
+    inner_map: Dict[str, Inner]
+    anything: Any = None
+
+
+@dataclasses.dataclass
+class Node:
+    value: int
+    children: List["Node"] = dataclasses.field(default_factory=list)
+
+
+class EncodersTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.date = datetime.date(2023, 1, 2)
+        self.timestamp = datetime.datetime(2023, 1, 2, 3, 4, 5)
+        self.time = datetime.time(3, 4, 5)
+
+    def outer(self, name: str = "a", anything: Any = None) -> Outer:
+        return Outer(
+            name=name,
+            timestamp=self.timestamp,
+            time_of_day=self.time,
+            inner=Inner(1, self.date),
+            inners=[Inner(2, self.date)],
+            inner_map={"x": Inner(3, self.date)},
+            anything=anything,
+        )
+
+    def expected(self, name: str = "a", anything: Any = None) -> Dict[str, Any]:
+        return {
+            "name": name,
+            "timestamp": "2023-01-02T03:04:05",
+            "time_of_day": "03:04:05",
+            "inner": {"value": 1, "created": "2023-01-02"},
+            "inners": [{"value": 2, "created": "2023-01-02"}],
+            "inner_map": {"x": {"value": 3, "created": "2023-01-02"}},
+            "anything": anything,
+        }
+
+    def test_encode(self):
+        self.assertEqual(self.expected(), encoders.encode(self.outer()))
+
+    def test_encode_optional_none(self):
+        outer = self.outer()
+        outer.time_of_day = None
+
+        self.assertIsNone(encoders.encode(outer)["time_of_day"])
+
+    def test_encode_untyped_field(self):
+        encoded = encoders.encode(self.outer(anything=[Inner(4, self.date)]))
+
+        self.assertEqual([{"value": 4, "created": "2023-01-02"}], encoded["anything"])
+
+    def test_encode_recursive_dataclass(self):
+        encoded = encoders.encode(Node(1, [Node(2)]))
+
+        self.assertEqual(
+            {"value": 1, "children": [{"value": 2, "children": []}]}, encoded
+        )
+
+    def test_encode_non_dataclass(self):
+        self.assertEqual({"a": 1}, encoders.encode({"a": 1}))
+
+    def test_to_json_bytes(self):
+        self.assertEqual(
+            self.expected(), json.loads(encoders.to_json_bytes(self.outer()))
+        )
+
+    def test_to_record_batch(self):
+        batch = encoders.to_record_batch([self.outer("a"), self.outer("b")])
+
+        self.assertEqual([self.expected("a"), self.expected("b")], batch.to_pylist())
+
+    def test_to_record_batch_mixed_types(self):
+        self.assertIsNone(encoders.to_record_batch([self.outer(), {"a": 1}]))
+        self.assertIsNone(encoders.to_record_batch([]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,11 +10,17 @@ When do we scale down?
     up, we check what the current utilization of our replicas is above 50%.
     The utilization is determined by the number of non-empty requests for data
     were made.
+
+The logic above is implemented by `UtilizationPolicy`, which is the default.
+Other policies can be plugged in through `AutoscalingOptions.policy`, see
+`AutoscalingPolicy`. The cluster and option limits are applied the same way
+for every policy.
 """
 
+import dataclasses
 import logging
 import math
-from typing import List
+from typing import List, Optional
 
 import ray
 from ray.autoscaler.sdk import request_resources
@@ -30,15 +36,49 @@ def max_replicas_for_cluster(cpu_per_replica: float):
     return int(num_cpus / cpu_per_replica)
 
 
-def get_recommended_num_replicas(
+@dataclasses.dataclass
+class ScalingMetrics:
+    """The metrics collected from the replicas at a single check in."""
+
+    current_num_replicas: int
+    backlog: float
+    events_processed_per_replica: List[int]
+    non_empty_ratio_per_replica: List[float]
+    time_since_last_check: float
+    # The number of records each replica has sent to its sink that haven't
+    # been written yet.
+    queue_depth_per_replica: List[int] = dataclasses.field(default_factory=list)
+    # A sample of the end to end latency of messages acked since the last
+    # check in, i.e. the seconds between publishing and acking a message. Only
+    # filled in for sources that know when messages were published.
+    message_ages: List[float] = dataclasses.field(default_factory=list)
+
+
+class AutoscalingPolicy:
+    """Decides how many replicas a streaming processor should run.
+
+    A policy is called once per check in. Policies may keep state across check
+    ins, each processor gets its own copy of the policy.
+    """
+
+    def desired_num_replicas(
+        self, metrics: ScalingMetrics, autoscaling_options: AutoscalingOptions
+    ) -> int:
+        """Returns the number of replicas the policy wants.
+
+        The result is clamped to the min / max replicas and the size of the
+        cluster afterwards, so policies don't need to handle that.
+        """
+        raise NotImplementedError("desired_num_replicas not implemented")
+
+
+def _estimate_num_replicas(
     *,
     current_num_replicas: int,
     backlog: float,
     events_processed_per_replica: List[int],
     non_empty_ratio_per_replica: List[float],
     time_since_last_check: float,
-    autoscaling_options: AutoscalingOptions,
-    cpus_per_replica: float,
 ) -> int:
     non_empty_ratio_sum = sum(non_empty_ratio_per_replica)
     if non_empty_ratio_per_replica:
@@ -54,6 +94,7 @@ def get_recommended_num_replicas(
     # actually burn down the backlog in one minute. Ideally we could add some
     # metric to know we need at least N replicas for the standard rate + M
     # replicas for the backlog.
+    # NOTE: TrendAwarePolicy takes the arrival rate into account.
     if avg_rate != 0:
         estimated_replicas = int(backlog / avg_rate)
     else:
@@ -62,19 +103,33 @@ def get_recommended_num_replicas(
         new_num_replicas = estimated_replicas
     elif (
         estimated_replicas < current_num_replicas
-        and current_num_replicas > 1
         and avg_non_empty_rate < _TARGET_UTILIZATION
     ):
         # Scale down under the following conditions.
         # - Backlog is low enough we don't need any more replicas
-        # - We are running more than 1 (don't scale to 0...)
         # - Over 30% of requests are empty, i.e. we're wasting requests
+        # This can return 0 replicas for an idle processor, which is only
+        # allowed if min_replicas is 0.
         new_num_replicas = math.ceil(non_empty_ratio_sum / _TARGET_UTILIZATION)
         if new_num_replicas < estimated_replicas:
             new_num_replicas = estimated_replicas
     else:
         new_num_replicas = current_num_replicas
+    return new_num_replicas
 
+
+def apply_limits(
+    *,
+    new_num_replicas: int,
+    current_num_replicas: int,
+    autoscaling_options: AutoscalingOptions,
+    cpus_per_replica: float,
+) -> int:
+    """Clamps the desired replicas to the options and the cluster size.
+
+    This also requests resources from the ray autoscaler when the cluster is
+    too small for the desired replicas.
+    """
     max_cluster_replicas = max_replicas_for_cluster(cpus_per_replica)
     max_replicas = autoscaling_options.max_replicas
 
@@ -119,3 +174,302 @@ def get_recommended_num_replicas(
         request_resources(num_cpus=math.ceil(new_num_replicas * cpus_per_replica))
 
     return new_num_replicas
+
+
+class UtilizationPolicy(AutoscalingPolicy):
+    """The default policy, see the module docstring."""
+
+    def desired_num_replicas(
+        self, metrics: ScalingMetrics, autoscaling_options: AutoscalingOptions
+    ) -> int:
+        return _estimate_num_replicas(
+            current_num_replicas=metrics.current_num_replicas,
+            backlog=metrics.backlog,
+            events_processed_per_replica=metrics.events_processed_per_replica,
+            non_empty_ratio_per_replica=metrics.non_empty_ratio_per_replica,
+            time_since_last_check=metrics.time_since_last_check,
+        )
+
+
+class TrendAwarePolicy(AutoscalingPolicy):
+    """Scales based on the smoothed arrival rate and backlog trend.
+
+    The arrival rate is estimated at every check in from the processed rate and
+    the change in backlog, and smoothed with Holt's linear method (level +
+    trend). The policy provisions enough replicas to keep up with the arrival
+    rate forecast `forecast_secs` ahead and burn down the current backlog within
+    `drain_secs`, adding at most `max_scale_up_factor` times the current
+    replicas for the backlog.
+
+    To avoid oscillating with bursty traffic the policy only scales down once
+    the desired replicas are below the current replicas by more than
+    `scale_down_hysteresis`, and waits for a cooldown after every resize.
+    """
+
+    def __init__(
+        self,
+        *,
+        level_smoothing: float = 0.5,
+        trend_smoothing: float = 0.3,
+        drain_secs: float = 60,
+        forecast_secs: float = 30,
+        target_utilization: float = 0.8,
+        scale_down_hysteresis: float = 0.2,
+        scale_up_cooldown_secs: float = 30,
+        scale_down_cooldown_secs: float = 300,
+        max_scale_up_factor: float = 2.0,
+    ) -> None:
+        self.level_smoothing = level_smoothing
+        self.trend_smoothing = trend_smoothing
+        self.drain_secs = drain_secs
+        self.forecast_secs = forecast_secs
+        self.target_utilization = target_utilization
+        self.scale_down_hysteresis = scale_down_hysteresis
+        self.scale_up_cooldown_secs = scale_up_cooldown_secs
+        self.scale_down_cooldown_secs = scale_down_cooldown_secs
+        self.max_scale_up_factor = max_scale_up_factor
+        self.arrival_rate_level: Optional[float] = None
+        self.arrival_rate_trend = 0.0
+        self.replica_capacity: Optional[float] = None
+        self._last_backlog: Optional[float] = None
+        self._secs_since_resize = math.inf
+
+    def _update_arrival_rate(self, arrival_rate: float, secs: float):
+        if self.arrival_rate_level is None:
+            self.arrival_rate_level = arrival_rate
+            return
+        previous_level = self.arrival_rate_level
+        self.arrival_rate_level = self.level_smoothing * arrival_rate + (
+            1 - self.level_smoothing
+        ) * (previous_level + self.arrival_rate_trend * secs)
+        # The trend is kept per second so it doesn't depend on how often the
+        # policy is called.
+        self.arrival_rate_trend = (
+            self.trend_smoothing * (self.arrival_rate_level - previous_level) / secs
+            + (1 - self.trend_smoothing) * self.arrival_rate_trend
+        )
+
+    def _update_replica_capacity(self, metrics: ScalingMetrics):
+        # The rate a single replica could process at if it never received
+        # empty responses. Replicas that did nothing tell us nothing.
+        capacities = [
+            events / metrics.time_since_last_check / non_empty_ratio
+            for events, non_empty_ratio in zip(
+                metrics.events_processed_per_replica,
+                metrics.non_empty_ratio_per_replica,
+            )
+            if events > 0 and non_empty_ratio > 0
+        ]
+        if not capacities:
+            return
+        capacity = sum(capacities) / len(capacities)
+        if self.replica_capacity is None:
+            self.replica_capacity = capacity
+        else:
+            self.replica_capacity = (
+                self.level_smoothing * capacity
+                + (1 - self.level_smoothing) * self.replica_capacity
+            )
+
+    def desired_num_replicas(
+        self, metrics: ScalingMetrics, autoscaling_options: AutoscalingOptions
+    ) -> int:
+        current = metrics.current_num_replicas
+        secs = metrics.time_since_last_check
+        self._secs_since_resize += secs
+        processed_rate = sum(metrics.events_processed_per_replica) / secs
+        backlog_growth = 0.0
+        if self._last_backlog is not None:
+            backlog_growth = (metrics.backlog - self._last_backlog) / secs
+        self._last_backlog = metrics.backlog
+        self._update_arrival_rate(max(processed_rate + backlog_growth, 0.0), secs)
+        self._update_replica_capacity(metrics)
+        if self.replica_capacity is None:
+            # We haven't seen a replica do any work yet so we can't estimate
+            # anything, fall back to the default policy.
+            return UtilizationPolicy().desired_num_replicas(
+                metrics, autoscaling_options
+            )
+
+        forecast_arrival_rate = max(
+            self.arrival_rate_level + self.arrival_rate_trend * self.forecast_secs, 0.0
+        )
+        replica_rate = self.replica_capacity * self.target_utilization
+        steady_state = math.ceil(forecast_arrival_rate / replica_rate)
+        desired = math.ceil(
+            (forecast_arrival_rate + metrics.backlog / self.drain_secs) / replica_rate
+        )
+        # Burning down a backlog that built up while the cluster was growing can
+        # ask for far more replicas than the traffic needs, so the extra
+        # replicas for the backlog are limited to a multiple of the current
+        # replicas.
+        desired = min(
+            desired, max(steady_state, math.ceil(current * self.max_scale_up_factor))
+        )
+
+        if desired > current:
+            if self._secs_since_resize < self.scale_up_cooldown_secs:
+                return current
+        elif desired < current:
+            if desired > current * (1 - self.scale_down_hysteresis):
+                return current
+            if self._secs_since_resize < self.scale_down_cooldown_secs:
+                return current
+        else:
+            return current
+        self._secs_since_resize = 0
+        return desired
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    """Returns the nearest rank percentile of `values`."""
+    ordered = sorted(values)
+    rank = math.ceil(percentile / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+class LatencySLOPolicy(AutoscalingPolicy):
+    """Scales to hold a percentile of the end to end latency under a target.
+
+    The latency of a message is its age when it's acked, i.e. the time since
+    it was published. The policy tracks the `percentile` latency and its trend
+    across check ins, and also estimates the wait of a message published right
+    now from the backlog and the rate we're processing it at. If either the
+    latency forecast `forecast_secs` ahead or that wait goes above
+    `scale_up_threshold` of `target_latency_secs` we scale up in proportion,
+    adding at most `max_scale_up_factor` times the current replicas. This
+    scales up before the target is missed instead of waiting for the backlog
+    to build up.
+
+    Replicas are only removed while the latency is below
+    `scale_down_threshold` of the target, down to the replicas needed to keep
+    up at `target_utilization`, and at most once every
+    `scale_down_cooldown_secs`.
+
+    Latency is only measured for sources that know when messages were
+    published (Pub/Sub and SQS), for other sources the policy falls back to the
+    default policy.
+    """
+
+    def __init__(
+        self,
+        *,
+        target_latency_secs: float,
+        percentile: float = 99,
+        scale_up_threshold: float = 0.8,
+        scale_down_threshold: float = 0.5,
+        forecast_secs: float = 30,
+        trend_smoothing: float = 0.5,
+        max_scale_up_factor: float = 2.0,
+        target_utilization: float = 0.8,
+        scale_down_cooldown_secs: float = 120,
+    ) -> None:
+        if target_latency_secs <= 0:
+            raise ValueError("target_latency_secs must be > 0")
+        if not 0 < percentile <= 100:
+            raise ValueError("percentile must be in (0, 100]")
+        self.target_latency_secs = target_latency_secs
+        self.percentile = percentile
+        self.scale_up_threshold = scale_up_threshold
+        self.scale_down_threshold = scale_down_threshold
+        self.forecast_secs = forecast_secs
+        self.trend_smoothing = trend_smoothing
+        self.max_scale_up_factor = max_scale_up_factor
+        self.target_utilization = target_utilization
+        self.scale_down_cooldown_secs = scale_down_cooldown_secs
+        self.latency: Optional[float] = None
+        # The change in latency per second.
+        self.latency_trend = 0.0
+        self._secs_since_scale_down = math.inf
+
+    def _update_latency(self, latency: float, secs: float):
+        if self.latency is not None:
+            self.latency_trend = (
+                self.trend_smoothing * (latency - self.latency) / secs
+                + (1 - self.trend_smoothing) * self.latency_trend
+            )
+        self.latency = latency
+
+    def desired_num_replicas(
+        self, metrics: ScalingMetrics, autoscaling_options: AutoscalingOptions
+    ) -> int:
+        current = metrics.current_num_replicas
+        secs = metrics.time_since_last_check
+        self._secs_since_scale_down += secs
+        if not metrics.message_ages:
+            # Nothing was acked, so we have no latency to go by.
+            return UtilizationPolicy().desired_num_replicas(
+                metrics, autoscaling_options
+            )
+        self._update_latency(_percentile(metrics.message_ages, self.percentile), secs)
+        forecast = self.latency + max(self.latency_trend, 0) * self.forecast_secs
+        processed_rate = sum(metrics.events_processed_per_replica) / secs
+        if processed_rate > 0:
+            backlog_wait = metrics.backlog / processed_rate
+        else:
+            backlog_wait = math.inf if metrics.backlog > 0 else 0
+        projected = max(forecast, backlog_wait)
+
+        scale_up_latency = self.scale_up_threshold * self.target_latency_secs
+        if projected > scale_up_latency:
+            max_desired = max(
+                math.ceil(current * self.max_scale_up_factor), current + 1
+            )
+            if math.isinf(projected):
+                return max_desired
+            # Queueing latency goes down about in proportion to the number of
+            # replicas working through the queue.
+            desired = math.ceil(current * projected / scale_up_latency)
+            return min(max(desired, current + 1), max_desired)
+
+        scale_down_latency = self.scale_down_threshold * self.target_latency_secs
+        if (
+            self.latency < scale_down_latency
+            and self._secs_since_scale_down >= self.scale_down_cooldown_secs
+        ):
+            needed = math.ceil(
+                sum(metrics.non_empty_ratio_per_replica) / self.target_utilization
+            )
+            if needed < current:
+                self._secs_since_scale_down = 0
+                return max(needed, 1)
+        return current
+
+
+def recommend_num_replicas(
+    policy: AutoscalingPolicy,
+    metrics: ScalingMetrics,
+    autoscaling_options: AutoscalingOptions,
+    cpus_per_replica: float,
+) -> int:
+    """Returns the number of replicas `policy` recommends within the limits."""
+    return apply_limits(
+        new_num_replicas=policy.desired_num_replicas(metrics, autoscaling_options),
+        current_num_replicas=metrics.current_num_replicas,
+        autoscaling_options=autoscaling_options,
+        cpus_per_replica=cpus_per_replica,
+    )
+
+
+def get_recommended_num_replicas(
+    *,
+    current_num_replicas: int,
+    backlog: float,
+    events_processed_per_replica: List[int],
+    non_empty_ratio_per_replica: List[float],
+    time_since_last_check: float,
+    autoscaling_options: AutoscalingOptions,
+    cpus_per_replica: float,
+) -> int:
+    return recommend_num_replicas(
+        UtilizationPolicy(),
+        ScalingMetrics(
+            current_num_replicas=current_num_replicas,
+            backlog=backlog,
+            events_processed_per_replica=events_processed_per_replica,
+            non_empty_ratio_per_replica=non_empty_ratio_per_replica,
+            time_since_last_check=time_since_last_check,
+        ),
+        autoscaling_options,
+        cpus_per_replica,
+    )
@@ -240,5 +240,190 @@ class AutoScalerTest(unittest.TestCase):
         request_resources_mock.assert_called_once_with(num_cpus=2)
 
 
+class TrendAwarePolicyTest(unittest.TestCase):
+    def metrics(self, num_replicas: int, backlog: float, events_per_replica: int):
+        return auto_scaler.ScalingMetrics(
+            current_num_replicas=num_replicas,
+            backlog=backlog,
+            events_processed_per_replica=[events_per_replica] * num_replicas,
+            non_empty_ratio_per_replica=[1] * num_replicas,
+            time_since_last_check=60,
+        )
+
+    def test_scales_for_arrival_rate_and_backlog(self):
+        policy = auto_scaler.TrendAwarePolicy(
+            target_utilization=1, max_scale_up_factor=10
+        )
+        autoscaling_options = options.AutoscalingOptions()
+
+        # Each replica processes 10 events / sec, and the backlog is growing
+        # by 20 events / sec, so traffic arrives at 40 events / sec.
+        policy.desired_num_replicas(self.metrics(2, 0, 600), autoscaling_options)
+        desired = policy.desired_num_replicas(
+            self.metrics(2, 1200, 600), autoscaling_options
+        )
+
+        self.assertGreater(policy.arrival_rate_trend, 0)
+        # Keeping up with the growing arrival rate and burning down the
+        # backlog in 60 seconds needs well over the 4 replicas required for
+        # the current arrival rate.
+        self.assertGreater(desired, 4)
+
+    def test_backlog_scale_up_is_limited(self):
+        policy = auto_scaler.TrendAwarePolicy(
+            target_utilization=1, max_scale_up_factor=2
+        )
+
+        # A large backlog with 2 replicas keeping up with traffic.
+        desired = policy.desired_num_replicas(
+            self.metrics(2, 60000, 200), options.AutoscalingOptions()
+        )
+
+        self.assertEqual(4, desired)
+
+    def test_hysteresis_prevents_small_scale_downs(self):
+        policy = auto_scaler.TrendAwarePolicy(
+            target_utilization=1, scale_down_cooldown_secs=0
+        )
+
+        # 10 replicas processing 9 events / sec each would only need 9.
+        desired = policy.desired_num_replicas(
+            self.metrics(10, 0, 540), options.AutoscalingOptions()
+        )
+
+        self.assertEqual(10, desired)
+
+    def test_cooldown_after_resize(self):
+        policy = auto_scaler.TrendAwarePolicy(
+            target_utilization=1, scale_down_cooldown_secs=300
+        )
+        autoscaling_options = options.AutoscalingOptions()
+
+        # Scale up once, then traffic drops to almost nothing.
+        scaled_up = policy.desired_num_replicas(
+            self.metrics(1, 6000, 600), autoscaling_options
+        )
+        self.assertGreater(scaled_up, 1)
+        desired = policy.desired_num_replicas(
+            self.metrics(scaled_up, 0, 6), autoscaling_options
+        )
+        self.assertEqual(scaled_up, desired)
+
+    def test_falls_back_without_throughput(self):
+        policy = auto_scaler.TrendAwarePolicy()
+
+        desired = policy.desired_num_replicas(
+            self.metrics(3, 0, 0), options.AutoscalingOptions()
+        )
+
+        self.assertEqual(3, desired)
+
+
+class LatencySLOPolicyTest(unittest.TestCase):
+    def metrics(
+        self,
+        num_replicas: int,
+        message_ages,
+        backlog: float = 0,
+        events_per_replica: int = 600,
+        non_empty_ratio: float = 1,
+    ):
+        return auto_scaler.ScalingMetrics(
+            current_num_replicas=num_replicas,
+            backlog=backlog,
+            events_processed_per_replica=[events_per_replica] * num_replicas,
+            non_empty_ratio_per_replica=[non_empty_ratio] * num_replicas,
+            time_since_last_check=60,
+            message_ages=message_ages,
+        )
+
+    def test_holds_when_latency_is_within_target(self):
+        policy = auto_scaler.LatencySLOPolicy(target_latency_secs=10)
+
+        desired = policy.desired_num_replicas(
+            self.metrics(4, [6] * 100), options.AutoscalingOptions()
+        )
+
+        self.assertEqual(4, desired)
+
+    def test_scales_up_before_target_is_missed(self):
+        policy = auto_scaler.LatencySLOPolicy(target_latency_secs=10, forecast_secs=60)
+        autoscaling_options = options.AutoscalingOptions()
+
+        # The p99 latency is still under the target but went up by 3 seconds
+        # in the last minute.
+        policy.desired_num_replicas(self.metrics(4, [4] * 100), autoscaling_options)
+        desired = policy.desired_num_replicas(
+            self.metrics(4, [7] * 100), autoscaling_options
+        )
+
+        self.assertGreater(policy.latency_trend, 0)
+        self.assertGreater(desired, 4)
+
+    def test_uses_percentile(self):
+        policy = auto_scaler.LatencySLOPolicy(target_latency_secs=10, percentile=99)
+
+        # Only the slowest 2% of messages miss the target.
+        desired = policy.desired_num_replicas(
+            self.metrics(4, [1] * 98 + [20] * 2), options.AutoscalingOptions()
+        )
+
+        self.assertEqual(8, desired)
+
+    def test_scales_up_for_backlog_wait(self):
+        policy = auto_scaler.LatencySLOPolicy(target_latency_secs=10)
+
+        # Replicas process 40 events / sec, so a message published now waits
+        # 20 seconds for the backlog to be processed.
+        desired = policy.desired_num_replicas(
+            self.metrics(4, [1] * 100, backlog=800), options.AutoscalingOptions()
+        )
+
+        self.assertEqual(8, desired)
+
+    def test_scales_down_when_latency_is_low(self):
+        policy = auto_scaler.LatencySLOPolicy(
+            target_latency_secs=10, target_utilization=0.8
+        )
+
+        desired = policy.desired_num_replicas(
+            self.metrics(10, [1] * 100, non_empty_ratio=0.2),
+            options.AutoscalingOptions(),
+        )
+
+        self.assertEqual(3, desired)
+
+    def test_scale_down_cooldown(self):
+        policy = auto_scaler.LatencySLOPolicy(
+            target_latency_secs=10, scale_down_cooldown_secs=300
+        )
+        autoscaling_options = options.AutoscalingOptions()
+
+        policy.desired_num_replicas(
+            self.metrics(10, [1] * 100, non_empty_ratio=0.2), autoscaling_options
+        )
+        desired = policy.desired_num_replicas(
+            self.metrics(3, [1] * 100, non_empty_ratio=0.1), autoscaling_options
+        )
+
+        self.assertEqual(3, desired)
+
+    def test_falls_back_without_latency(self):
+        policy = auto_scaler.LatencySLOPolicy(target_latency_secs=10)
+
+        desired = policy.desired_num_replicas(
+            self.metrics(2, [], backlog=60000, events_per_replica=60),
+            options.AutoscalingOptions(),
+        )
+
+        self.assertGreater(desired, 2)
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            auto_scaler.LatencySLOPolicy(target_latency_secs=0)
+        with self.assertRaises(ValueError):
+            auto_scaler.LatencySLOPolicy(target_latency_secs=1, percentile=0)
+
+
 if __name__ == "__name__":
     unittest.main()
@@ -0,0 +1,287 @@
+"""Offline simulator for comparing autoscaling policies.
+
+The simulator replays a trace of arrival rate and per-replica throughput
+against an `auto_scaler.AutoscalingPolicy` using a fake clock and a fake ray
+cluster, so policies and constants can be compared without running a real
+pipeline.
+
+Every tick of the fake clock messages arrive into the backlog and the active
+replicas process as much of it as they can. Every `check_in_secs` the policy is
+called with the same metrics the stream manager would collect, and its desired
+replicas go through the same `resource_arbiter` allocation as a real stream
+manager (as the only processor on the cluster). New replicas only start
+processing after `replica_startup_secs`, cluster resources requested by the
+arbiter only show up after `node_provision_secs`, and idle resources are only
+removed after `node_idle_secs`.
+
+Scaling to zero, warm pools, and stage pools are not simulated.
+
+Example:
+    trace = autoscaler_simulator.step_trace(
+        duration_secs=600, base_rate=100, peak_rate=1000, replica_throughput=50
+    )
+    result = autoscaler_simulator.simulate(
+        auto_scaler.TrendAwarePolicy(), trace
+    )
+"""
+
+import csv
+import dataclasses
+import math
+from typing import Iterable, List, Optional, Tuple
+
+from buildflow.api.options import AutoscalingOptions
+from buildflow.runtime.managers import auto_scaler, resource_arbiter
+
+_PROC_ID = "simulated"
+
+
+@dataclasses.dataclass
+class TracePoint:
+    # The number of messages per second arriving at the source.
+    arrival_rate: float
+    # The number of messages per second a single replica can process.
+    replica_throughput: float
+
+
+@dataclasses.dataclass
+class SimulationResult:
+    # The sum of the number of running replicas over time.
+    replica_seconds: float
+    # The largest backlog seen during the simulation.
+    peak_backlog: float
+    # Seconds between the peak backlog and the backlog being drained. None if
+    # the backlog was never drained after the peak.
+    time_to_drain: Optional[float]
+    # The number of times the number of replicas changed.
+    num_resize_events: int
+    final_backlog: float
+    # The number of replicas at every check in.
+    replicas_per_check_in: List[int]
+
+
+class FakeCluster:
+    """Stands in for `ray.cluster_resources` and `request_resources`.
+
+    Like the ray autoscaler, requested CPUs are a lower bound for the size of
+    the cluster. Nodes launched for a request show up after
+    `node_provision_secs` even if the request shrinks in the meantime, and CPUs
+    that are neither requested nor used are removed after `node_idle_secs`.
+    """
+
+    def __init__(
+        self,
+        num_cpus: float,
+        max_cpus: float,
+        node_provision_secs: float,
+        node_idle_secs: float = 300,
+    ) -> None:
+        self.num_cpus = num_cpus
+        self.max_cpus = max_cpus
+        self.node_provision_secs = node_provision_secs
+        self.node_idle_secs = node_idle_secs
+        self.now = 0.0
+        self._requested_cpus = num_cpus
+        # The time and number of CPUs of every launch that is provisioning.
+        self._launches: List[Tuple[float, float]] = []
+        self._idle_since: Optional[float] = None
+
+    def cluster_resources(self):
+        return {"CPU": self.num_cpus}
+
+    def request_resources(self, num_cpus: int):
+        self._requested_cpus = min(num_cpus, self.max_cpus)
+        provisioned = self.num_cpus + sum(cpus for _, cpus in self._launches)
+        if self._requested_cpus > provisioned:
+            self._launches.append((self.now, self._requested_cpus - provisioned))
+
+    def advance(self, now: float, used_cpus: float = 0):
+        self.now = now
+        for launched_at, cpus in list(self._launches):
+            if now - launched_at >= self.node_provision_secs:
+                self.num_cpus += cpus
+                self._launches.remove((launched_at, cpus))
+        needed_cpus = max(self._requested_cpus, used_cpus)
+        if self.num_cpus <= needed_cpus:
+            self._idle_since = None
+            return
+        if self._idle_since is None:
+            self._idle_since = now
+        if now - self._idle_since >= self.node_idle_secs:
+            self.num_cpus = needed_cpus
+            self._idle_since = None
+
+
+def constant_trace(
+    duration_secs: int, arrival_rate: float, replica_throughput: float
+) -> List[TracePoint]:
+    return [TracePoint(arrival_rate, replica_throughput)] * duration_secs
+
+
+def step_trace(
+    duration_secs: int,
+    base_rate: float,
+    peak_rate: float,
+    replica_throughput: float,
+    step_start_secs: Optional[int] = None,
+    step_end_secs: Optional[int] = None,
+) -> List[TracePoint]:
+    """Traffic that jumps from `base_rate` to `peak_rate` and back."""
+    if step_start_secs is None:
+        step_start_secs = duration_secs // 4
+    if step_end_secs is None:
+        step_end_secs = duration_secs // 2
+    return [
+        TracePoint(
+            peak_rate if step_start_secs <= i < step_end_secs else base_rate,
+            replica_throughput,
+        )
+        for i in range(duration_secs)
+    ]
+
+
+def bursty_trace(
+    duration_secs: int,
+    base_rate: float,
+    peak_rate: float,
+    replica_throughput: float,
+    period_secs: int = 120,
+) -> List[TracePoint]:
+    """Traffic that oscillates between `base_rate` and `peak_rate`."""
+    amplitude = (peak_rate - base_rate) / 2
+    return [
+        TracePoint(
+            base_rate + amplitude * (1 - math.cos(2 * math.pi * i / period_secs)),
+            replica_throughput,
+        )
+        for i in range(duration_secs)
+    ]
+
+
+def load_trace(path: str) -> List[TracePoint]:
+    """Loads a recorded trace from a csv file.
+
+    The file needs the columns `arrival_rate` and `replica_throughput`, with
+    one row per second.
+    """
+    with open(path, newline="") as f:
+        return [
+            TracePoint(float(row["arrival_rate"]), float(row["replica_throughput"]))
+            for row in csv.DictReader(f)
+        ]
+
+
+def simulate(
+    policy: auto_scaler.AutoscalingPolicy,
+    trace: Iterable[TracePoint],
+    *,
+    autoscaling_options: AutoscalingOptions = AutoscalingOptions(),
+    initial_replicas: Optional[int] = None,
+    initial_backlog: float = 0,
+    cpus_per_replica: float = 1,
+    cluster_cpus: float = 8,
+    max_cluster_cpus: float = 1000,
+    check_in_secs: int = 10,
+    replica_startup_secs: int = 10,
+    node_provision_secs: int = 60,
+    node_idle_secs: int = 300,
+    cluster: Optional[FakeCluster] = None,
+) -> SimulationResult:
+    """Runs `policy` against `trace`, one trace point per simulated second.
+
+    `cluster` provides the cluster resources, by default a `FakeCluster` of
+    `cluster_cpus` that can grow to `max_cluster_cpus`.
+    """
+    if cluster is None:
+        cluster = FakeCluster(
+            cluster_cpus, max_cluster_cpus, node_provision_secs, node_idle_secs
+        )
+    if initial_replicas is None:
+        initial_replicas = autoscaling_options.min_replicas
+    # The time each replica becomes active at.
+    replica_start_times = [0.0] * initial_replicas
+    backlog = initial_backlog
+    replica_seconds = 0.0
+    peak_backlog = backlog
+    peak_time = 0.0
+    drained_at = None
+    num_resize_events = 0
+    replicas_per_check_in = []
+    events_since_check_in = []
+    capacity_since_check_in = []
+    last_check_in = 0.0
+
+    for now, point in enumerate(trace):
+        cluster.advance(now, len(replica_start_times) * cpus_per_replica)
+        if len(events_since_check_in) != len(replica_start_times):
+            events_since_check_in = [0.0] * len(replica_start_times)
+            capacity_since_check_in = [0.0] * len(replica_start_times)
+        backlog += point.arrival_rate
+        for i, start_time in enumerate(replica_start_times):
+            if start_time > now:
+                continue
+            processed = min(backlog, point.replica_throughput)
+            backlog -= processed
+            events_since_check_in[i] += processed
+            capacity_since_check_in[i] += point.replica_throughput
+        replica_seconds += len(replica_start_times)
+        if backlog > peak_backlog:
+            peak_backlog = backlog
+            peak_time = now
+            drained_at = None
+        elif drained_at is None and backlog < 1 and peak_backlog > 0:
+            drained_at = now
+
+        if now - last_check_in < check_in_secs:
+            continue
+        current = len(replica_start_times)
+        # Replicas that get fewer messages than they could process see
+        # empty responses, which the policies use as utilization.
+        non_empty_ratios = [
+            events / capacity if capacity else 0
+            for events, capacity in zip(events_since_check_in, capacity_since_check_in)
+        ]
+        metrics = auto_scaler.ScalingMetrics(
+            current_num_replicas=current,
+            backlog=backlog,
+            events_processed_per_replica=[int(e) for e in events_since_check_in],
+            non_empty_ratio_per_replica=non_empty_ratios,
+            time_since_last_check=now - last_check_in,
+        )
+        demand = resource_arbiter.ResourceDemand(
+            proc_id=_PROC_ID,
+            desired_replicas=policy.desired_num_replicas(metrics, autoscaling_options),
+            min_replicas=autoscaling_options.min_replicas,
+            max_replicas=autoscaling_options.max_replicas,
+            cpus_per_replica=cpus_per_replica,
+            priority=autoscaling_options.priority,
+        )
+        cluster.request_resources(resource_arbiter.requested_cpus([demand]))
+        new_num_replicas = resource_arbiter.allocate(
+            [demand], cluster.cluster_resources()["CPU"]
+        )[_PROC_ID]
+        if new_num_replicas > current:
+            replica_start_times.extend(
+                [now + replica_startup_secs] * (new_num_replicas - current)
+            )
+        elif new_num_replicas < current:
+            # The newest replicas are removed first.
+            replica_start_times = replica_start_times[:new_num_replicas]
+        if new_num_replicas != current:
+            num_resize_events += 1
+        replicas_per_check_in.append(new_num_replicas)
+        events_since_check_in = [0.0] * len(replica_start_times)
+        capacity_since_check_in = [0.0] * len(replica_start_times)
+        last_check_in = now
+
+    time_to_drain = None
+    if drained_at is not None:
+        time_to_drain = drained_at - peak_time
+    return SimulationResult(
+        replica_seconds=replica_seconds,
+        peak_backlog=peak_backlog,
+        time_to_drain=time_to_drain,
+        num_resize_events=num_resize_events,
+        final_backlog=backlog,
+        replicas_per_check_in=replicas_per_check_in,
+    )
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+
+from buildflow.api import options
+from buildflow.runtime.managers import auto_scaler
+from buildflow.runtime.managers import autoscaler_simulator as sim
+
+
+class AutoscalerSimulatorTest(unittest.TestCase):
+    def test_constant_traffic_is_stable(self):
+        trace = sim.constant_trace(
+            duration_secs=600, arrival_rate=100, replica_throughput=50
+        )
+
+        result = sim.simulate(
+            auto_scaler.UtilizationPolicy(),
+            trace,
+            initial_replicas=2,
+            autoscaling_options=options.AutoscalingOptions(min_replicas=1),
+        )
+
+        self.assertEqual(0, result.num_resize_events)
+        self.assertEqual(600 * 2, result.replica_seconds)
+        self.assertLess(result.final_backlog, 1)
+
+    def test_step_traffic_scales_up_and_drains(self):
+        trace = sim.step_trace(
+            duration_secs=1200, base_rate=50, peak_rate=500, replica_throughput=50
+        )
+
+        result = sim.simulate(auto_scaler.TrendAwarePolicy(), trace)
+
+        self.assertGreater(max(result.replicas_per_check_in), 1)
+        self.assertGreater(result.num_resize_events, 0)
+        self.assertIsNotNone(result.time_to_drain)
+        self.assertLess(result.final_backlog, 1)
+
+    def test_cluster_limits_scale_up(self):
+        trace = sim.constant_trace(
+            duration_secs=120, arrival_rate=1000, replica_throughput=10
+        )
+
+        result = sim.simulate(
+            auto_scaler.UtilizationPolicy(),
+            trace,
+            initial_backlog=100_000,
+            cluster_cpus=4,
+            max_cluster_cpus=4,
+        )
+
+        self.assertEqual(4, max(result.replicas_per_check_in))
+
+    def test_uses_injected_cluster(self):
+        cluster = sim.FakeCluster(num_cpus=2, max_cpus=2, node_provision_secs=0)
+        trace = sim.constant_trace(
+            duration_secs=120, arrival_rate=1000, replica_throughput=10
+        )
+
+        result = sim.simulate(
+            auto_scaler.UtilizationPolicy(),
+            trace,
+            initial_backlog=100_000,
+            cluster=cluster,
+        )
+
+        self.assertEqual(2, max(result.replicas_per_check_in))
+
+    def test_load_trace(self):
+        path = os.path.join(tempfile.mkdtemp(), "trace.csv")
+        with open(path, "w") as f:
+            f.write("arrival_rate,replica_throughput\n10,5\n20,5\n")
+
+        self.assertEqual(
+            [sim.TracePoint(10, 5), sim.TracePoint(20, 5)], sim.load_trace(path)
+        )
+
+
+class FakeClusterTest(unittest.TestCase):
+    def test_launched_nodes_provision_after_request_shrinks(self):
+        cluster = sim.FakeCluster(num_cpus=2, max_cpus=10, node_provision_secs=60)
+
+        cluster.request_resources(num_cpus=6)
+        cluster.advance(30, used_cpus=2)
+        cluster.request_resources(num_cpus=2)
+        cluster.advance(60, used_cpus=2)
+
+        self.assertEqual({"CPU": 6}, cluster.cluster_resources())
+
+    def test_idle_cpus_are_removed_after_timeout(self):
+        cluster = sim.FakeCluster(
+            num_cpus=8, max_cpus=10, node_provision_secs=60, node_idle_secs=100
+        )
+        cluster.request_resources(num_cpus=2)
+
+        cluster.advance(1, used_cpus=4)
+        self.assertEqual({"CPU": 8}, cluster.cluster_resources())
+        cluster.advance(101, used_cpus=4)
+        self.assertEqual({"CPU": 4}, cluster.cluster_resources())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,7 +17,7 @@ class BatchProcessManager:
             key = "local"
         processor_actor = processors.ProcessActor.options(
             num_cpus=self.processor_ref.processor_instance.num_cpus()
-        ).remote(self.processor_ref.get_processor_replica())
+        ).remote(self.processor_ref.get_processor_replica(), self.proc_input_type)
         sink_actor = self.processor_ref.sink.actor(
             processor_actor, self.processor_ref.source.is_streaming()
         )
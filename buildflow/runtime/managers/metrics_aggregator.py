@@ -0,0 +1,95 @@
+"""Aggregates the metrics pushed by the replicas of a processor.
+
+Replicas push their metric deltas to the aggregator on their own cadence (see
+`StreamingRaySource.configure_metrics_reporting`), so the stream manager can
+read the metrics of every replica with a single call instead of fanning out a
+request to every replica and waiting on the slowest one.
+"""
+
+import dataclasses
+import random
+import time
+from typing import Dict, List, Optional, Sequence
+
+import ray
+
+# The max number of message ages kept per replica between collects.
+_MAX_MESSAGE_AGE_SAMPLES = 10_000
+
+
+@dataclasses.dataclass
+class ReplicaMetrics:
+    num_events: int = 0
+    requests: int = 0
+    empty_responses: int = 0
+    # The last reported number of records sent to the sinks that have not been
+    # written yet. Unlike the other metrics this is not a delta.
+    queue_depth: int = 0
+    # A sample of the seconds between publishing and acking messages.
+    message_ages: List[float] = dataclasses.field(default_factory=list)
+    # The time of the last report.
+    last_report_time: float = 0
+
+    @property
+    def non_empty_response_ratio(self) -> float:
+        if not self.requests:
+            return 0
+        return 1 - self.empty_responses / self.requests
+
+
+@ray.remote(num_cpus=0)
+class MetricsAggregatorActor:
+    def __init__(self) -> None:
+        self._replicas: Dict[str, ReplicaMetrics] = {}
+
+    def report(
+        self,
+        replica_id: str,
+        num_events: int,
+        requests: int,
+        empty_responses: int,
+        queue_depth: int,
+        message_ages: Sequence[float] = (),
+    ):
+        """Adds the metrics of a replica since its last report."""
+        metrics = self._replicas.get(replica_id)
+        if metrics is None:
+            metrics = ReplicaMetrics()
+            self._replicas[replica_id] = metrics
+        metrics.num_events += num_events
+        metrics.requests += requests
+        metrics.empty_responses += empty_responses
+        metrics.queue_depth = queue_depth
+        metrics.message_ages.extend(message_ages)
+        if len(metrics.message_ages) > _MAX_MESSAGE_AGE_SAMPLES:
+            metrics.message_ages = random.sample(
+                metrics.message_ages, _MAX_MESSAGE_AGE_SAMPLES
+            )
+        metrics.last_report_time = time.time()
+
+    def remove_replica(self, replica_id: str):
+        self._replicas.pop(replica_id, None)
+
+    def collect(
+        self, max_staleness_secs: Optional[float] = None
+    ) -> Dict[str, ReplicaMetrics]:
+        """Returns the metrics of every replica since the last collect.
+
+        Replicas that haven't reported yet (e.g. because they're pending
+        creation) are not included. If `max_staleness_secs` is set, replicas
+        that haven't reported within that many seconds are also left out.
+        """
+        now = time.time()
+        collected = {}
+        for replica_id, metrics in self._replicas.items():
+            if (
+                max_staleness_secs is not None
+                and now - metrics.last_report_time > max_staleness_secs
+            ):
+                continue
+            collected[replica_id] = metrics
+            self._replicas[replica_id] = ReplicaMetrics(
+                queue_depth=metrics.queue_depth,
+                last_report_time=metrics.last_report_time,
+            )
+        return collected
@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+
+from buildflow.runtime.managers import metrics_aggregator
+
+
+class MetricsAggregatorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.aggregator = (
+            metrics_aggregator.MetricsAggregatorActor.__ray_actor_class__()
+        )
+
+    def test_collect_sums_reports(self):
+        self.aggregator.report("a", 10, 4, 1, 5)
+        self.aggregator.report("a", 20, 4, 3, 2)
+        self.aggregator.report("b", 0, 2, 2, 0)
+
+        metrics = self.aggregator.collect()
+
+        self.assertEqual({"a", "b"}, set(metrics))
+        self.assertEqual(30, metrics["a"].num_events)
+        self.assertEqual(0.5, metrics["a"].non_empty_response_ratio)
+        # Queue depth is the last reported value not a sum.
+        self.assertEqual(2, metrics["a"].queue_depth)
+        self.assertEqual(0, metrics["b"].non_empty_response_ratio)
+
+    def test_collect_resets_deltas(self):
+        self.aggregator.report("a", 10, 4, 1, 5)
+        self.aggregator.collect()
+
+        metrics = self.aggregator.collect()
+
+        self.assertEqual(0, metrics["a"].num_events)
+        self.assertEqual(0, metrics["a"].requests)
+        self.assertEqual(5, metrics["a"].queue_depth)
+
+    def test_collect_returns_message_ages(self):
+        self.aggregator.report("a", 2, 1, 0, 0, [1.0, 2.0])
+        self.aggregator.report("a", 1, 1, 0, 0, [3.0])
+
+        self.assertEqual([1.0, 2.0, 3.0], self.aggregator.collect()["a"].message_ages)
+        self.assertEqual([], self.aggregator.collect()["a"].message_ages)
+
+    def test_remove_replica(self):
+        self.aggregator.report("a", 10, 4, 1, 5)
+        self.aggregator.remove_replica("a")
+
+        self.assertEqual({}, self.aggregator.collect())
+
+    def test_collect_skips_stale_replicas(self):
+        with mock.patch("time.time", return_value=100):
+            self.aggregator.report("a", 10, 4, 1, 5)
+        with mock.patch("time.time", return_value=130):
+            self.aggregator.report("b", 10, 4, 1, 5)
+            metrics = self.aggregator.collect(max_staleness_secs=20)
+
+        self.assertEqual({"b"}, set(metrics))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""Places the actors of a replica on the same node.
+
+Each replica reserves a placement group with one bundle per actor. The
+placement group uses the STRICT_PACK strategy so the source, processor, and
+sink of a replica share a node and its object store, and batches don't cross
+the network between them. If no single node has room for a replica but the
+cluster as a whole does (i.e. the cluster is fragmented), we fall back to PACK
+which keeps as many of the actors together as possible.
+
+To keep a single node from becoming the bottleneck, every new replica targets
+the node that runs the fewest replicas of the processor. The CPUs available on
+each node are estimated from the CPUs reserved by placement groups, which is
+where buildflow runs all of its replicas. Targeting a node needs a version of
+ray that supports soft targeting placement groups, without it replicas are
+placed wherever ray has room.
+
+Sources and sinks create their actors themselves, so they are created by a
+`ReplicaLauncherActor` running inside of the placement group that captures its
+child tasks. Note that this means tasks started by those actors are also
+scheduled in the placement group unless they set a scheduling strategy.
+"""
+
+import inspect
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import ray
+from ray.util.scheduling_strategies import PlacementGroupSchedulingStrategy
+
+STRICT_PACK = "STRICT_PACK"
+PACK = "PACK"
+
+_SUPPORTS_TARGET_NODE = (
+    "_soft_target_node_id" in inspect.signature(ray.util.placement_group).parameters
+)
+_warned_target_node = False
+
+
+def _available_cpus_per_node() -> Dict[str, float]:
+    try:
+        nodes = ray.nodes()
+        placement_groups = ray.util.placement_group_table()
+    except Exception:
+        logging.debug("failed to get the available resources per node.")
+        return {}
+    available = {
+        node["NodeID"]: node["Resources"].get("CPU", 0)
+        for node in nodes
+        if node.get("Alive")
+    }
+    for info in placement_groups.values():
+        if info["state"] == "REMOVED":
+            continue
+        for index, node_id in info["bundles_to_node_id"].items():
+            if node_id in available:
+                available[node_id] -= info["bundles"][index].get("CPU", 0)
+    return available
+
+
+def choose_strategy(
+    replica_cpus: float,
+    available_cpus_per_node: Dict[str, float],
+    replicas_per_node: Dict[str, int],
+) -> Tuple[str, Optional[str]]:
+    """Returns the placement strategy and target node for a new replica."""
+    fits = [
+        node_id
+        for node_id, cpus in available_cpus_per_node.items()
+        if cpus >= replica_cpus
+    ]
+    if fits:
+        target = min(
+            fits,
+            key=lambda node_id: (
+                replicas_per_node.get(node_id, 0),
+                -available_cpus_per_node[node_id],
+            ),
+        )
+        return STRICT_PACK, target
+    if sum(available_cpus_per_node.values()) >= replica_cpus:
+        # The cluster has room for the replica, just not on a single node.
+        return PACK, None
+    # Nothing fits right now. The replica stays pending until the cluster
+    # grows, and a new node can fit the entire replica.
+    return STRICT_PACK, None
+
+
+class ReplicaPlacement:
+    def __init__(self, placement_group: Any, node_id: Optional[str]) -> None:
+        self.placement_group = placement_group
+        # The node the replica was targeted at, if any.
+        self.node_id = node_id
+
+    def scheduling_strategy(
+        self, capture_child_tasks: bool = False
+    ) -> PlacementGroupSchedulingStrategy:
+        return PlacementGroupSchedulingStrategy(
+            placement_group=self.placement_group,
+            placement_group_capture_child_tasks=capture_child_tasks,
+        )
+
+    def remove(self):
+        try:
+            ray.util.remove_placement_group(self.placement_group)
+        except Exception:
+            logging.exception("failed to remove placement group.")
+
+
+def reserve(
+    actor_cpus: List[float], replicas_per_node: Dict[str, int]
+) -> Optional[ReplicaPlacement]:
+    """Reserves a placement group for a replica with actors of `actor_cpus`.
+
+    Returns None if the actors don't need any CPUs, in which case there is
+    nothing to reserve.
+    """
+    bundles = [{"CPU": cpus} for cpus in actor_cpus if cpus > 0]
+    if not bundles:
+        return None
+    strategy, node_id = choose_strategy(
+        sum(actor_cpus), _available_cpus_per_node(), replicas_per_node
+    )
+    if strategy == PACK:
+        logging.warning(
+            "no single node has room for a replica, its actors will be spread "
+            "across nodes."
+        )
+    if node_id is not None:
+        if _SUPPORTS_TARGET_NODE:
+            placement_group = ray.util.placement_group(
+                bundles, strategy=strategy, _soft_target_node_id=node_id
+            )
+            return ReplicaPlacement(placement_group, node_id)
+        global _warned_target_node
+        if not _warned_target_node:
+            logging.warning(
+                "ray %s can't target placement groups at a node, so replicas "
+                "may not be spread evenly across nodes.",
+                ray.__version__,
+            )
+            _warned_target_node = True
+    return ReplicaPlacement(ray.util.placement_group(bundles, strategy=strategy), None)
+
+
+@ray.remote(num_cpus=0)
+class ReplicaLauncherActor:
+    """Creates the actors of a replica inside of its placement group.
+
+    The actors are owned by the launcher, so they are killed with it.
+    """
+
+    def launch(self, create_fn: Callable, *args) -> Any:
+        return create_fn(*args)
@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+
+from buildflow.runtime.managers import placement
+
+
+class ChooseStrategyTest(unittest.TestCase):
+    def test_targets_node_with_fewest_replicas(self):
+        strategy, node_id = placement.choose_strategy(
+            2, {"a": 8, "b": 4, "c": 4}, {"a": 2, "b": 1}
+        )
+
+        self.assertEqual(placement.STRICT_PACK, strategy)
+        self.assertEqual("c", node_id)
+
+    def test_ties_go_to_node_with_most_cpus(self):
+        strategy, node_id = placement.choose_strategy(2, {"a": 3, "b": 6}, {})
+
+        self.assertEqual(placement.STRICT_PACK, strategy)
+        self.assertEqual("b", node_id)
+
+    def test_skips_nodes_without_room(self):
+        strategy, node_id = placement.choose_strategy(2, {"a": 1, "b": 2}, {"b": 5})
+
+        self.assertEqual(placement.STRICT_PACK, strategy)
+        self.assertEqual("b", node_id)
+
+    def test_fragmented_cluster_packs(self):
+        strategy, node_id = placement.choose_strategy(3, {"a": 2, "b": 2}, {})
+
+        self.assertEqual(placement.PACK, strategy)
+        self.assertIsNone(node_id)
+
+    def test_full_cluster_waits_for_a_node(self):
+        strategy, node_id = placement.choose_strategy(3, {"a": 1, "b": 1}, {})
+
+        self.assertEqual(placement.STRICT_PACK, strategy)
+        self.assertIsNone(node_id)
+
+
+class AvailableCpusPerNodeTest(unittest.TestCase):
+    @mock.patch("ray.util.placement_group_table")
+    @mock.patch("ray.nodes")
+    def test_subtracts_placement_groups(self, nodes_mock, table_mock):
+        nodes_mock.return_value = [
+            {"NodeID": "a", "Alive": True, "Resources": {"CPU": 8}},
+            {"NodeID": "b", "Alive": True, "Resources": {"CPU": 4}},
+            {"NodeID": "c", "Alive": False, "Resources": {"CPU": 4}},
+        ]
+        table_mock.return_value = {
+            "pg1": {
+                "state": "CREATED",
+                "bundles": {0: {"CPU": 1}, 1: {"CPU": 2}},
+                "bundles_to_node_id": {0: "a", 1: "b"},
+            },
+            "pg2": {
+                "state": "REMOVED",
+                "bundles": {0: {"CPU": 4}},
+                "bundles_to_node_id": {0: "a"},
+            },
+        }
+
+        self.assertEqual({"a": 7, "b": 2}, placement._available_cpus_per_node())
+
+
+class ReserveTest(unittest.TestCase):
+    @mock.patch.object(placement, "_available_cpus_per_node", return_value={"a": 4})
+    @mock.patch("ray.util.placement_group")
+    def test_targets_node(self, placement_group_mock, _):
+        with mock.patch.object(placement, "_SUPPORTS_TARGET_NODE", True):
+            replica_placement = placement.reserve([1, 1], {})
+
+        self.assertEqual("a", replica_placement.node_id)
+        placement_group_mock.assert_called_once_with(
+            [{"CPU": 1}, {"CPU": 1}],
+            strategy=placement.STRICT_PACK,
+            _soft_target_node_id="a",
+        )
+
+    @mock.patch.object(placement, "_available_cpus_per_node", return_value={"a": 4})
+    @mock.patch("ray.util.placement_group")
+    def test_without_target_node_support(self, placement_group_mock, _):
+        with mock.patch.object(placement, "_SUPPORTS_TARGET_NODE", False):
+            replica_placement = placement.reserve([1, 1], {})
+
+        self.assertIsNone(replica_placement.node_id)
+        placement_group_mock.assert_called_once_with(
+            [{"CPU": 1}, {"CPU": 1}], strategy=placement.STRICT_PACK
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
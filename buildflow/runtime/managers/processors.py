@@ -1,12 +1,22 @@
 import copy
 import dataclasses
 import time
-from typing import Iterable
+import typing
+from typing import Any, Iterable, Optional, Type
 
+import pandas as pd
+import pyarrow as pa
 import ray
 from ray.util.metrics import Gauge
 
 from buildflow.api import SinkType, SourceType, ProcessorAPI
+from buildflow.runtime import encoders
+from buildflow.runtime.ray_io import base
+
+# The batch formats that can be passed to a vectorized processor.
+_PANDAS_FORMAT = "pandas"
+_ARROW_FORMAT = "pyarrow"
+_LIST_FORMAT = "list"
 
 
 @dataclasses.dataclass
@@ -19,11 +29,121 @@ class ProcessorRef:
         return copy.deepcopy(self.processor_instance)
 
 
+def _batch_annotation(processor_instance: ProcessorAPI) -> Any:
+    arg_spec = processor_instance.processor_arg_spec()
+    args = [arg for arg in arg_spec.args if arg != "self"]
+    if not args:
+        return None
+    return arg_spec.annotations.get(args[0], None)
+
+
+def _batch_format(annotation: Any) -> str:
+    if annotation is pd.DataFrame:
+        return _PANDAS_FORMAT
+    if annotation in (pa.Table, pa.RecordBatch):
+        return _ARROW_FORMAT
+    return _LIST_FORMAT
+
+
+def _to_rows(batch: Any) -> list:
+    return [encoders.encode(elem) for elem in batch]
+
+
+def _to_output_batch(output: Any) -> Any:
+    """Normalizes the return value of a vectorized processor.
+
+    Columnar outputs are converted to a single RecordBatch so they can be
+    shipped to the sink without being converted back to rows.
+    """
+    if output is None:
+        return []
+    if isinstance(output, pd.DataFrame):
+        return pa.RecordBatch.from_pandas(output, preserve_index=False)
+    if isinstance(output, pa.Table):
+        batches = output.combine_chunks().to_batches()
+        if not batches:
+            return pa.RecordBatch.from_pylist([], schema=output.schema)
+        return batches[0]
+    if isinstance(output, pa.RecordBatch):
+        return output
+    return base.flatten_results(output)
+
+
+def _process_vectorized(
+    processor_instance: ProcessorAPI,
+    batch_format: str,
+    input_type: Optional[Type],
+    calls: Any,
+) -> Any:
+    if batch_format == _PANDAS_FORMAT:
+        if isinstance(calls, pa.RecordBatch):
+            batch = calls.to_pandas()
+        else:
+            batch = pd.DataFrame.from_records(_to_rows(calls))
+    elif batch_format == _ARROW_FORMAT:
+        if isinstance(calls, pa.RecordBatch):
+            batch = pa.Table.from_batches([calls])
+        else:
+            batch = pa.Table.from_pylist(_to_rows(calls))
+    else:
+        batch = base.decode_elements(base.to_rows(calls), input_type)
+    output = _to_output_batch(processor_instance._process_batch(batch))
+    if isinstance(calls, pa.RecordBatch):
+        # Keep the batch columnar on the way back to the sink.
+        return base.to_record_batch(output)
+    return output
+
+
+def _to_pandas_output(output: Any) -> pd.DataFrame:
+    """Converts the output of a vectorized processor into a DataFrame."""
+    batch = base.to_record_batch(output)
+    if isinstance(batch, pa.RecordBatch):
+        return batch.to_pandas()
+    if not batch:
+        return pd.DataFrame()
+    if all(isinstance(elem, dict) for elem in batch):
+        return pd.DataFrame.from_records(batch)
+    # Ray datasets store elements that aren't rows in the "item" column.
+    return pd.DataFrame({"item": batch})
+
+
+def _process_dataset(
+    processor_instance: ProcessorAPI,
+    batch_format: str,
+    input_type: Optional[Type],
+    dataset: ray.data.Dataset,
+) -> ray.data.Dataset:
+    def process_pandas(df: pd.DataFrame) -> pd.DataFrame:
+        output = _process_vectorized(
+            processor_instance,
+            batch_format,
+            input_type,
+            pa.RecordBatch.from_pandas(df, preserve_index=False),
+        )
+        return _to_pandas_output(output)
+
+    return dataset.map_batches(process_pandas, batch_format=_PANDAS_FORMAT)
+
+
 # TODO(#113): make this configurable by the user
 @ray.remote
 class ProcessActor(object):
-    def __init__(self, processor_instance: ProcessorAPI):
+    def __init__(
+        self,
+        processor_instance: ProcessorAPI,
+        processor_input_type: Optional[Type] = None,
+    ):
         self._processor = processor_instance
+        self._input_type = processor_input_type
+        self._vectorized = self._processor.is_vectorized()
+        if self._vectorized:
+            annotation = _batch_annotation(self._processor)
+            self._batch_format = _batch_format(annotation)
+            # Support annotations like List[MyDataclass] for list batches.
+            self._input_type = None
+            type_args = typing.get_args(annotation)
+            if type_args and dataclasses.is_dataclass(type_args[0]):
+                self._input_type = type_args[0]
         print(f"Running processor setup: {self._processor.__class__}")
         # NOTE: This is where the setup lifecycle method is called.
         self._processor.setup()
@@ -42,8 +162,80 @@ class ProcessActor(object):
 
     async def process_batch(self, calls: Iterable):
         start_time = time.time()
+        if self._vectorized:
+            if len(calls) == 1 and isinstance(calls[0], ray.data.Dataset):
+                # Batch sources send the entire dataset as a single element.
+                return [
+                    _process_dataset(
+                        self._processor,
+                        self._batch_format,
+                        self._input_type,
+                        calls[0],
+                    )
+                ]
+            to_ret = _process_vectorized(
+                self._processor, self._batch_format, self._input_type, calls
+            )
+            if len(calls):
+                self.process_time_gauge.set(
+                    (time.time() - start_time) * 1000 / len(calls)
+                )
+            return to_ret
+        columnar = isinstance(calls, pa.RecordBatch)
+        if columnar:
+            calls = base.decode_elements(calls.to_pylist(), self._input_type)
         to_ret = []
         for call in calls:
             to_ret.append(self.process(call))
-        self.process_time_gauge.set((time.time() - start_time) * 1000 / len(to_ret))
+        if to_ret:
+            self.process_time_gauge.set((time.time() - start_time) * 1000 / len(to_ret))
+        if columnar:
+            # Keep the batch columnar on the way back to the sink.
+            return base.results_to_record_batch(to_ret)
         return to_ret
+
+
+@ray.remote
+class FusedReplicaActor(object):
+    """Runs the source, processor, and sink of a replica in one actor.
+
+    Batches are passed between the stages in process, so there is no actor
+    round trip or serialization per batch.
+    """
+
+    def __init__(
+        self,
+        processor_ref: ProcessorRef,
+        sink_key: str,
+        processor_input_type: Optional[Type],
+    ) -> None:
+        process_actor = base.local_actor(
+            ProcessActor, processor_ref.processor_instance, processor_input_type
+        )
+        self._sink = processor_ref.sink.local_actor(
+            process_actor, processor_ref.source.is_streaming()
+        )
+        self._source = processor_ref.source.local_actor(
+            {sink_key: self._sink}, processor_input_type
+        )
+
+    async def run(self):
+        return await self._source.run.remote()
+
+    async def configure_flow_control(self, *args):
+        return await self._source.configure_flow_control.remote(*args)
+
+    async def configure_concurrency(self, *args):
+        return await self._source.configure_concurrency.remote(*args)
+
+    async def configure_batching(self, *args):
+        return await self._sink.configure_batching.remote(*args)
+
+    async def configure_metrics_reporting(self, *args):
+        return await self._source.configure_metrics_reporting.remote(*args)
+
+    async def metrics(self):
+        return await self._source.metrics.remote()
+
+    async def shutdown(self):
+        return await self._source.shutdown.remote()
@@ -0,0 +1,66 @@
+import dataclasses
+import unittest
+
+import pandas as pd
+import pyarrow as pa
+
+import buildflow
+from buildflow.api.io import Source
+from buildflow.runtime.managers import processors
+
+
+@dataclasses.dataclass
+class _Output:
+    field: int
+
+
+class _Source(Source):
+    def preprocess(self, element):
+        return {"field": element["field"] * 2}
+
+
+class _Processor(buildflow.Processor):
+    @classmethod
+    def source(cls):
+        return _Source()
+
+    def process_batch(self, batch: pd.DataFrame):
+        return batch
+
+
+class ToPandasOutputTest(unittest.TestCase):
+    def test_rows(self):
+        df = processors._to_pandas_output([{"field": 1}, {"field": 2}])
+
+        self.assertEqual([{"field": 1}, {"field": 2}], df.to_dict("records"))
+
+    def test_scalars(self):
+        df = processors._to_pandas_output([1, 2])
+
+        self.assertEqual([{"item": 1}, {"item": 2}], df.to_dict("records"))
+
+    def test_dataclasses(self):
+        output = processors._to_output_batch([_Output(1), _Output(2)])
+
+        df = processors._to_pandas_output(output)
+
+        self.assertEqual([{"field": 1}, {"field": 2}], df.to_dict("records"))
+
+    def test_empty(self):
+        self.assertTrue(processors._to_pandas_output([]).empty)
+
+
+class PreprocessColumnarTest(unittest.TestCase):
+    def test_preprocess_applies_to_columnar_batches(self):
+        output = processors._process_vectorized(
+            _Processor(),
+            processors._PANDAS_FORMAT,
+            None,
+            pa.RecordBatch.from_pylist([{"field": 1}, {"field": 2}]),
+        )
+
+        self.assertEqual([{"field": 2}, {"field": 4}], output.to_pylist())
+
+
+if __name__ == "__main__":
+    unittest.main()
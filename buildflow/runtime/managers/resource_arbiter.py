@@ -0,0 +1,155 @@
+"""Arbitrates cluster resources between all streaming processors.
+
+`ray.autoscaler.sdk.request_resources` replaces the cluster wide request
+instead of adding to it, so when several stream managers share a cluster (e.g.
+in a `DeploymentGrid`) they would overwrite each other's requests. Instead
+every stream manager sends the number of replicas it wants to a single
+`ResourceArbiterActor`, which:
+    1. issues one combined resource request for the whole cluster
+    2. splits the CPUs that are currently available into replica budgets
+
+Budgets are handed out in order of `AutoscalingOptions.priority`. Every
+processor first gets its min_replicas, then the remaining CPUs go to the
+processors with the highest priority. Processors with the same priority get
+replicas one at a time so they share what's left evenly. Processors that
+don't use any CPUs per replica always get all the replicas they want.
+
+The arbiter is detached so it outlives the manager that created it, and the
+last manager to remove its demand kills it.
+"""
+
+import dataclasses
+import itertools
+import logging
+import math
+import time
+from typing import Dict, List
+
+import ray
+from ray.autoscaler.sdk import request_resources
+
+_ARBITER_NAME = "buildflow_resource_arbiter"
+_ARBITER_NAMESPACE = "buildflow"
+# Demands of managers that haven't checked in for this long are dropped, e.g.
+# because the manager died.
+_DEMAND_TTL_SECS = 600
+
+
+@dataclasses.dataclass
+class ResourceDemand:
+    proc_id: str
+    # The number of replicas the processor's autoscaling policy wants.
+    desired_replicas: int
+    min_replicas: int
+    max_replicas: int
+    cpus_per_replica: float
+    priority: int = 0
+    # CPUs the processor uses outside of its replicas, e.g. its stage pools.
+    fixed_cpus: float = 0
+
+    @property
+    def target_replicas(self) -> int:
+        return max(min(self.desired_replicas, self.max_replicas), self.min_replicas)
+
+
+def allocate(demands: List[ResourceDemand], cluster_cpus: float) -> Dict[str, int]:
+    """Splits `cluster_cpus` into replica budgets for every demand."""
+    budgets = {demand.proc_id: 0 for demand in demands}
+    available = cluster_cpus - sum(demand.fixed_cpus for demand in demands)
+    by_priority = []
+    for demand in sorted(demands, key=lambda demand: -demand.priority):
+        if demand.cpus_per_replica <= 0:
+            # Replicas that don't use any CPUs aren't constrained by the cluster.
+            budgets[demand.proc_id] = demand.target_replicas
+        else:
+            by_priority.append(demand)
+    for demand in by_priority:
+        fits = max(int(available // demand.cpus_per_replica), 0)
+        budgets[demand.proc_id] = min(demand.min_replicas, fits)
+        available -= budgets[demand.proc_id] * demand.cpus_per_replica
+    for _, group in itertools.groupby(by_priority, key=lambda d: d.priority):
+        group = list(group)
+        added = True
+        while added:
+            added = False
+            for demand in group:
+                if (
+                    budgets[demand.proc_id] < demand.target_replicas
+                    and available >= demand.cpus_per_replica
+                ):
+                    budgets[demand.proc_id] += 1
+                    available -= demand.cpus_per_replica
+                    added = True
+    return budgets
+
+
+def requested_cpus(demands: List[ResourceDemand]) -> int:
+    """Returns the number of CPUs needed to satisfy every demand."""
+    return math.ceil(
+        sum(
+            demand.target_replicas * demand.cpus_per_replica + demand.fixed_cpus
+            for demand in demands
+        )
+    )
+
+
+@ray.remote(num_cpus=0)
+class ResourceArbiterActor:
+    def __init__(self) -> None:
+        self._demands: Dict[str, ResourceDemand] = {}
+        self._last_update: Dict[str, float] = {}
+        self._requested_cpus = None
+
+    def _expire_demands(self):
+        now = time.time()
+        for proc_id, last_update in list(self._last_update.items()):
+            if now - last_update > _DEMAND_TTL_SECS:
+                logging.warning("dropping stale resource demand for: %s", proc_id)
+                del self._demands[proc_id]
+                del self._last_update[proc_id]
+
+    def _request_resources(self):
+        num_cpus = requested_cpus(list(self._demands.values()))
+        if num_cpus != self._requested_cpus:
+            request_resources(num_cpus=num_cpus)
+            self._requested_cpus = num_cpus
+
+    def request_replicas(self, demand: ResourceDemand) -> int:
+        """Updates the demand of a processor and returns its replica budget."""
+        self._demands[demand.proc_id] = demand
+        self._last_update[demand.proc_id] = time.time()
+        self._expire_demands()
+        self._request_resources()
+        budgets = allocate(
+            list(self._demands.values()), ray.cluster_resources().get("CPU", 0)
+        )
+        budget = budgets[demand.proc_id]
+        if budget < demand.target_replicas:
+            logging.warning(
+                "%s can only run %s of %s replicas on the current cluster. We "
+                "will add more as your cluster scales up.",
+                demand.proc_id,
+                budget,
+                demand.target_replicas,
+            )
+        return budget
+
+    def remove(self, proc_id: str) -> bool:
+        """Removes the demand of a processor.
+
+        Returns whether any demands are left, if not the arbiter can be killed.
+        """
+        self._demands.pop(proc_id, None)
+        self._last_update.pop(proc_id, None)
+        self._request_resources()
+        return bool(self._demands)
+
+
+def get_arbiter():
+    """Returns the arbiter for the cluster, creating it if needed."""
+    return ResourceArbiterActor.options(
+        name=_ARBITER_NAME,
+        namespace=_ARBITER_NAMESPACE,
+        lifetime="detached",
+        get_if_exists=True,
+    ).remote()
@@ -0,0 +1,81 @@
+import unittest
+from unittest import mock
+
+from buildflow.runtime.managers import resource_arbiter
+
+
+def _demand(proc_id: str, desired: int, priority: int = 0, **kwargs):
+    params = dict(min_replicas=1, max_replicas=100, cpus_per_replica=1)
+    params.update(kwargs)
+    return resource_arbiter.ResourceDemand(
+        proc_id=proc_id, desired_replicas=desired, priority=priority, **params
+    )
+
+
+class AllocateTest(unittest.TestCase):
+    def test_enough_resources(self):
+        budgets = resource_arbiter.allocate([_demand("a", 3), _demand("b", 2)], 10)
+
+        self.assertEqual({"a": 3, "b": 2}, budgets)
+
+    def test_min_replicas_are_guaranteed(self):
+        demands = [
+            _demand("high", 10, priority=1),
+            _demand("low", 10, priority=0, min_replicas=3),
+        ]
+
+        budgets = resource_arbiter.allocate(demands, 8)
+
+        self.assertEqual({"high": 5, "low": 3}, budgets)
+
+    def test_same_priority_shares_evenly(self):
+        demands = [_demand("a", 10), _demand("b", 10, cpus_per_replica=2)]
+
+        budgets = resource_arbiter.allocate(demands, 9)
+
+        self.assertEqual({"a": 3, "b": 3}, budgets)
+
+    def test_fixed_cpus_are_reserved(self):
+        budgets = resource_arbiter.allocate([_demand("a", 10, fixed_cpus=4)], 6)
+
+        self.assertEqual({"a": 2}, budgets)
+
+    def test_desired_is_clamped(self):
+        demands = [_demand("a", 0, min_replicas=2), _demand("b", 50, max_replicas=3)]
+
+        budgets = resource_arbiter.allocate(demands, 100)
+
+        self.assertEqual({"a": 2, "b": 3}, budgets)
+
+    def test_zero_cpu_replicas_are_unconstrained(self):
+        demands = [_demand("a", 5, cpus_per_replica=0), _demand("b", 10)]
+
+        budgets = resource_arbiter.allocate(demands, 3)
+
+        self.assertEqual({"a": 5, "b": 3}, budgets)
+
+
+class ResourceArbiterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.arbiter = resource_arbiter.ResourceArbiterActor.__ray_actor_class__()
+
+    @mock.patch("ray.cluster_resources", return_value={"CPU": 4})
+    @mock.patch.object(resource_arbiter, "request_resources")
+    def test_requests_combined_resources(self, request_mock, _):
+        self.assertEqual(3, self.arbiter.request_replicas(_demand("a", 3)))
+        request_mock.assert_called_with(num_cpus=3)
+
+        # Both processors have the same priority so they share the cluster,
+        # but the request includes everything both of them want.
+        self.assertEqual(2, self.arbiter.request_replicas(_demand("b", 5)))
+        request_mock.assert_called_with(num_cpus=8)
+        self.assertEqual(2, self.arbiter.request_replicas(_demand("a", 3)))
+
+        self.assertTrue(self.arbiter.remove("b"))
+        request_mock.assert_called_with(num_cpus=3)
+        self.assertFalse(self.arbiter.remove("a"))
+        request_mock.assert_called_with(num_cpus=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
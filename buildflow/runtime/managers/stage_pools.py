@@ -0,0 +1,417 @@
+"""Pools of processor and sink actors that are scaled independently.
+
+By default a replica is a source, processor, and sink actor that are scaled
+together. When stage scaling is enabled the processors and sinks instead live
+in pools that are shared by all source replicas:
+
+    source replicas --> processor pool --> sink pool
+
+Every source routes each batch to the member of the pool with the fewest calls
+in flight from that source (see `StageRouter`). The routers periodically sync
+with the `StagePoolActor` of their pool, which hands out the current members
+and aggregates the load every router has seen. The stream manager uses that
+load to size each pool.
+
+Routers stop routing to a member once a call to it fails because the actor
+died, and report it to the pool actor. The stream manager replaces dead
+members when it next rebalances the pool.
+"""
+
+import asyncio
+import collections
+import dataclasses
+import logging
+import math
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+import ray
+
+from buildflow import utils
+from buildflow.runtime.ray_io import base
+
+# How often routers report their load and pick up membership changes.
+_ROUTER_SYNC_INTERVAL_SECS = 1
+# Queue depths of routers that haven't synced for this long are ignored, e.g.
+# because their source was removed.
+_QUEUE_DEPTH_TTL_SECS = 10 * _ROUTER_SYNC_INTERVAL_SECS
+
+
+def _is_dead_actor_error(error: Exception) -> bool:
+    # Unavailable actors may come back, e.g. after a network blip.
+    unavailable = getattr(ray.exceptions, "ActorUnavailableError", ())
+    return isinstance(error, ray.exceptions.RayActorError) and not isinstance(
+        error, unavailable
+    )
+
+
+@dataclasses.dataclass
+class StageLoad:
+    # The total time calls to the member were in flight, across all routers.
+    # Divided by the wall time this is the average number of calls in flight.
+    busy_secs: float = 0
+    # The number of calls to the member that completed.
+    calls: int = 0
+    # The number of calls currently in flight to the member.
+    queue_depth: int = 0
+
+
+@ray.remote(num_cpus=0)
+class StagePoolActor:
+    def __init__(self) -> None:
+        self._members: Dict[str, Any] = {}
+        self._loads: Dict[str, StageLoad] = {}
+        # The calls in flight per member, for every router.
+        self._queue_depths: Dict[str, Dict[str, int]] = {}
+        self._last_sync: Dict[str, float] = {}
+        # Members that routers found dead, until they're replaced.
+        self._dead_members: Set[str] = set()
+
+    def set_members(self, members: Dict[str, Any]):
+        """Sets the actor handles that calls are routed to."""
+        self._members = dict(members)
+        self._dead_members &= set(self._members)
+        for member_id in list(self._loads):
+            if member_id not in self._members:
+                del self._loads[member_id]
+
+    def sync(
+        self,
+        router_id: str,
+        busy_secs: Dict[str, float],
+        calls: Dict[str, int],
+        queue_depths: Dict[str, int],
+        dead_members: Iterable[str] = (),
+    ) -> Dict[str, Any]:
+        """Adds the load seen by a router and returns the live members."""
+        self._dead_members.update(
+            member_id for member_id in dead_members if member_id in self._members
+        )
+        for member_id, secs in busy_secs.items():
+            if member_id in self._members:
+                load = self._loads.setdefault(member_id, StageLoad())
+                load.busy_secs += secs
+                load.calls += calls.get(member_id, 0)
+        self._queue_depths[router_id] = queue_depths
+        self._last_sync[router_id] = time.monotonic()
+        return {
+            member_id: handle
+            for member_id, handle in self._members.items()
+            if member_id not in self._dead_members
+        }
+
+    def dead_members(self) -> List[str]:
+        """Returns the members that routers found dead."""
+        return sorted(self._dead_members)
+
+    def _expire_queue_depths(self):
+        now = time.monotonic()
+        for router_id, last_sync in list(self._last_sync.items()):
+            if now - last_sync > _QUEUE_DEPTH_TTL_SECS:
+                del self._queue_depths[router_id]
+                del self._last_sync[router_id]
+
+    def queue_depth(self, member_id: str) -> int:
+        self._expire_queue_depths()
+        return sum(depths.get(member_id, 0) for depths in self._queue_depths.values())
+
+    def collect(self) -> Dict[str, StageLoad]:
+        """Returns the load of every member since the last collect."""
+        collected = {}
+        for member_id in self._members:
+            load = self._loads.pop(member_id, StageLoad())
+            load.queue_depth = self.queue_depth(member_id)
+            collected[member_id] = load
+        return collected
+
+
+class _RoutedMethod:
+    def __init__(self, router: "StageRouter", name: str) -> None:
+        self._router = router
+        self._name = name
+
+    def remote(self, *args, **kwargs):
+        return asyncio.ensure_future(self._router.call(self._name, *args, **kwargs))
+
+
+class StageRouter:
+    """Routes calls to the least loaded member of a stage pool.
+
+    This exposes the same `handle.method.remote(...)` API as a ray actor
+    handle. It has to be created before it's sent to the actor that uses it.
+    """
+
+    def __init__(self, pool: Any) -> None:
+        self._pool = pool
+        self._router_id = utils.uuid()
+        self._members: Dict[str, Any] = {}
+        self._in_flight = collections.Counter()
+        self._busy_secs = collections.defaultdict(float)
+        self._calls = collections.Counter()
+        # Members whose actor died, they're never routed to again.
+        self._dead_members: Set[str] = set()
+        self._last_sync = -math.inf
+        self._sync_task = None
+
+    def __getattr__(self, name: str) -> _RoutedMethod:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _RoutedMethod(self, name)
+
+    async def _sync(self):
+        busy_secs, self._busy_secs = self._busy_secs, collections.defaultdict(float)
+        calls, self._calls = self._calls, collections.Counter()
+        members = await self._pool.sync.remote(
+            self._router_id,
+            dict(busy_secs),
+            dict(calls),
+            dict(self._in_flight),
+            list(self._dead_members),
+        )
+        self._members = {
+            member_id: handle
+            for member_id, handle in members.items()
+            if member_id not in self._dead_members
+        }
+        self._last_sync = time.monotonic()
+
+    def _schedule_sync(self) -> bool:
+        if time.monotonic() - self._last_sync < _ROUTER_SYNC_INTERVAL_SECS:
+            return False
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.ensure_future(self._sync())
+        return True
+
+    async def _maybe_sync(self):
+        if not self._schedule_sync():
+            return
+        if not self._members:
+            # Nothing to route to until we know the members.
+            await self._sync_task
+
+    async def _pick_member(self) -> str:
+        await self._maybe_sync()
+        while not self._members:
+            # The pool is empty, e.g. while it's being started.
+            await asyncio.sleep(0.1)
+            self._last_sync = -math.inf
+            await self._maybe_sync()
+        return min(
+            self._members, key=lambda member: (self._in_flight[member], random.random())
+        )
+
+    async def call(self, method: str, *args, **kwargs):
+        member_id = await self._pick_member()
+        handle = self._members[member_id]
+        self._in_flight[member_id] += 1
+        start = time.monotonic()
+        try:
+            return await getattr(handle, method).remote(*args, **kwargs)
+        except Exception as e:
+            if _is_dead_actor_error(e):
+                logging.warning("stage pool member %s died.", member_id)
+                self._dead_members.add(member_id)
+                self._members.pop(member_id, None)
+                # Report it right away so the pool replaces it.
+                self._last_sync = -math.inf
+            raise
+        finally:
+            self._in_flight[member_id] -= 1
+            self._busy_secs[member_id] += time.monotonic() - start
+            self._calls[member_id] += 1
+            # Report the finished call even if no new calls come in, so the
+            # pool doesn't wait on it when draining the member.
+            self._schedule_sync()
+
+
+class _PassthroughProcessor:
+    """Stands in for the processor of pooled sinks.
+
+    Pooled sinks receive outputs that were already processed by the processor
+    pool.
+    """
+
+    async def process_batch(self, elements):
+        return elements
+
+
+def passthrough_processor() -> base.LocalActorHandle:
+    return base.LocalActorHandle(_PassthroughProcessor())
+
+
+class StagePipeline:
+    """Sends a batch through the processor pool and then the sink pool.
+
+    Source replicas use this in place of their sink.
+    """
+
+    def __init__(self, processors: StageRouter, sinks: StageRouter) -> None:
+        self._processors = processors
+        self._sinks = sinks
+
+    async def write(self, elements, context: Dict[str, str] = {}):
+        results = await self._processors.process_batch.remote(elements)
+        return await self._sinks.write.remote(results, context)
+
+
+def desired_pool_size(
+    loads: Dict[str, StageLoad],
+    secs: float,
+    target_load: float,
+    min_size: int,
+    max_size: int,
+) -> int:
+    """Returns the pool size that keeps the load per member near `target_load`.
+
+    The load of a member is the average number of calls it had in flight,
+    which includes calls queued on the actor.
+    """
+    if secs <= 0:
+        return max(min(len(loads), max_size), min_size)
+    in_flight = sum(load.busy_secs for load in loads.values()) / secs
+    desired = math.ceil(in_flight / target_load)
+    return max(min(desired, max_size), min_size)
+
+
+class StagePool:
+    """Manages the members of a stage pool for the stream manager."""
+
+    def __init__(
+        self,
+        name: str,
+        create_member: Callable[[], Any],
+        target_load: float,
+        min_size: int,
+        max_size: int,
+        drain_timeout_secs: float,
+        namespace: str,
+        configure_member: Optional[Callable[[Any], Awaitable]] = None,
+    ) -> None:
+        self.name = name
+        self._create_member = create_member
+        # Configures new members before any calls are routed to them.
+        self._configure_member = configure_member
+        self.target_load = target_load
+        self.min_size = min_size
+        self.max_size = max_size
+        self._drain_timeout_secs = drain_timeout_secs
+        self.pool_actor = StagePoolActor.options(namespace=namespace).remote()
+        self.members: Dict[str, Any] = {}
+        self._last_loads: Dict[str, StageLoad] = {}
+        # Removed members that are finishing their in flight calls.
+        self._drains: Dict[str, asyncio.Future] = {}
+
+    def router(self) -> StageRouter:
+        return StageRouter(self.pool_actor)
+
+    def _pick_members_to_remove(self, num_members: int) -> List[str]:
+        # The least loaded members go first, and the newest members for ties.
+        # Members are kept in creation order.
+        order = {member_id: i for i, member_id in enumerate(self.members)}
+
+        def cost(member_id: str):
+            load = self._last_loads.get(member_id, StageLoad())
+            return (load.busy_secs + load.queue_depth, -order[member_id])
+
+        return sorted(self.members, key=cost)[:num_members]
+
+    async def _flush(self, handle: Any):
+        # Sink members may still buffer outputs, processors have nothing to
+        # flush.
+        flush = getattr(handle, "flush", None)
+        if flush is None:
+            return
+        try:
+            await flush.remote()
+        except Exception:
+            logging.exception("%s failed to flush before it was stopped.", self.name)
+
+    async def _drain(self, member_id: str, handle: Any):
+        # Routers stop sending calls to the member once they've synced, then
+        # we give the calls that are still in flight time to finish.
+        await asyncio.sleep(2 * _ROUTER_SYNC_INTERVAL_SECS)
+        deadline = time.monotonic() + self._drain_timeout_secs
+        while time.monotonic() < deadline:
+            if not await self.pool_actor.queue_depth.remote(member_id):
+                break
+            await asyncio.sleep(_ROUTER_SYNC_INTERVAL_SECS)
+        else:
+            logging.warning(
+                "%s did not finish its in flight calls within %s seconds, "
+                "killing it.",
+                self.name,
+                self._drain_timeout_secs,
+            )
+        await self._flush(handle)
+        ray.kill(handle, no_restart=True)
+        self._drains.pop(member_id, None)
+
+    async def resize(self, num_members: int):
+        """Resizes the pool to `num_members`.
+
+        Removed members are drained in the background, so this doesn't wait for
+        their in flight calls to finish.
+        """
+        num_members = max(min(num_members, self.max_size), self.min_size)
+        removed = {}
+        if num_members > len(self.members):
+            added = [
+                self._create_member() for _ in range(num_members - len(self.members))
+            ]
+            if self._configure_member is not None:
+                await asyncio.gather(
+                    *[self._configure_member(handle) for handle in added]
+                )
+            for handle in added:
+                self.members[utils.uuid()] = handle
+        elif num_members < len(self.members):
+            for member_id in self._pick_members_to_remove(
+                len(self.members) - num_members
+            ):
+                removed[member_id] = self.members.pop(member_id)
+        await self.pool_actor.set_members.remote(self.members)
+        for member_id, handle in removed.items():
+            self._drains[member_id] = asyncio.ensure_future(
+                self._drain(member_id, handle)
+            )
+
+    async def _remove_dead_members(self) -> bool:
+        removed = False
+        for member_id in await self.pool_actor.dead_members.remote():
+            handle = self.members.pop(member_id, None)
+            if handle is None:
+                continue
+            logging.warning("replacing dead %s pool member %s", self.name, member_id)
+            try:
+                ray.kill(handle, no_restart=True)
+            except Exception:
+                pass
+            removed = True
+        return removed
+
+    async def rebalance(self, secs: float) -> int:
+        """Resizes the pool based on the load since the last rebalance.
+
+        Members that died are replaced.
+        """
+        removed_dead = await self._remove_dead_members()
+        self._last_loads = await self.pool_actor.collect.remote()
+        desired = desired_pool_size(
+            self._last_loads, secs, self.target_load, self.min_size, self.max_size
+        )
+        if removed_dead or desired != len(self.members):
+            logging.warning(
+                "resizing %s pool from %s to %s", self.name, len(self.members), desired
+            )
+            await self.resize(desired)
+        return desired
+
+    async def shutdown(self):
+        # Only called once the sources are drained, so nothing is in flight.
+        await asyncio.gather(*self._drains.values(), return_exceptions=True)
+        await asyncio.gather(*[self._flush(handle) for handle in self.members.values()])
+        for handle in self.members.values():
+            ray.kill(handle, no_restart=True)
+        self.members = {}
+        ray.kill(self.pool_actor, no_restart=True)
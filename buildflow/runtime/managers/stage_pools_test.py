@@ -0,0 +1,254 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import ray
+
+from buildflow.runtime.managers import stage_pools
+from buildflow.runtime.ray_io import base
+
+
+class _SlowMember:
+    def __init__(self, delay_secs: float) -> None:
+        self.delay_secs = delay_secs
+        self.calls = 0
+
+    async def process_batch(self, elements):
+        self.calls += 1
+        await asyncio.sleep(self.delay_secs)
+        return [element * 2 for element in elements]
+
+
+class _DeadMember:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def process_batch(self, elements):
+        self.calls += 1
+        raise ray.exceptions.RayActorError()
+
+
+class _RecordingSink:
+    def __init__(self) -> None:
+        self.written = []
+
+    async def write(self, elements, context):
+        self.written.extend(elements)
+        return True
+
+
+def _pool(members):
+    pool = stage_pools.StagePoolActor.__ray_actor_class__()
+    pool.set_members(
+        {
+            member_id: base.LocalActorHandle(member)
+            for member_id, member in members.items()
+        }
+    )
+    return pool
+
+
+class StageRouterTest(unittest.TestCase):
+    def test_routes_to_least_loaded_member(self):
+        slow = _SlowMember(0.2)
+        fast = _SlowMember(0.01)
+        pool = _pool({"slow": slow, "fast": fast})
+        router = stage_pools.StageRouter(base.LocalActorHandle(pool))
+
+        async def run():
+            for _ in range(10):
+                await asyncio.gather(
+                    router.process_batch.remote([1]), router.process_batch.remote([2])
+                )
+            # The loads are reported on the next sync.
+            router._last_sync = 0
+            await router._maybe_sync()
+            await router._sync_task
+
+        asyncio.run(run())
+
+        self.assertEqual(20, slow.calls + fast.calls)
+        loads = pool.collect()
+        self.assertEqual(20, loads["slow"].calls + loads["fast"].calls)
+        self.assertGreater(loads["slow"].busy_secs, loads["fast"].busy_secs)
+        self.assertEqual(0, loads["slow"].queue_depth)
+
+    def test_dead_member_is_dropped_and_reported(self):
+        dead = _DeadMember()
+        live = _SlowMember(0)
+        pool = _pool({"dead": dead, "live": live})
+        router = stage_pools.StageRouter(base.LocalActorHandle(pool))
+
+        async def run():
+            results = []
+            for _ in range(5):
+                try:
+                    results.append(await router.process_batch.remote([1]))
+                except ray.exceptions.RayActorError:
+                    results.append(None)
+            await router._sync_task
+            return results
+
+        # Ties go to the first member, so the dead member is picked first.
+        with mock.patch.object(stage_pools.random, "random", return_value=0):
+            results = asyncio.run(run())
+
+        self.assertEqual(1, dead.calls)
+        self.assertEqual([None] + [[2]] * 4, results)
+        self.assertEqual(["dead"], pool.dead_members())
+        self.assertEqual({"live"}, set(pool.sync("other", {}, {}, {})))
+
+    def test_pipeline(self):
+        sink = _RecordingSink()
+        processors = stage_pools.StageRouter(
+            base.LocalActorHandle(_pool({"p": _SlowMember(0)}))
+        )
+        sinks = stage_pools.StageRouter(base.LocalActorHandle(_pool({"s": sink})))
+        pipeline = base.LocalActorHandle(stage_pools.StagePipeline(processors, sinks))
+
+        async def run():
+            return await pipeline.write.remote([1, 2])
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual([2, 4], sink.written)
+
+
+class StagePoolActorTest(unittest.TestCase):
+    def test_collect_ignores_removed_members(self):
+        pool = _pool({"a": None, "b": None})
+        pool.sync("router", {"a": 1.0, "b": 2.0}, {"a": 1, "b": 2}, {"a": 3})
+
+        pool.set_members({"a": None})
+        loads = pool.collect()
+
+        self.assertEqual({"a"}, set(loads))
+        self.assertEqual(1.0, loads["a"].busy_secs)
+        self.assertEqual(3, loads["a"].queue_depth)
+        self.assertEqual(0, pool.collect()["a"].busy_secs)
+
+    def test_stale_queue_depths_are_ignored(self):
+        pool = _pool({"a": None})
+        pool.sync("stale", {}, {}, {"a": 3})
+        pool.sync("fresh", {}, {}, {"a": 1})
+        pool._last_sync["stale"] -= stage_pools._QUEUE_DEPTH_TTL_SECS + 1
+
+        self.assertEqual(1, pool.queue_depth("a"))
+
+
+class _FlushingMember:
+    def __init__(self) -> None:
+        self.flushed = False
+
+    async def flush(self):
+        self.flushed = True
+
+
+class StagePoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pool_actor = stage_pools.StagePoolActor.__ray_actor_class__()
+        self.members = []
+
+    def _create_member(self):
+        member = _FlushingMember()
+        self.members.append(member)
+        return base.LocalActorHandle(member)
+
+    def _stage_pool(
+        self, drain_timeout_secs: float = 60, configure_member=None
+    ) -> stage_pools.StagePool:
+        with mock.patch.object(stage_pools.StagePoolActor, "options") as options:
+            options.return_value.remote.return_value = base.LocalActorHandle(
+                self.pool_actor
+            )
+            return stage_pools.StagePool(
+                "test",
+                self._create_member,
+                1,
+                0,
+                10,
+                drain_timeout_secs,
+                "ns",
+                configure_member=configure_member,
+            )
+
+    def test_members_are_configured_before_they_are_routed_to(self):
+        configured = []
+
+        async def configure_member(handle):
+            # Nothing is routed to the member until it's configured.
+            self.assertEqual({}, self.pool_actor._members)
+            configured.append(handle)
+
+        stage_pool = self._stage_pool(configure_member=configure_member)
+
+        asyncio.run(stage_pool.resize(2))
+
+        self.assertEqual(list(stage_pool.members.values()), configured)
+        self.assertEqual(stage_pool.members, self.pool_actor._members)
+
+    @mock.patch("ray.kill")
+    def test_rebalance_replaces_dead_members(self, kill_mock):
+        stage_pool = self._stage_pool()
+
+        async def run():
+            await stage_pool.resize(2)
+            dead_id = next(iter(stage_pool.members))
+            dead_handle = stage_pool.members[dead_id]
+            self.pool_actor.sync("router", {}, {}, {}, [dead_id])
+            await stage_pool.rebalance(0)
+            return dead_id, dead_handle
+
+        dead_id, dead_handle = asyncio.run(run())
+
+        self.assertEqual(2, len(stage_pool.members))
+        self.assertNotIn(dead_id, stage_pool.members)
+        self.assertEqual([], self.pool_actor.dead_members())
+        self.assertEqual(stage_pool.members, self.pool_actor._members)
+        kill_mock.assert_called_once_with(dead_handle, no_restart=True)
+
+    @mock.patch.object(stage_pools, "_ROUTER_SYNC_INTERVAL_SECS", 0.01)
+    @mock.patch("ray.kill")
+    def test_resize_drains_in_the_background(self, kill_mock):
+        stage_pool = self._stage_pool(drain_timeout_secs=60)
+
+        async def run():
+            await stage_pool.resize(2)
+            # A router still has a call in flight to every member.
+            self.pool_actor.sync(
+                "router", {}, {}, {member_id: 1 for member_id in stage_pool.members}
+            )
+            start = time.monotonic()
+            await stage_pool.resize(1)
+            resize_secs = time.monotonic() - start
+            self.assertEqual(1, len(stage_pool._drains))
+            self.pool_actor.sync("router", {}, {}, {})
+            await stage_pool.shutdown()
+            return resize_secs
+
+        self.assertLess(asyncio.run(run()), 1)
+        self.assertEqual({}, stage_pool._drains)
+        self.assertTrue(all(member.flushed for member in self.members))
+        self.assertEqual(3, kill_mock.call_count)
+
+
+class DesiredPoolSizeTest(unittest.TestCase):
+    def test_scales_to_target_load(self):
+        loads = {
+            "a": stage_pools.StageLoad(busy_secs=10),
+            "b": stage_pools.StageLoad(busy_secs=20),
+        }
+
+        # 3 calls in flight on average, with a target of 1 per member.
+        self.assertEqual(3, stage_pools.desired_pool_size(loads, 10, 1, 1, 100))
+        self.assertEqual(1, stage_pools.desired_pool_size(loads, 10, 4, 1, 100))
+        self.assertEqual(2, stage_pools.desired_pool_size(loads, 10, 1, 1, 2))
+
+    def test_idle_pool_scales_to_min(self):
+        loads = {"a": stage_pools.StageLoad(), "b": stage_pools.StageLoad()}
+
+        self.assertEqual(1, stage_pools.desired_pool_size(loads, 10, 1, 1, 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
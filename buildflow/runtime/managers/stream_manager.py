@@ -15,67 +15,138 @@ When do we scale down?
     were made.
 """
 import asyncio
-from dataclasses import dataclass
+import collections
+import dataclasses
+import itertools
 import logging
 import signal
 import time
-from typing import Awaitable, Dict, Optional, Tuple, Type
+from typing import Any, Awaitable, Dict, List, Optional, Tuple, Type
 
 import ray
-from ray.util.metrics import Counter, Gauge
+from ray.util.metrics import Counter, Gauge, Histogram
 
 from buildflow import utils
+from buildflow.api import io
 from buildflow.api.options import AutoscalingOptions
 from buildflow.runtime.managers import auto_scaler
+from buildflow.runtime.managers import metrics_aggregator
+from buildflow.runtime.managers import placement
 from buildflow.runtime.managers import processors
+from buildflow.runtime.managers import resource_arbiter
+from buildflow.runtime.managers import stage_pools
+from buildflow.runtime.ray_io import base
 from buildflow.runtime.ray_io import empty_io
 
+# How often the sources of the replicas push their metrics to the aggregator.
+_METRICS_REPORT_INTERVAL_SECS = 1
 # Even though our backlog calculation is based on 2 minute intervals we do an
-# auto scale check every 60 seconds. This helps ensure we use the ray resources
-# as soon as they're available.
-_REPLICA_CHECK_IN = 10
+# auto scale check every 10 seconds. This helps ensure we use the ray resources
+# as soon as they're available. Every check in spans several metric reports so
+# the metrics it collects cover the whole interval.
+_REPLICA_CHECK_IN = 10 * _METRICS_REPORT_INTERVAL_SECS
+# How long a replica that is being removed has to finish and ack its in flight
+# batches before it is killed.
+_DRAIN_TIMEOUT_SECS = 60
 
 
-@dataclass
-class _MetricsWrapper:
-    num_events: int
-    non_empty_response_ratio: float
-    failed: bool = False
+@dataclasses.dataclass
+class _Replica:
+    # The actors to kill when the replica is removed. Killing them also kills
+    # the actors they created.
+    owners: List[Any]
+    created_at: float
+    replica_placement: Optional[placement.ReplicaPlacement] = None
+    # Creates and configures the actors of the replica.
+    setup_task: Optional[asyncio.Future] = None
+    # Runs the replica, only set once the replica is activated.
+    run_task: Optional[asyncio.Future] = None
+    # The source actor, set once it has been created.
+    actor: Any = None
+    # Whether the actor has been configured and started running.
+    started: bool = False
 
 
-async def _wait_for_metrics(
-    tasks: Dict[str, Awaitable]
-) -> Dict[str, Optional[_MetricsWrapper]]:
-    async def mark(key: str, coro: Awaitable) -> Tuple[str, Optional[_MetricsWrapper]]:
-        try:
-            num_events, empty_response_ratio, requests = await coro
-            return key, _MetricsWrapper(
-                num_events=num_events, non_empty_response_ratio=1 - empty_response_ratio
-            )
-        except asyncio.CancelledError:
-            logging.warning(
-                "timeout for metrics, this can happen when an "
-                "actor is pending creation."
-            )
-            return key, None
-        except Exception as e:
-            logging.error("Actor died with following exception: %s", e)
-            return key, _MetricsWrapper(0, 0, failed=True)
+def _create_source(processor_ref: processors.ProcessorRef, ray_sinks, proc_input_type):
+    return processor_ref.source.actor(ray_sinks, proc_input_type), None
+
 
-    done, pending = await asyncio.wait(
-        [mark(key, coro) for key, coro in tasks.items()], timeout=15
+def _create_sink_and_source(
+    processor_ref: processors.ProcessorRef, key: str, process_actor, proc_input_type
+):
+    sink_actor = processor_ref.sink.actor(
+        process_actor, processor_ref.source.is_streaming()
     )
+    source_actor = processor_ref.source.actor({key: sink_actor}, proc_input_type)
+    return source_actor, sink_actor
+
+
+def _pick_replicas_to_remove(
+    replicas: Dict[str, _Replica],
+    metrics: Dict[str, metrics_aggregator.ReplicaMetrics],
+    num_replicas: int,
+) -> List[str]:
+    """Returns the IDs of the `num_replicas` cheapest replicas to remove.
+
+    Replicas that haven't started yet have nothing to drain so they go first,
+    followed by the least loaded replicas. Ties are broken by removing the
+    newest replicas first.
+    """
+
+    def cost(replica_id: str):
+        replica = replicas[replica_id]
+        metric = metrics.get(replica_id)
+        if not replica.started or metric is None:
+            return (0, 0, -replica.created_at)
+        return (1, metric.num_events + metric.queue_depth, -replica.created_at)
+
+    return sorted(replicas, key=cost)[:num_replicas]
+
 
-    for p in pending:
-        p.cancel()
-        await p
-        done.add(p)
+def _pick_warm_replicas(
+    warm_replicas: Dict[str, _Replica], num_replicas: int
+) -> List[str]:
+    """Returns the IDs of up to `num_replicas` warm replicas to activate.
 
-    final_result = {}
-    for task in done:
-        key, value = task.result()
-        final_result[key] = value
-    return final_result
+    Replicas that finished their setup go first, followed by the oldest
+    replicas since they're the furthest along.
+    """
+
+    def cost(replica_id: str):
+        replica = warm_replicas[replica_id]
+        return (not replica.setup_task.done(), replica.created_at)
+
+    return sorted(warm_replicas, key=cost)[:num_replicas]
+
+
+def _update_idle_secs(
+    idle_secs: float, backlog: float, num_events: int, secs: float
+) -> float:
+    """Returns how long the source has had no backlog and processed nothing."""
+    if backlog or num_events:
+        return 0
+    return idle_secs + secs
+
+
+def _scale_to_zero_replicas(
+    num_replicas: int,
+    desired_replicas: Optional[int],
+    backlog: float,
+    idle_secs: float,
+    scale_to_zero_idle_secs: float,
+) -> int:
+    """Applies scaling to zero to the replicas the autoscaling policy wants.
+
+    Without replicas there are no metrics for the policy to go by, so a
+    replica is cold started as soon as the source has a backlog. Otherwise the
+    last replica is only removed once the source has been idle for
+    `scale_to_zero_idle_secs`.
+    """
+    if not num_replicas:
+        return 1 if backlog else 0
+    if desired_replicas < 1 and idle_secs < scale_to_zero_idle_secs:
+        return 1
+    return desired_replicas
 
 
 @ray.remote
@@ -88,14 +159,28 @@ class _StreamManagerActor:
         proc_input_type: Optional[Type],
     ) -> None:
         self.options = options
+        self._policy = options.policy or auto_scaler.UtilizationPolicy()
         self.proc_id = proc_id
         self.processor_ref = processor_ref
         self.running = True
         self._requests = 0
         self._running_average = float("nan")
         self._sink_actor = None
-        self._replicas = {}
+        self._replicas: Dict[str, _Replica] = {}
+        # Replicas that are set up but not running yet, so they can be
+        # activated right away when we scale up.
+        self._warm_replicas: Dict[str, _Replica] = {}
+        # Removed replicas that are finishing their in flight batches.
+        self._drains: Dict[str, asyncio.Future] = {}
+        self._last_metrics: Dict[str, metrics_aggregator.ReplicaMetrics] = {}
         self._proc_input_type = proc_input_type
+        # Replicas push their metrics here so we don't have to ask every
+        # replica for them at every check in.
+        self._metrics_aggregator = metrics_aggregator.MetricsAggregatorActor.options(
+            namespace=proc_id
+        ).remote()
+        # Shared by every stream manager in the cluster, see resource_arbiter.
+        self._arbiter = resource_arbiter.get_arbiter()
         job_id = ray.get_runtime_context().get_job_id()
         self.num_replicas_gauge = Gauge(
             "num_replicas",
@@ -110,6 +195,48 @@ class _StreamManagerActor:
             + processor_ref.source.num_cpus()
             + self.processor_ref.processor_instance.num_cpus()
         )
+        self._fuse_replicas = processor_ref.processor_instance.fuse_replicas()
+        if self._fuse_replicas and not (
+            io.supports_local_actor(processor_ref.source)
+            and io.supports_local_actor(processor_ref.sink)
+        ):
+            logging.warning(
+                "fused replicas are not supported for %s and %s, falling back "
+                "to separate actors.",
+                type(processor_ref.source).__name__,
+                type(processor_ref.sink).__name__,
+            )
+            self._fuse_replicas = False
+        self._stage_scaling = options.stage_scaling
+        if self._stage_scaling is not None:
+            if self._fuse_replicas:
+                logging.warning(
+                    "fused replicas can't be used with stage scaling, falling "
+                    "back to separate actors."
+                )
+                self._fuse_replicas = False
+            # Replicas only contain the source, the processors and sinks are
+            # scaled separately.
+            self.cpu_per_replica = processor_ref.source.num_cpus()
+            self._processor_pool = stage_pools.StagePool(
+                "processor",
+                self._create_process_actor,
+                self._stage_scaling.target_processor_load,
+                self._stage_scaling.min_processors,
+                self._stage_scaling.max_processors,
+                _DRAIN_TIMEOUT_SECS,
+                proc_id,
+            )
+            self._sink_pool = stage_pools.StagePool(
+                "sink",
+                self._create_pooled_sink,
+                self._stage_scaling.target_sink_load,
+                self._stage_scaling.min_sinks,
+                self._stage_scaling.max_sinks,
+                _DRAIN_TIMEOUT_SECS,
+                proc_id,
+                configure_member=self._configure_batching,
+            )
         self.num_events_counter = Counter(
             "num_events_processed",
             description=("Number of events processed by the actor. Goes up and down."),
@@ -118,76 +245,372 @@ class _StreamManagerActor:
         self.num_events_counter.set_default_tags(
             {"actor_name": self.__class__.__name__, "JobID": job_id}
         )
+        self.queue_depth_gauge = Gauge(
+            "replica_queue_depth",
+            description=(
+                "Number of records a replica has sent to its sink that have not "
+                "been written yet. Goes up and down."
+            ),
+            tag_keys=("actor_name", "JobID", "ReplicaID"),
+        )
+        self.queue_depth_gauge.set_default_tags(
+            {"actor_name": self.__class__.__name__, "JobID": job_id}
+        )
+        self.drain_time_histogram = Histogram(
+            "replica_drain_time",
+            description=(
+                "Seconds it took a replica to finish its in flight batches when "
+                "it was removed."
+            ),
+            boundaries=[1, 5, 10, 30, _DRAIN_TIMEOUT_SECS],
+            tag_keys=("actor_name", "JobID"),
+        )
+        self.drain_time_histogram.set_default_tags(
+            {"actor_name": self.__class__.__name__, "JobID": job_id}
+        )
+        self._flow_control = processor_ref.processor_instance.flow_control_options()
+        self._batching = processor_ref.processor_instance.batching_options()
+        self._source_concurrency = (
+            processor_ref.processor_instance.source_concurrency()
+            or processor_ref.source.recommended_num_threads()
+        )
 
-    def _add_replica(self):
-        key = str(self.processor_ref.sink)
-        if isinstance(self.processor_ref.sink, empty_io.EmptySink):
-            key = "local"
+    def _configure_flow_control(self, source_actor):
+        return source_actor.configure_flow_control.remote(
+            self._flow_control.max_outstanding_records,
+            self._flow_control.max_outstanding_bytes,
+        )
+
+    def _configure_batching(self, sink_actor):
+        return sink_actor.configure_batching.remote(
+            self._batching.max_rows,
+            self._batching.max_bytes,
+            self._batching.max_latency_secs,
+        )
 
-        # TODO: could probably have a better way of picking these.
-        # When we scale down we maybe not end up with the .25 ratio depending
-        # on what source actors get turned down.
-        # Could maybe solve this with ray placement groups:
-        #   https://docs.ray.io/en/latest/ray-core/scheduling/placement-group.html
-        process_actor = processors.ProcessActor.options(
+    def _create_process_actor(self, scheduling_strategy: Any = None):
+        return processors.ProcessActor.options(
             num_cpus=self.processor_ref.processor_instance.num_cpus(),
             namespace=self.proc_id,
-        ).remote(self.processor_ref.get_processor_replica())
-        sink_actor = self.processor_ref.sink.actor(
-            process_actor, self.processor_ref.source.is_streaming()
+            scheduling_strategy=scheduling_strategy,
+        ).remote(self.processor_ref.get_processor_replica(), self._proc_input_type)
+
+    def _create_pooled_sink(self):
+        # Pooled sinks receive outputs that were already processed by the
+        # processor pool. The sink pool configures their batching before it
+        # routes writes to them.
+        return self.processor_ref.sink.actor(
+            stage_pools.passthrough_processor(),
+            self.processor_ref.source.is_streaming(),
         )
 
+    def _replicas_per_node(self) -> Dict[str, int]:
+        replicas_per_node = collections.Counter()
+        for replica in itertools.chain(
+            self._replicas.values(), self._warm_replicas.values()
+        ):
+            if replica.replica_placement is not None:
+                replicas_per_node[replica.replica_placement.node_id] += 1
+        return replicas_per_node
+
+    def _launch(self, replica_placement: Optional[placement.ReplicaPlacement]):
+        scheduling_strategy = None
+        if replica_placement is not None:
+            # Capture the actors the launcher creates in the placement group.
+            scheduling_strategy = replica_placement.scheduling_strategy(
+                capture_child_tasks=True
+            )
+        return placement.ReplicaLauncherActor.options(
+            namespace=self.proc_id, scheduling_strategy=scheduling_strategy
+        ).remote()
+
+    def _add_replica(self, warm: bool = False):
+        key = str(self.processor_ref.sink)
+        if isinstance(self.processor_ref.sink, empty_io.EmptySink):
+            key = "local"
+
         replica_id = utils.uuid()
-        source_actor = self.processor_ref.source.actor(
-            {key: sink_actor}, self._proc_input_type
+        source_cpus = self.processor_ref.source.num_cpus()
+        if self._stage_scaling is not None:
+            replica_placement = placement.reserve(
+                [source_cpus], self._replicas_per_node()
+            )
+            pipeline = base.LocalActorHandle(
+                stage_pools.StagePipeline(
+                    self._processor_pool.router(), self._sink_pool.router()
+                )
+            )
+            launcher = self._launch(replica_placement)
+            launch = launcher.launch.remote(
+                _create_source,
+                self.processor_ref,
+                {key: pipeline},
+                self._proc_input_type,
+            )
+            self._start_replica(replica_id, [launcher], replica_placement, launch, warm)
+            return
+
+        if self._fuse_replicas:
+            # The fused replica exposes the same interface as a source actor
+            # but also runs the processor and sink in the same process. It
+            # reserves the CPU of all three stages.
+            replica_placement = placement.reserve(
+                [self.cpu_per_replica], self._replicas_per_node()
+            )
+            scheduling_strategy = None
+            if replica_placement is not None:
+                scheduling_strategy = replica_placement.scheduling_strategy()
+            source_actor = processors.FusedReplicaActor.options(
+                num_cpus=self.cpu_per_replica,
+                namespace=self.proc_id,
+                scheduling_strategy=scheduling_strategy,
+            ).remote(self.processor_ref, key, self._proc_input_type)
+
+            async def launch():
+                # The fused replica is its own sink.
+                return source_actor, source_actor
+
+            self._start_replica(
+                replica_id, [source_actor], replica_placement, launch(), warm
+            )
+            return
+
+        # The source, processor, and sink of a replica share a node, and
+        # replicas are spread across nodes, see placement.py.
+        replica_placement = placement.reserve(
+            [
+                self.processor_ref.processor_instance.num_cpus(),
+                self.processor_ref.sink.num_cpus(),
+                source_cpus,
+            ],
+            self._replicas_per_node(),
         )
-        num_threads = self.processor_ref.source.recommended_num_threads()
-        source_pool_tasks = [source_actor.run.remote() for _ in range(num_threads)]
-        self._replicas[replica_id] = (source_actor, source_pool_tasks)
-
-    async def _remove_replicas(self, replicas_to_remove: int):
-        all_tasks = []
-        actors_to_kill = []
-        actor_shutdowns = []
-        for _ in range(replicas_to_remove):
-            to_pop = next(iter(self._replicas.keys()))
-            actor, tasks = self._replicas.pop(to_pop)
-            all_tasks.extend(tasks)
-            actors_to_kill.append(actor)
-            actor_shutdowns.append(actor.shutdown.remote())
-        _, pending = await asyncio.wait(actor_shutdowns, timeout=15)
-        for task in pending:
-            # This can happen if the actor is not started yet, we will just
-            # force it to with ray.kill below.
-            task.cancel()
-        _, pending = await asyncio.wait(all_tasks, timeout=15)
-        for task in pending:
-            # This can happen if the actor is not started yet, we will just
-            # force it to with ray.kill below.
-            task.cancel()
-        for actor in actors_to_kill:
-            ray.kill(actor, no_restart=True)
+        scheduling_strategy = None
+        if replica_placement is not None:
+            scheduling_strategy = replica_placement.scheduling_strategy()
+        process_actor = self._create_process_actor(scheduling_strategy)
+        launcher = self._launch(replica_placement)
+        launch = launcher.launch.remote(
+            _create_sink_and_source,
+            self.processor_ref,
+            key,
+            process_actor,
+            self._proc_input_type,
+        )
+        self._start_replica(
+            replica_id, [launcher, process_actor], replica_placement, launch, warm
+        )
+
+    def _configure_source(self, source_actor, replica_id: str) -> List[ray.ObjectRef]:
+        return [
+            self._configure_flow_control(source_actor),
+            # The source runs this many pull loops concurrently.
+            source_actor.configure_concurrency.remote(self._source_concurrency),
+            source_actor.configure_metrics_reporting.remote(
+                self._metrics_aggregator, replica_id, _METRICS_REPORT_INTERVAL_SECS
+            ),
+        ]
+
+    def _start_replica(
+        self,
+        replica_id: str,
+        owners: List[Any],
+        replica_placement: Optional[placement.ReplicaPlacement],
+        launch: Awaitable[Tuple[Any, Any]],
+        warm: bool,
+    ):
+        """Sets up a replica once `launch` returns its source and sink actors.
+
+        If `warm` is set the replica is added to the warm pool instead of
+        running it.
+        """
+
+        async def setup():
+            source_actor, sink_actor = await launch
+            replica.actor = source_actor
+            refs = self._configure_source(source_actor, replica_id)
+            if sink_actor is not None:
+                refs.append(self._configure_batching(sink_actor))
+            # Also wait for the other actors to be constructed, e.g. the
+            # processor's setup runs when the process actor is created.
+            refs.extend(owner.__ray_ready__.remote() for owner in owners)
+            await asyncio.gather(*refs)
+
+        replica = _Replica(owners, time.time(), replica_placement)
+        replica.setup_task = asyncio.ensure_future(setup())
+        if warm:
+            self._warm_replicas[replica_id] = replica
+        else:
+            self._run_replica(replica_id, replica)
+
+    def _run_replica(self, replica_id: str, replica: _Replica):
+        async def run():
+            # Tasks of async actors don't necessarily run in the order they
+            # were submitted, so wait for the actor to be configured before
+            # starting it. This doesn't block us while the actor is pending
+            # creation.
+            await replica.setup_task
+            replica.started = True
+            return await replica.actor.run.remote()
+
+        replica.run_task = asyncio.ensure_future(run())
+        self._replicas[replica_id] = replica
+
+    def _add_replicas(self, num_replicas: int):
+        """Adds replicas, activating warm replicas before creating new ones."""
+        warm_ids = _pick_warm_replicas(self._warm_replicas, num_replicas)
+        if warm_ids:
+            logging.warning("activating %s warm replicas", len(warm_ids))
+        for replica_id in warm_ids:
+            self._run_replica(replica_id, self._warm_replicas.pop(replica_id))
+        for _ in range(num_replicas - len(warm_ids)):
+            self._add_replica()
+
+    def _refill_warm_pool(self):
+        for _ in range(self.options.warm_pool_size - len(self._warm_replicas)):
+            self._add_replica(warm=True)
+
+    def _kill_replica(self, replica: _Replica):
+        for owner in replica.owners:
+            ray.kill(owner, no_restart=True)
+        if replica.replica_placement is not None:
+            replica.replica_placement.remove()
+
+    def _remove_dead_replicas(self):
+        for replica_id, replica in list(self._warm_replicas.items()):
+            if not replica.setup_task.done() or replica.setup_task.cancelled():
+                continue
+            e = replica.setup_task.exception()
+            if e is not None:
+                logging.error("Warm replica failed to start with exception: %s", e)
+                del self._warm_replicas[replica_id]
+                self._kill_replica(replica)
+        for replica_id, replica in list(self._replicas.items()):
+            if not replica.run_task.done() or replica.run_task.cancelled():
+                continue
+            e = replica.run_task.exception()
+            if e is not None:
+                logging.error("Actor died with following exception: %s", e)
+                logging.warning("removing dead replica with ID: %s", replica_id)
+                del self._replicas[replica_id]
+                self._metrics_aggregator.remove_replica.remote(replica_id)
+                self._kill_replica(replica)
+
+    async def _drain_replica(self, replica: _Replica):
+        """Stops the replica once it has finished its in flight batches.
+
+        Shutting down the source stops it from pulling, and its `run` returns
+        once every batch it already pulled has been processed and acked.
+        """
+        if not replica.started:
+            # The actor is still pending creation so there is nothing to
+            # drain.
+            replica.run_task.cancel()
+            self._kill_replica(replica)
+            return
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(
+                asyncio.wrap_future(replica.actor.shutdown.remote().future()),
+                timeout=_DRAIN_TIMEOUT_SECS,
+            )
+            remaining = _DRAIN_TIMEOUT_SECS - (time.monotonic() - start)
+            await asyncio.wait_for(replica.run_task, timeout=max(remaining, 0))
+        except asyncio.TimeoutError:
+            logging.warning(
+                "replica did not finish its in flight batches within %s "
+                "seconds, killing it.",
+                _DRAIN_TIMEOUT_SECS,
+            )
+        except Exception as e:
+            logging.error("Actor died while draining with exception: %s", e)
+        self.drain_time_histogram.observe(time.monotonic() - start)
+        self._kill_replica(replica)
+
+    def _remove_replicas(self, replicas_to_remove: int):
+        """Removes replicas and drains them in the background.
+
+        Draining can take up to `_DRAIN_TIMEOUT_SECS`, so it doesn't hold up
+        the check in loop.
+        """
+        to_remove = _pick_replicas_to_remove(
+            self._replicas, self._last_metrics, replicas_to_remove
+        )
+        for replica_id in to_remove:
+            replica = self._replicas.pop(replica_id)
+            self._metrics_aggregator.remove_replica.remote(replica_id)
+            drain = asyncio.ensure_future(self._drain_replica(replica))
+            drain.add_done_callback(
+                lambda _, replica_id=replica_id: self._drains.pop(replica_id, None)
+            )
+            self._drains[replica_id] = drain
+
+    def _stage_pool_cpus(self) -> float:
+        if self._stage_scaling is None:
+            return 0
+        processor_cpus = self.processor_ref.processor_instance.num_cpus()
+        sink_cpus = self.processor_ref.sink.num_cpus()
+        return (
+            len(self._processor_pool.members) * processor_cpus
+            + len(self._sink_pool.members) * sink_cpus
+        )
+
+    async def _request_replicas(self, desired_replicas: int) -> int:
+        """Returns the number of replicas the resource arbiter allows us."""
+        min_replicas = self.options.min_replicas
+        max_replicas = self.options.max_replicas
+        if not self.options.autoscaling:
+            min_replicas = max_replicas = desired_replicas
+        demand = resource_arbiter.ResourceDemand(
+            proc_id=self.proc_id,
+            desired_replicas=desired_replicas,
+            min_replicas=min_replicas,
+            max_replicas=max_replicas,
+            cpus_per_replica=self.cpu_per_replica,
+            priority=self.options.priority,
+            # The warm pool is reserved on top of the active replicas.
+            fixed_cpus=(
+                self._stage_pool_cpus()
+                + self.options.warm_pool_size * self.cpu_per_replica
+            ),
+        )
+        try:
+            return await self._arbiter.request_replicas.remote(demand)
+        except ray.exceptions.RayActorError:
+            # The last manager to shut down kills the arbiter, so create a
+            # new one.
+            self._arbiter = resource_arbiter.get_arbiter()
+            return await self._arbiter.request_replicas.remote(demand)
 
     async def run(self):
         # TODO: add better error handling for when an actor dies.
         start_replics = self.options.min_replicas
         if self.options.num_replicas:
             start_replics = self.options.num_replicas
-        if start_replics <= 0:
-            raise ValueError("min_replicas and num_replicas must be > 0")
-        max_replicas = auto_scaler.max_replicas_for_cluster(self.cpu_per_replica)
-        if start_replics > max_replicas:
+        if start_replics < 0:
+            raise ValueError("min_replicas and num_replicas must be >= 0")
+        if start_replics == 0 and not self.options.autoscaling:
+            raise ValueError(
+                "min_replicas and num_replicas must be > 0 when autoscaling is "
+                "disabled"
+            )
+        if self._stage_scaling is not None:
+            await self._processor_pool.resize(self._stage_scaling.min_processors)
+            await self._sink_pool.resize(self._stage_scaling.min_sinks)
+        num_start_replicas = await self._request_replicas(start_replics)
+        if num_start_replicas < start_replics:
             logging.warning(
                 "requested more replicas than your current cluster can handle."
                 " You can either start your cluster with more nodes or we "
                 "will scale up the number of replicas as more nodes are added."
             )
-            start_replics = max_replicas
         # Report number of replicas we're starting with.
-        self.num_replicas_gauge.set(start_replics)
-        for _ in range(start_replics):
-            self._add_replica()
+        self.num_replicas_gauge.set(num_start_replicas)
+        self._add_replicas(num_start_replicas)
+        self._refill_warm_pool()
         last_check_in = None
+        # How long the source has had no backlog and processed no messages.
+        idle_secs = 0
         while self.running:
             # Sleep until it's time for the next check in.
             await asyncio.sleep(_REPLICA_CHECK_IN)
@@ -196,63 +619,106 @@ class _StreamManagerActor:
                 last_check_in = now
                 continue
             if now - last_check_in > _REPLICA_CHECK_IN:
-                backlog = self.processor_ref.source.backlog()
+                try:
+                    backlog = self.processor_ref.source.backlog()
+                except Exception:
+                    logging.exception("failed to get the backlog of the source.")
+                    continue
                 if backlog is None:
                     continue
+                self._remove_dead_replicas()
                 events_processed = []
                 non_empty_ratios = []
-                metric_futures = {}
-                for replica_id, replica in self._replicas.items():
-                    actor, _ = replica
-                    metric_futures[replica_id] = actor.metrics.remote()
-                metrics = await _wait_for_metrics(metric_futures)
-                new_replicas = {}
+                queue_depths = []
+                message_ages = []
+                # Replicas that haven't reported yet are pending creation so
+                # they're not included in our metrics calculation. We still
+                # keep track of them for when they become ready.
+                metrics = await self._metrics_aggregator.collect.remote()
+                self._last_metrics = metrics
                 for replica_id, metric in metrics.items():
-                    if metric is not None and metric.failed:
-                        logging.warning("removing dead replica with ID: %s", replica_id)
-                        continue
-                    new_replicas[replica_id] = self._replicas[replica_id]
-                    if metric is None:
-                        # Actor was pending creation so don't include it in our
-                        # metrics calculation. We still want to keep track of
-                        # it though for when it becomes ready.
+                    if replica_id not in self._replicas:
                         continue
                     events_processed.append(metric.num_events)
                     non_empty_ratios.append(metric.non_empty_response_ratio)
+                    queue_depths.append(metric.queue_depth)
+                    message_ages.extend(metric.message_ages)
+                    self.queue_depth_gauge.set(
+                        metric.queue_depth, tags={"ReplicaID": replica_id}
+                    )
 
                 total_events_process = sum(events_processed)
                 if total_events_process > 0:
                     self.num_events_counter.inc(total_events_process)
-                self._replicas = new_replicas
                 num_replicas = len(self._replicas)
+                idle_secs = _update_idle_secs(
+                    idle_secs, backlog, total_events_process, now - last_check_in
+                )
                 if self.options.autoscaling:
-                    new_num_replicas = (
-                        auto_scaler.get_recommended_num_replicas(  # noqa: E501
-                            current_num_replicas=num_replicas,
-                            backlog=backlog,
-                            events_processed_per_replica=events_processed,
-                            non_empty_ratio_per_replica=non_empty_ratios,
-                            time_since_last_check=(now - last_check_in),
-                            autoscaling_options=self.options,
-                            cpus_per_replica=self.cpu_per_replica,
+                    desired_replicas = None
+                    if num_replicas:
+                        if self._stage_scaling is not None:
+                            await self._processor_pool.rebalance(now - last_check_in)
+                            await self._sink_pool.rebalance(now - last_check_in)
+                        desired_replicas = self._policy.desired_num_replicas(
+                            auto_scaler.ScalingMetrics(
+                                current_num_replicas=num_replicas,
+                                backlog=backlog,
+                                events_processed_per_replica=events_processed,
+                                non_empty_ratio_per_replica=non_empty_ratios,
+                                time_since_last_check=(now - last_check_in),
+                                queue_depth_per_replica=queue_depths,
+                                message_ages=message_ages,
+                            ),
+                            self.options,
+                        )
+                    new_num_replicas = await self._request_replicas(
+                        _scale_to_zero_replicas(
+                            num_replicas,
+                            desired_replicas,
+                            backlog,
+                            idle_secs,
+                            self.options.scale_to_zero_idle_secs,
                         )
                     )
                 else:
                     # Ensure we restart any dead replicas to get back to what
                     # the user requested.
-                    new_num_replicas = start_replics
+                    new_num_replicas = await self._request_replicas(start_replics)
+                if new_num_replicas != num_replicas:
+                    logging.warning(
+                        "resizing from %s replicas to %s replicas",
+                        num_replicas,
+                        new_num_replicas,
+                    )
                 # Report new number of replicas from the scaling event.
                 self.num_replicas_gauge.set(new_num_replicas)
                 if new_num_replicas > num_replicas:
-                    replicas_to_add = new_num_replicas - num_replicas
-                    for _ in range(replicas_to_add):
-                        self._add_replica()
+                    self._add_replicas(new_num_replicas - num_replicas)
                 elif new_num_replicas < num_replicas:
                     replicas_to_remove = num_replicas - new_num_replicas
-                    await self._remove_replicas(replicas_to_remove)
+                    self._remove_replicas(replicas_to_remove)
+                # Replace the warm replicas that were activated or died.
+                self._refill_warm_pool()
                 last_check_in = now
 
-        await self._remove_replicas(len(self._replicas))
+        self._remove_replicas(len(self._replicas))
+        await asyncio.gather(*self._drains.values())
+        for replica in self._warm_replicas.values():
+            replica.setup_task.cancel()
+            self._kill_replica(replica)
+        self._warm_replicas = {}
+        if self._stage_scaling is not None:
+            await self._processor_pool.shutdown()
+            await self._sink_pool.shutdown()
+        ray.kill(self._metrics_aggregator, no_restart=True)
+        try:
+            if not await self._arbiter.remove.remote(self.proc_id):
+                # The arbiter is detached, so it has to be cleaned up by the
+                # last manager using it.
+                ray.kill(self._arbiter, no_restart=True)
+        except ray.exceptions.RayActorError:
+            pass
 
     def shutdown(self):
         self.running = False
@@ -0,0 +1,153 @@
+import unittest
+from concurrent import futures
+from unittest import mock
+
+from buildflow.runtime.managers import metrics_aggregator
+from buildflow.runtime.managers import stream_manager
+
+
+def _replica(created_at: float, started: bool = True):
+    return stream_manager._Replica(owners=[], created_at=created_at, started=started)
+
+
+class PickReplicasToRemoveTest(unittest.TestCase):
+    def test_pending_replicas_first(self):
+        replicas = {
+            "old": _replica(1),
+            "pending": _replica(2, started=False),
+        }
+        metrics = {"old": metrics_aggregator.ReplicaMetrics(num_events=100)}
+
+        to_remove = stream_manager._pick_replicas_to_remove(replicas, metrics, 1)
+
+        self.assertEqual(["pending"], to_remove)
+
+    def test_least_loaded_replicas(self):
+        replicas = {"busy": _replica(1), "idle": _replica(2), "medium": _replica(3)}
+        metrics = {
+            "busy": metrics_aggregator.ReplicaMetrics(num_events=100),
+            "idle": metrics_aggregator.ReplicaMetrics(num_events=0),
+            "medium": metrics_aggregator.ReplicaMetrics(num_events=10, queue_depth=5),
+        }
+
+        to_remove = stream_manager._pick_replicas_to_remove(replicas, metrics, 2)
+
+        self.assertEqual(["idle", "medium"], to_remove)
+
+    def test_newest_replicas_break_ties(self):
+        replicas = {"old": _replica(1), "new": _replica(3), "middle": _replica(2)}
+        metrics = {
+            replica_id: metrics_aggregator.ReplicaMetrics(num_events=10)
+            for replica_id in replicas
+        }
+
+        to_remove = stream_manager._pick_replicas_to_remove(replicas, metrics, 2)
+
+        self.assertEqual(["new", "middle"], to_remove)
+
+
+def _warm_replica(created_at: float, ready: bool):
+    setup_task = futures.Future()
+    if ready:
+        setup_task.set_result(None)
+    return stream_manager._Replica(
+        owners=[], created_at=created_at, setup_task=setup_task
+    )
+
+
+class PickWarmReplicasTest(unittest.TestCase):
+    def test_ready_replicas_first(self):
+        warm_replicas = {
+            "pending": _warm_replica(1, ready=False),
+            "ready": _warm_replica(2, ready=True),
+        }
+
+        to_activate = stream_manager._pick_warm_replicas(warm_replicas, 1)
+
+        self.assertEqual(["ready"], to_activate)
+
+    def test_oldest_replicas_break_ties(self):
+        warm_replicas = {
+            "new": _warm_replica(3, ready=False),
+            "old": _warm_replica(1, ready=False),
+            "middle": _warm_replica(2, ready=False),
+        }
+
+        to_activate = stream_manager._pick_warm_replicas(warm_replicas, 2)
+
+        self.assertEqual(["old", "middle"], to_activate)
+
+    def test_fewer_warm_replicas_than_requested(self):
+        warm_replicas = {"ready": _warm_replica(1, ready=True)}
+
+        to_activate = stream_manager._pick_warm_replicas(warm_replicas, 3)
+
+        self.assertEqual(["ready"], to_activate)
+
+
+class UpdateIdleSecsTest(unittest.TestCase):
+    def test_idle_time_accumulates(self):
+        self.assertEqual(15, stream_manager._update_idle_secs(10, 0, 0, 5))
+
+    def test_backlog_resets_idle_time(self):
+        self.assertEqual(0, stream_manager._update_idle_secs(10, 3, 0, 5))
+
+    def test_processed_events_reset_idle_time(self):
+        self.assertEqual(0, stream_manager._update_idle_secs(10, 0, 7, 5))
+
+
+class ScaleToZeroReplicasTest(unittest.TestCase):
+    def test_holds_last_replica_until_idle(self):
+        num_replicas = stream_manager._scale_to_zero_replicas(
+            1, 0, 0, idle_secs=299, scale_to_zero_idle_secs=300
+        )
+
+        self.assertEqual(1, num_replicas)
+
+    def test_scales_to_zero_once_idle(self):
+        num_replicas = stream_manager._scale_to_zero_replicas(
+            1, 0, 0, idle_secs=300, scale_to_zero_idle_secs=300
+        )
+
+        self.assertEqual(0, num_replicas)
+
+    def test_keeps_desired_replicas(self):
+        num_replicas = stream_manager._scale_to_zero_replicas(
+            2, 3, 10, idle_secs=0, scale_to_zero_idle_secs=300
+        )
+
+        self.assertEqual(3, num_replicas)
+
+    def test_cold_starts_on_backlog(self):
+        num_replicas = stream_manager._scale_to_zero_replicas(
+            0, None, 5, idle_secs=0, scale_to_zero_idle_secs=300
+        )
+
+        self.assertEqual(1, num_replicas)
+
+    def test_stays_at_zero_without_backlog(self):
+        num_replicas = stream_manager._scale_to_zero_replicas(
+            0, None, 0, idle_secs=600, scale_to_zero_idle_secs=300
+        )
+
+        self.assertEqual(0, num_replicas)
+
+    def test_warm_pool_supplies_cold_start_replica(self):
+        actor = mock.Mock()
+        warm_replica = _warm_replica(1, ready=True)
+        actor._warm_replicas = {"warm": warm_replica}
+        num_replicas = stream_manager._scale_to_zero_replicas(
+            0, None, 5, idle_secs=0, scale_to_zero_idle_secs=300
+        )
+
+        stream_manager._StreamManagerActor.__ray_actor_class__._add_replicas(
+            actor, num_replicas
+        )
+
+        actor._run_replica.assert_called_once_with("warm", warm_replica)
+        actor._add_replica.assert_not_called()
+        self.assertEqual({}, actor._warm_replicas)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, Union
 
 from buildflow.api import ProcessorAPI, SourceType, SinkType, node, options
 from buildflow.runtime.processor import processor
@@ -16,8 +16,24 @@ class Node(node.NodeAPI):
         sink: Optional[SinkType] = None,
         num_cpus: float = 0.5,
         autoscaling_options: options.AutoscalingOptions = options.AutoscalingOptions(),
+        vectorized: bool = False,
+        fuse_replicas: bool = False,
+        flow_control_options: options.FlowControlOptions = options.FlowControlOptions(),
+        batching_options: options.BatchingOptions = options.BatchingOptions(),
+        source_concurrency: Optional[Union[int, str]] = None,
     ):
-        return processor(self._runtime, source, sink, num_cpus, autoscaling_options)
+        return processor(
+            self._runtime,
+            source,
+            sink,
+            num_cpus,
+            autoscaling_options,
+            vectorized,
+            fuse_replicas,
+            flow_control_options,
+            batching_options,
+            source_concurrency,
+        )
 
     def add_processor(self, processor: ProcessorAPI):
         self._runtime.register_processor(processor)
@@ -1,13 +1,40 @@
 import inspect
-from typing import Optional
+from typing import Any, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
 
 from buildflow import utils
-from buildflow.api import ProcessorAPI, AutoscalingOptions
-from buildflow.api.io import SinkType, SourceType
-from buildflow.runtime import Runtime
+from buildflow.api import (
+    ProcessorAPI,
+    AutoscalingOptions,
+    BatchingOptions,
+    FlowControlOptions,
+)
+from buildflow.api.io import SinkType, Source, SourceType
+from buildflow.runtime import Runtime, encoders
 from buildflow.runtime.ray_io import empty_io
 
 
+def _preprocess_batch(source: SourceType, batch: Any) -> Any:
+    if isinstance(batch, list):
+        return [source.preprocess(element) for element in batch]
+    if type(source).preprocess is Source.preprocess:
+        # The default preprocess step is a no-op, so columnar batches can be
+        # passed to the processor as is.
+        return batch
+    if isinstance(batch, pd.DataFrame):
+        rows = _preprocess_rows(source, batch.to_dict("records"))
+        return pd.DataFrame.from_records(rows)
+    if isinstance(batch, pa.Table):
+        return pa.Table.from_pylist(_preprocess_rows(source, batch.to_pylist()))
+    return batch
+
+
+def _preprocess_rows(source: SourceType, rows: List[Any]) -> List[Any]:
+    return [encoders.encode(source.preprocess(row)) for row in rows]
+
+
 class Processor(ProcessorAPI):
     @classmethod
     def sink(self) -> SinkType:
@@ -22,7 +49,16 @@ class Processor(ProcessorAPI):
     def process(self, payload):
         return payload
 
+    def _process_batch(self, batch):
+        return self.process_batch(_preprocess_batch(self.source(), batch))
+
+    def is_vectorized(self) -> bool:
+        # Processors are vectorized if they override `process_batch`.
+        return type(self).process_batch is not ProcessorAPI.process_batch
+
     def processor_arg_spec(self):
+        if self.is_vectorized():
+            return inspect.getfullargspec(self.process_batch)
         return inspect.getfullargspec(self.process)
 
 
@@ -32,6 +68,11 @@ def processor(
     sink: Optional[SinkType] = None,
     num_cpus: float = 0.5,
     autoscaling_options: AutoscalingOptions = AutoscalingOptions(),
+    vectorized: bool = False,
+    fuse_replicas: bool = False,
+    flow_control_options: FlowControlOptions = FlowControlOptions(),
+    batching_options: BatchingOptions = BatchingOptions(),
+    source_concurrency: Optional[Union[int, str]] = None,
 ):
     if sink is None:
         sink = empty_io.EmptySink()
@@ -53,15 +94,24 @@ def processor(
                 "sinks": lambda self: [],
                 "setup": lambda self: None,
                 "process": lambda self, payload: original_function(payload),
+                "process_batch": lambda self, batch: original_function(batch),
                 "processor_arg_spec": lambda self: inspect.getfullargspec(
                     original_function
                 ),
                 "_process": lambda self, payload: original_function(
                     self.source().preprocess(payload)
                 ),
+                "_process_batch": lambda self, batch: original_function(
+                    _preprocess_batch(self.source(), batch)
+                ),
+                "is_vectorized": lambda self: vectorized,
                 "num_cpus": lambda self: num_cpus,
+                "fuse_replicas": lambda self: fuse_replicas,
                 "__call__": wrapper_function,
                 "autoscaling_options": lambda self: autoscaling_options,
+                "flow_control_options": lambda self: flow_control_options,
+                "batching_options": lambda self: batching_options,
+                "source_concurrency": lambda self: source_concurrency,
             },
         )
         processor_instance = _AdHocProcessor()
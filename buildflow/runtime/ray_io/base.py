@@ -1,13 +1,31 @@
 """Base class for all Ray IO Connectors"""
 
 import asyncio
-import dacite
+import concurrent.futures
 import dataclasses
+import functools
+import inspect
+import logging
 import os
-from typing import Any, Callable, Dict, Iterable, Optional, Type, Union
-
+import random
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
+
+import pyarrow as pa
 import ray
 
+from buildflow.runtime import decoders, encoders
 from buildflow.runtime import tracer as t
 from buildflow import utils
 
@@ -36,16 +54,269 @@ def _data_tracing_enabled() -> bool:
     return "ENABLE_FLOW_DATA_TRACING" in os.environ
 
 
+def decode_elements(elements: Iterable[Any], input_type: Optional[Type]) -> List[Any]:
+    """Converts raw dictionaries into the processor's input dataclass."""
+    if not dataclasses.is_dataclass(input_type):
+        return elements
+    # The decoder is compiled once per type and leaves existing instances of
+    # the dataclass untouched.
+    decoder = decoders.get_decoder(input_type)
+    return [decoder(elem) for elem in elements]
+
+
+def _flatten(results: Iterable[Any]) -> List[Any]:
+    flattened = []
+    for result in results:
+        if isinstance(result, (tuple, list)):
+            # Flatten the results if a list was returned.
+            flattened.extend(result)
+        else:
+            flattened.append(result)
+    return flattened
+
+
+def flatten_results(results: Iterable[Any]) -> List[Any]:
+    """Flattens the output of a processor into a list of sink ready rows.
+
+    Processors may return a single element or a list of elements per input,
+    and dataclasses are converted to json compatible dictionaries.
+    """
+    return [encoders.encode(elem) for elem in _flatten(results)]
+
+
+def results_to_record_batch(results: Iterable[Any]) -> Any:
+    """Flattens the output of a processor into a pyarrow RecordBatch.
+
+    Dataclass outputs are encoded straight into arrow columns without building
+    a dictionary per row.
+    """
+    flattened = _flatten(results)
+    try:
+        batch = encoders.to_record_batch(flattened)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        batch = None
+    if batch is not None:
+        return batch
+    return to_record_batch([encoders.encode(elem) for elem in flattened])
+
+
+def to_record_batch(elements: Any) -> Any:
+    """Converts a list of dictionaries to a pyarrow RecordBatch.
+
+    Anything that can't be represented as a RecordBatch (ray datasets,
+    dataclasses, primitives) is returned unchanged so columnar mode is always
+    safe to enable.
+    """
+    if isinstance(elements, pa.RecordBatch):
+        return elements
+    if not isinstance(elements, (list, tuple)) or not elements:
+        return elements
+    if not all(isinstance(elem, dict) for elem in elements):
+        return elements
+    try:
+        return pa.RecordBatch.from_pylist(list(elements))
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        logging.warning(
+            "unable to convert batch to a RecordBatch, falling back to rows."
+        )
+        return elements
+
+
+def to_rows(elements: Any) -> Any:
+    """Converts a RecordBatch back into a list of dictionaries."""
+    if isinstance(elements, pa.RecordBatch):
+        return elements.to_pylist()
+    return elements
+
+
+class _LocalMethod:
+    def __init__(self, method: Callable) -> None:
+        self._method = method
+
+    def remote(self, *args, **kwargs) -> asyncio.Future:
+        try:
+            result = self._method(*args, **kwargs)
+        except Exception as e:
+            future = asyncio.get_running_loop().create_future()
+            future.set_exception(e)
+            return future
+        if inspect.isawaitable(result):
+            return asyncio.ensure_future(result)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(result)
+        return future
+
+
+class LocalActorHandle:
+    """Wraps an object that lives in the current process in a ray actor API.
+
+    This lets sources, sinks, and processors that normally talk to each other
+    through `handle.method.remote(...)` run inside of the same actor without
+    any serialization.
+    """
+
+    def __init__(self, instance: Any) -> None:
+        self.instance = instance
+
+    def __getattr__(self, name: str) -> _LocalMethod:
+        if name.startswith("__"):
+            # Keeps pickle from looking up special methods on the instance
+            # before it has been restored.
+            raise AttributeError(name)
+        return _LocalMethod(getattr(self.instance, name))
+
+
+def local_actor(actor_cls: Any, *args, **kwargs) -> LocalActorHandle:
+    """Constructs a ray actor class in the current process."""
+    return LocalActorHandle(actor_cls.__ray_actor_class__(*args, **kwargs))
+
+
+def _num_bytes(elements: Any) -> int:
+    if isinstance(elements, pa.RecordBatch):
+        return elements.nbytes
+    return sum(len(encoders.to_json_bytes(elem)) for elem in elements)
+
+
+def _concat(chunks: List[Any]) -> Any:
+    """Concatenates buffered sink inputs into a single batch."""
+    if len(chunks) == 1:
+        return chunks[0]
+    if all(isinstance(chunk, pa.RecordBatch) for chunk in chunks):
+        try:
+            table = pa.Table.from_batches(chunks).combine_chunks()
+            batches = table.to_batches()
+            if len(batches) == 1:
+                return batches[0]
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # The schemas don't match so we fall back to rows.
+            pass
+    concatenated = []
+    for chunk in chunks:
+        concatenated.extend(to_rows(chunk))
+    return concatenated
+
+
+# The max latency of a sink buffer that only has a size bound, so a buffer
+# that is partially filled (e.g. at the tail of a stream) is still written.
+_DEFAULT_MAX_BATCH_LATENCY_SECS = 1
+
+
+class SinkBuffer:
+    """Buffers sink inputs across `write` calls.
+
+    The buffer is written out once it reaches `max_rows` or `max_bytes`, or
+    once the oldest buffered row has waited `max_latency_secs`. Every `add`
+    call only returns after the write containing its rows has finished, so
+    sources still only ack data that has been written. A write can contain the
+    rows of several calls, so buffered calls return None instead of the result
+    of the write. If only a size bound is set `max_latency_secs` defaults to
+    `_DEFAULT_MAX_BATCH_LATENCY_SECS`.
+    """
+
+    def __init__(
+        self,
+        write_fn: Callable[[Any], Awaitable[Any]],
+        max_rows: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_latency_secs: Optional[float] = None,
+    ) -> None:
+        self._write_fn = write_fn
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        if max_latency_secs is None and (max_rows is not None or max_bytes is not None):
+            max_latency_secs = _DEFAULT_MAX_BATCH_LATENCY_SECS
+        self.max_latency_secs = max_latency_secs
+        self._chunks = []
+        self._futures = []
+        self._num_rows = 0
+        self._num_bytes = 0
+        self._timer = None
+
+    def _is_full(self) -> bool:
+        if self.max_rows is not None and self._num_rows >= self.max_rows:
+            return True
+        if self.max_bytes is not None and self._num_bytes >= self.max_bytes:
+            return True
+        return False
+
+    async def add(self, elements: Any) -> Any:
+        num_rows = (
+            elements.num_rows if isinstance(elements, pa.RecordBatch) else len(elements)
+        )
+        if not num_rows:
+            return await self._write_fn(elements)
+        future = asyncio.get_event_loop().create_future()
+        self._chunks.append(elements)
+        self._futures.append(future)
+        self._num_rows += num_rows
+        if self.max_bytes is not None:
+            self._num_bytes += _num_bytes(elements)
+        if self._is_full():
+            asyncio.ensure_future(self.flush())
+        elif self._timer is None and self.max_latency_secs is not None:
+            self._timer = asyncio.ensure_future(self._flush_after_latency())
+        return await future
+
+    async def _flush_after_latency(self):
+        await asyncio.sleep(self.max_latency_secs)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Writes out everything that is currently buffered.
+
+        The callers whose rows were written get None, since the result of the
+        write covers the rows of every caller.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        chunks, self._chunks = self._chunks, []
+        futures, self._futures = self._futures, []
+        self._num_rows = 0
+        self._num_bytes = 0
+        if not chunks:
+            return
+        try:
+            await self._write_fn(_concat(chunks))
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
+
+
 class RaySink:
     """Base class for all ray sinks."""
 
     def __init__(self, remote_fn: Callable) -> None:
         self.remote_fn = remote_fn
         self.data_tracing_enabled = _data_tracing_enabled()
+        self._buffer = None
+
+    def configure_batching(
+        self,
+        max_rows: Optional[int],
+        max_bytes: Optional[int],
+        max_latency_secs: Optional[float],
+    ):
+        """Buffers outputs across `write` calls, see `SinkBuffer`."""
+        if max_rows is None and max_bytes is None and max_latency_secs is None:
+            self._buffer = None
+            return
+        self._buffer = SinkBuffer(self._write, max_rows, max_bytes, max_latency_secs)
+
+    async def flush(self):
+        """Writes out any buffered outputs, e.g. before the sink is stopped."""
+        if self._buffer is not None:
+            await self._buffer.flush()
 
     async def _write(
         self,
-        elements: Union[ray.data.Dataset, Iterable[Dict[str, Any]]],
+        elements: Union[ray.data.Dataset, pa.RecordBatch, Iterable[Dict[str, Any]]],
     ):
         raise NotImplementedError(
             f"`_write` method not implemented for class {self.__class__}"
@@ -53,7 +324,7 @@ class RaySink:
 
     async def write(
         self,
-        elements: Union[ray.data.Dataset, Iterable[Dict[str, Any]]],
+        elements: Union[ray.data.Dataset, pa.RecordBatch, Iterable[Dict[str, Any]]],
         context: Dict[str, str] = {},
     ):
         if isinstance(elements, ray.data.Dataset):
@@ -61,31 +332,28 @@ class RaySink:
             # since the remote function expects a list of elements.
             temp = await self.remote_fn.process_batch.remote([elements])
             results = temp[0]
+        elif isinstance(elements, pa.RecordBatch):
+            # In columnar mode the process actor hands back a RecordBatch that
+            # is already flattened, so we pass it straight through to the sink.
+            results = await self.remote_fn.process_batch.remote(elements)
         else:
             temp_results = await self.remote_fn.process_batch.remote(elements)
-            results = []
-            for result in temp_results:
-                if isinstance(result, (tuple, list)):
-                    middle_result = []
-                    for elem in result:
-                        if dataclasses.is_dataclass(elem):
-                            middle_result.append(utils.dataclass_to_json(elem))
-                        else:
-                            middle_result.append(elem)
-                    # Flatten the results if a list was returned.
-                    results.extend(middle_result)
-                elif dataclasses.is_dataclass(result):
-                    results.append(utils.dataclass_to_json(result))
-                else:
-                    results.append(result)
+            if isinstance(temp_results, pa.RecordBatch):
+                # Vectorized processors can return columnar output even if the
+                # source sent rows.
+                results = temp_results
+            else:
+                results = flatten_results(temp_results)
 
         if self.data_tracing_enabled:
             add_to_trace(
                 key=self.__class__.__name__,
-                value={"output_data": results},
+                value={"output_data": to_rows(results)},
                 context=context,
             )
 
+        if self._buffer is not None and not isinstance(results, ray.data.Dataset):
+            return await self._buffer.add(results)
         return await self._write(results)
 
 
@@ -93,10 +361,17 @@ class RaySource:
     """Base class for all ray sources."""
 
     def __init__(
-        self, ray_sinks: Dict[str, RaySink], processor_input_type: Optional[Type]
+        self,
+        ray_sinks: Dict[str, RaySink],
+        processor_input_type: Optional[Type],
+        columnar: bool = False,
     ) -> None:
         self.ray_sinks = ray_sinks
         self.processor_input_type = processor_input_type
+        # If true batches are shipped to the sinks as pyarrow RecordBatches
+        # instead of lists of dictionaries. This is much cheaper to serialize
+        # when moving between actors.
+        self.columnar = columnar
         self.data_tracing_enabled = _data_tracing_enabled()
 
     async def run(self):
@@ -123,18 +398,12 @@ class RaySource:
         return [(io_ref,)] * num_replicas
 
     async def _send_batch_to_sinks_and_await(self, elements):
-        if dataclasses.is_dataclass(self.processor_input_type):
-            new_elements = []
-            for elem in elements:
-                if not dataclasses.is_dataclass(elem):
-                    new_elements.append(
-                        dacite.from_dict(
-                            data_class=self.processor_input_type, data=elem
-                        )
-                    )
-                else:
-                    new_elements.append(elem)
-            elements = new_elements
+        if self.columnar:
+            # Dataclass conversion happens in the process actor when running
+            # in columnar mode, so we can ship the raw rows as a RecordBatch.
+            elements = to_record_batch(elements)
+        if not isinstance(elements, pa.RecordBatch):
+            elements = decode_elements(elements, self.processor_input_type)
         result_keys = []
         task_refs = []
         for name, ray_sink in self.ray_sinks.items():
@@ -146,41 +415,512 @@ class RaySource:
         return dict(zip(result_keys, result_values))
 
 
+# Value for `source_concurrency` that measures the best concurrency at startup.
+AUTO_CONCURRENCY = "auto"
+_MAX_AUTO_CONCURRENCY = 32
+_AUTOTUNE_PROBE_SECS = 5
+# Adding more pull loops must improve throughput by at least 10% to be kept.
+_AUTOTUNE_MIN_IMPROVEMENT = 1.1
+# How often sources push their metrics to the metrics aggregator.
+_METRICS_REPORT_INTERVAL_SECS = 1
+# How often sinks are flushed while a stopped source waits for its batches.
+_DRAIN_FLUSH_INTERVAL_SECS = 0.1
+# The max number of message ages a source keeps between metric reports.
+_MAX_MESSAGE_AGE_SAMPLES = 1000
+
+
+@dataclasses.dataclass
+class PulledBatch:
+    """A batch of messages pulled by a streaming source."""
+
+    payloads: List[Any]
+    # Source specific information needed to ack the batch (e.g. ack ids).
+    ack_info: Any = None
+    # The approximate size of the batch, used for byte based flow control.
+    num_bytes: int = 0
+    # The unix timestamps the messages were published at, for sources that
+    # know them. Used to measure the end to end latency of messages.
+    publish_times: Optional[List[float]] = None
+    # The ordering key of every message, for sources that support ordering.
+    # An empty key means the message is not ordered. When this is set
+    # `ack_info` has to be a list with an entry per message, so the batch can
+    # be split up by key.
+    ordering_keys: Optional[List[str]] = None
+
+
+def split_by_ordering_key(batch: PulledBatch) -> Dict[str, PulledBatch]:
+    """Splits a batch into one batch per ordering key.
+
+    The messages of every key keep the order they were pulled in. The bytes of
+    the batch are split up by the number of messages.
+    """
+    indices: Dict[str, List[int]] = {}
+    for i, key in enumerate(batch.ordering_keys):
+        indices.setdefault(key, []).append(i)
+    split = {}
+    for key, key_indices in indices.items():
+        publish_times = None
+        if batch.publish_times:
+            publish_times = [batch.publish_times[i] for i in key_indices]
+        split[key] = PulledBatch(
+            payloads=[batch.payloads[i] for i in key_indices],
+            ack_info=[batch.ack_info[i] for i in key_indices],
+            num_bytes=batch.num_bytes * len(key_indices) // len(batch.payloads),
+            publish_times=publish_times,
+            ordering_keys=[key] * len(key_indices),
+        )
+    return split
+
+
+class CreditGate:
+    """Tracks the credits a sink has granted to a source.
+
+    Credits are taken when a batch is sent to the sinks and returned once the
+    sinks have finished writing it. A single batch is always allowed through
+    when nothing is outstanding, so a batch larger than the window can't
+    deadlock the source.
+    """
+
+    def __init__(
+        self, max_records: Optional[int] = None, max_bytes: Optional[int] = None
+    ) -> None:
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.outstanding_records = 0
+        self.outstanding_bytes = 0
+        # Created lazily so it is bound to the actor's event loop.
+        self._condition = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _has_credits(self, num_records: int, num_bytes: int) -> bool:
+        if self.outstanding_records == 0 and self.outstanding_bytes == 0:
+            return True
+        if (
+            self.max_records is not None
+            and self.outstanding_records + num_records > self.max_records
+        ):
+            return False
+        if (
+            self.max_bytes is not None
+            and self.outstanding_bytes + num_bytes > self.max_bytes
+        ):
+            return False
+        return True
+
+    async def wait_for_credits(self):
+        """Blocks until there is at least some credit left."""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self._has_credits(1, 0))
+
+    async def acquire(self, num_records: int, num_bytes: int):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self._has_credits(num_records, num_bytes))
+            self.outstanding_records += num_records
+            self.outstanding_bytes += num_bytes
+
+    async def release(self, num_records: int, num_bytes: int):
+        condition = self._get_condition()
+        async with condition:
+            self.outstanding_records -= num_records
+            self.outstanding_bytes -= num_bytes
+            condition.notify_all()
+
+
 class StreamingRaySource(RaySource):
+    """Base class for all streaming ray sources.
+
+    Subclasses implement `pull` and `ack`, and `run` takes care of pipelining
+    them. While up to `max_in_flight_batches` batches are being processed by
+    the sinks the next batch is already being pulled, and every batch is acked
+    as soon as it completes.
+
+    Pulling is also throttled by the credits granted by the sinks, see
+    `configure_flow_control`.
+
+    `run` starts `concurrency` pull loops. Sources with blocking clients should
+    call them through `run_blocking` so the loops actually overlap.
+
+    Sources that set `ordered` and return `PulledBatch.ordering_keys` have
+    every batch split up by ordering key. Different keys are processed in
+    parallel, while the messages of a key are processed one batch at a time in
+    the order they were pulled. If a batch of a key fails, the batches of that
+    key that were pulled after it are nacked without being processed, so they
+    are redelivered in order.
+    """
+
+    # Whether the source returns ordering keys that have to be respected.
+    ordered = False
+
     def __init__(
         self,
         ray_sinks: Dict[str, RaySink],
         processor_input_type: Type,
+        columnar: bool = False,
+        max_in_flight_batches: int = 1,
     ) -> None:
-        super().__init__(ray_sinks, processor_input_type)
+        super().__init__(ray_sinks, processor_input_type, columnar)
+        if max_in_flight_batches < 1:
+            raise ValueError("max_in_flight_batches must be at least 1.")
+        self.max_in_flight_batches = max_in_flight_batches
+        self.running = True
+        self._credits = CreditGate()
+        self.concurrency = 1
+        self._auto_concurrency = False
+        self._executor = None
         self._num_events = 0
+        self._total_events = 0
         self._empty_responses = 0
         self._requests = 0
         self._secs = 0
+        # A sample of the seconds between publishing and acking messages since
+        # the last metrics report.
+        self._message_ages: List[float] = []
+        self._num_acked_with_age = 0
+        # Ordered batches are pulled one at a time so the order of the pulls
+        # matches the order the source returned them in.
+        self._pull_lock = asyncio.Lock()
+        # The future resolved by the last batch of every ordering key with the
+        # batch's success, which the next batch of the key waits for.
+        self._ordering_key_tails: Dict[str, asyncio.Future] = {}
         self._replica_id = utils.uuid()
+        self._metrics_aggregator = None
+        self._metrics_report_interval_secs = _METRICS_REPORT_INTERVAL_SECS
+
+    def configure_flow_control(
+        self,
+        max_outstanding_records: Optional[int],
+        max_outstanding_bytes: Optional[int],
+    ):
+        """Sets the credit window granted to this source by its sinks."""
+        self._credits.max_records = max_outstanding_records
+        self._credits.max_bytes = max_outstanding_bytes
+
+    def configure_concurrency(self, concurrency: Union[int, str]):
+        """Sets the number of concurrent pull loops for the source.
+
+        If `concurrency` is "auto" the source starts with a single loop and
+        keeps doubling the number of loops while it improves throughput.
+        """
+        if concurrency == AUTO_CONCURRENCY:
+            self._auto_concurrency = True
+            self.concurrency = 1
+            return
+        if concurrency < 1:
+            raise ValueError("source concurrency must be at least 1.")
+        self._auto_concurrency = False
+        self.concurrency = concurrency
+
+    def configure_metrics_reporting(
+        self,
+        aggregator: Any,
+        replica_id: str,
+        interval_secs: float = _METRICS_REPORT_INTERVAL_SECS,
+    ):
+        """Pushes the metrics of this source to `aggregator` while running.
+
+        `aggregator` is a `MetricsAggregatorActor` handle, and the metrics are
+        reported under `replica_id` every `interval_secs`.
+        """
+        self._metrics_aggregator = aggregator
+        self._replica_id = replica_id
+        self._metrics_report_interval_secs = interval_secs
+
+    async def run_blocking(self, fn: Callable, *args, **kwargs) -> Any:
+        """Runs a blocking function in a thread without blocking the loop."""
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                thread_name_prefix=self.__class__.__name__
+            )
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    async def pull(self) -> PulledBatch:
+        """Pulls the next batch of messages from the source.
+
+        An empty batch should be returned if no messages were available.
+        """
+        raise NotImplementedError(
+            f"`pull` method not implemented for class {self.__class__}"
+        )
+
+    async def ack(self, ack_info: Any, success: bool):
+        """Acks the batch if `success` is true, otherwise nacks it.
+
+        `ack_info` is the value returned in `PulledBatch.ack_info` for the
+        batch. By default this does nothing, for sources that don't support
+        acking.
+        """
+        pass
+
+    async def _send(self, batch: PulledBatch) -> bool:
+        try:
+            await self._send_batch_to_sinks_and_await(batch.payloads)
+            return True
+        except Exception:
+            logging.exception("Failed to process batch, will not be acked.")
+            return False
+
+    async def _ack(self, batch: PulledBatch, success: bool):
+        try:
+            await self.ack(batch.ack_info, success)
+        except Exception:
+            logging.exception("Failed to ack batch.")
+            return
+        if success and batch.publish_times:
+            self._record_message_ages(batch.publish_times)
+
+    async def _process_and_ack(self, batch: PulledBatch):
+        try:
+            success = await self._send(batch)
+        finally:
+            # The sinks are done with the batch so its credits are returned.
+            await self._credits.release(len(batch.payloads), batch.num_bytes)
+        await self._ack(batch, success)
+
+    def _sequence_by_ordering_key(
+        self, batch: PulledBatch
+    ) -> List[Tuple[PulledBatch, Optional[asyncio.Future], Optional[asyncio.Future]]]:
+        # Called right after the batch is pulled, without yielding to the loop,
+        # so every key's batches are chained up in the order they were pulled.
+        # Returns every key's batch with the future of the previous batch of
+        # the key, and the future to resolve once the batch is done.
+        sequenced = []
+        for key, key_batch in split_by_ordering_key(batch).items():
+            if not key:
+                sequenced.append((key_batch, None, None))
+                continue
+            previous = self._ordering_key_tails.get(key)
+            done = asyncio.get_event_loop().create_future()
+            self._ordering_key_tails[key] = done
+            sequenced.append((key_batch, previous, done))
+        return sequenced
+
+    async def _process_and_ack_key(
+        self,
+        batch: PulledBatch,
+        previous: Optional[asyncio.Future],
+        done: Optional[asyncio.Future],
+    ):
+        success = False
+        try:
+            success = True if previous is None else await previous
+            if success:
+                success = await self._send(batch)
+            else:
+                logging.warning(
+                    "An earlier batch of ordering key %s failed, nacking %s "
+                    "messages so they are redelivered in order.",
+                    batch.ordering_keys[0],
+                    len(batch.payloads),
+                )
+            await self._ack(batch, success)
+        finally:
+            if done is not None:
+                done.set_result(success)
+                key = batch.ordering_keys[0]
+                if self._ordering_key_tails.get(key) is done:
+                    del self._ordering_key_tails[key]
+
+    async def _process_and_ack_ordered(
+        self,
+        batch: PulledBatch,
+        sequenced: List[
+            Tuple[PulledBatch, Optional[asyncio.Future], Optional[asyncio.Future]]
+        ],
+    ):
+        try:
+            await asyncio.gather(
+                *[
+                    self._process_and_ack_key(key_batch, previous, done)
+                    for key_batch, previous, done in sequenced
+                ]
+            )
+        finally:
+            await self._credits.release(len(batch.payloads), batch.num_bytes)
+
+    def _record_message_ages(self, publish_times: List[float]):
+        # Reservoir sampling keeps the sample uniform over every message acked
+        # since the last report, no matter how many there were.
+        now = time.time()
+        for publish_time in publish_times:
+            self._num_acked_with_age += 1
+            if len(self._message_ages) < _MAX_MESSAGE_AGE_SAMPLES:
+                self._message_ages.append(now - publish_time)
+                continue
+            i = random.randrange(self._num_acked_with_age)
+            if i < _MAX_MESSAGE_AGE_SAMPLES:
+                self._message_ages[i] = now - publish_time
+
+    async def _pull_loop(self, stopped: asyncio.Event):
+        in_flight = set()
+        while self.running and not stopped.is_set():
+            # Stop pulling while the sinks are not granting any more credits.
+            await self._credits.wait_for_credits()
+            sequenced = None
+            try:
+                if self.ordered:
+                    async with self._pull_lock:
+                        batch = await self.pull()
+                        if batch.ordering_keys:
+                            sequenced = self._sequence_by_ordering_key(batch)
+                else:
+                    batch = await self.pull()
+            except Exception:
+                logging.exception("Failed to pull batch.")
+                # Back off a little so a failing source doesn't spin.
+                await asyncio.sleep(1)
+                continue
+            self.update_metrics(len(batch.payloads))
+            if not batch.payloads:
+                continue
+            # The batch has already been pulled, so we only wait for a slot
+            # before sending it out. This overlaps pulling with processing.
+            while len(in_flight) >= self.max_in_flight_batches:
+                _, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+            await self._credits.acquire(len(batch.payloads), batch.num_bytes)
+            if sequenced is not None:
+                process = self._process_and_ack_ordered(batch, sequenced)
+            else:
+                process = self._process_and_ack(batch)
+            in_flight.add(asyncio.ensure_future(process))
+        # Finish and ack any outstanding batches before exiting. Their outputs
+        # may be sitting in a sink buffer that won't fill up anymore, so the
+        # sinks are flushed until every batch is done.
+        while in_flight:
+            await self._flush_sinks()
+            _, in_flight = await asyncio.wait(
+                in_flight, timeout=_DRAIN_FLUSH_INTERVAL_SECS
+            )
+
+    async def _flush_sinks(self):
+        flushes = []
+        for ray_sink in self.ray_sinks.values():
+            flush = getattr(ray_sink, "flush", None)
+            if flush is not None:
+                flushes.append(flush.remote())
+        for result in await asyncio.gather(*flushes, return_exceptions=True):
+            if isinstance(result, Exception):
+                logging.error("Failed to flush sink: %s", result)
+
+    async def _events_per_sec(self, secs: float) -> float:
+        start = self._total_events
+        await asyncio.sleep(secs)
+        return (self._total_events - start) / secs
+
+    async def _autotune_concurrency(self, loops: List[Tuple[asyncio.Event, Any]]):
+        # Wait until there is traffic, there is nothing to measure otherwise.
+        best_rate = 0
+        while self.running and not best_rate:
+            best_rate = await self._events_per_sec(_AUTOTUNE_PROBE_SECS)
+        while self.running and len(loops) < _MAX_AUTO_CONCURRENCY:
+            added = []
+            for _ in range(len(loops)):
+                stopped = asyncio.Event()
+                added.append((stopped, asyncio.ensure_future(self._pull_loop(stopped))))
+            loops.extend(added)
+            rate = await self._events_per_sec(_AUTOTUNE_PROBE_SECS)
+            if rate < best_rate * _AUTOTUNE_MIN_IMPROVEMENT:
+                # The extra loops didn't help, so stop them and keep what we
+                # had before.
+                for stopped, _ in added:
+                    stopped.set()
+                break
+            best_rate = rate
+        self.concurrency = len([loop for loop in loops if not loop[0].is_set()])
+        logging.info("measured best source concurrency: %s", self.concurrency)
+
+    async def _report_metrics(self):
+        num_events = self._num_events
+        requests = self._requests
+        empty_responses = self._empty_responses
+        message_ages = self._message_ages
+        self._num_events = 0
+        self._requests = 0
+        self._empty_responses = 0
+        self._message_ages = []
+        self._num_acked_with_age = 0
+        try:
+            await self._metrics_aggregator.report.remote(
+                self._replica_id,
+                num_events,
+                requests,
+                empty_responses,
+                self._credits.outstanding_records,
+                message_ages,
+            )
+        except Exception:
+            logging.exception("Failed to report metrics.")
+
+    async def _report_metrics_loop(self, stopped: asyncio.Event):
+        while not stopped.is_set():
+            try:
+                await asyncio.wait_for(
+                    stopped.wait(), self._metrics_report_interval_secs
+                )
+            except asyncio.TimeoutError:
+                pass
+            # This also reports anything that happened since the last report
+            # once the source has stopped.
+            await self._report_metrics()
+
+    async def run(self):
+        reporter = None
+        if self._metrics_aggregator is not None:
+            reporter_stopped = asyncio.Event()
+            reporter = asyncio.ensure_future(
+                self._report_metrics_loop(reporter_stopped)
+            )
+        loops = []
+        for _ in range(self.concurrency):
+            stopped = asyncio.Event()
+            loops.append((stopped, asyncio.ensure_future(self._pull_loop(stopped))))
+        if self._auto_concurrency:
+            await self._autotune_concurrency(loops)
+        # Loops can be added while autotuning so we gather all of them here.
+        await asyncio.gather(*[task for _, task in loops])
+        if reporter is not None:
+            reporter_stopped.set()
+            await reporter
 
     def update_metrics(self, num_events: int):
         self._num_events += num_events
+        self._total_events += num_events
         self._requests += 1
         if not num_events:
             self._empty_responses += 1
 
-    def metrics(self) -> float:
-        """Returns the utilization of the source since this was last called.
+    def metrics(self) -> Tuple[int, float, int, int]:
+        """Returns the utilization of the source since the last metrics report.
 
         This should be float between 0 and 1. 0 indicates that no works has
         been done. 1 indicates the most possible work has been done.
+
+        The last value is the queue depth of the replica, the number of records
+        that have been sent to the sinks but not written yet.
+
+        This doesn't reset the metrics, they're only reset when they're pushed
+        to the metrics aggregator.
         """
-        num_events_to_return = self._num_events
         if self._requests != 0:
             empty_response_ratio = self._empty_responses / self._requests
         else:
             empty_response_ratio = 0
-        requests = self._requests
-        self._num_events = 0
-        self._empty_responses = 0
-        self._requests = 0
-        return num_events_to_return, empty_response_ratio, requests
+        return (
+            self._num_events,
+            empty_response_ratio,
+            self._requests,
+            self._credits.outstanding_records,
+        )
 
     def shutdown(self):
         """Performs any shutdown work that is needed for the actor.
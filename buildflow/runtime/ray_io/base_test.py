@@ -0,0 +1,519 @@
+import asyncio
+import pickle
+import threading
+import time
+import unittest
+from typing import Optional
+from unittest import mock
+
+from buildflow.runtime.managers import metrics_aggregator
+from buildflow.runtime.ray_io import base
+
+
+class _Counter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def incr(self, amount: int) -> int:
+        self.count += amount
+        return self.count
+
+    async def async_incr(self, amount: int) -> int:
+        await asyncio.sleep(0)
+        return self.incr(amount)
+
+    def fail(self):
+        raise ValueError("failed")
+
+
+class LocalActorHandleTest(unittest.TestCase):
+    def test_sync_and_async_methods(self):
+        handle = base.LocalActorHandle(_Counter())
+
+        async def run():
+            first = await handle.incr.remote(1)
+            second = await handle.async_incr.remote(2)
+            return first, second
+
+        self.assertEqual((1, 3), asyncio.run(run()))
+
+    def test_pickle(self):
+        counter = _Counter()
+        counter.incr(5)
+
+        handle = pickle.loads(pickle.dumps(base.LocalActorHandle(counter)))
+
+        self.assertEqual(5, handle.instance.count)
+
+    def test_exception_is_raised_on_await(self):
+        handle = base.LocalActorHandle(_Counter())
+
+        async def run():
+            future = handle.fail.remote()
+            with self.assertRaisesRegex(ValueError, "failed"):
+                await future
+
+        asyncio.run(run())
+
+
+class RecordBatchTest(unittest.TestCase):
+    def test_to_record_batch_round_trip(self):
+        rows = [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}]
+
+        batch = base.to_record_batch(rows)
+
+        self.assertEqual(2, batch.num_rows)
+        self.assertEqual(rows, base.to_rows(batch))
+
+    def test_to_record_batch_leaves_non_dicts(self):
+        self.assertEqual([1, 2], base.to_record_batch([1, 2]))
+
+
+class _SlowSink:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def write(self, elements):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.05)
+        self.in_flight -= 1
+        if elements == ["bad"]:
+            raise ValueError("bad element")
+        return elements
+
+
+class _FakeStreamingSource(base.StreamingRaySource):
+    def __init__(
+        self,
+        ray_sinks,
+        batches,
+        max_in_flight_batches: int,
+        publish_time: Optional[float] = None,
+    ) -> None:
+        super().__init__(ray_sinks, None, max_in_flight_batches=max_in_flight_batches)
+        self.batches = batches
+        self.publish_time = publish_time
+        self.acked = []
+        self.nacked = []
+
+    async def pull(self) -> base.PulledBatch:
+        await asyncio.sleep(0)
+        if not self.batches:
+            self.running = False
+            return base.PulledBatch([])
+        batch = self.batches.pop(0)
+        publish_times = None
+        if self.publish_time is not None:
+            publish_times = [self.publish_time] * len(batch)
+        return base.PulledBatch(batch, ack_info=batch[0], publish_times=publish_times)
+
+    async def ack(self, ack_info, success: bool):
+        if success:
+            self.acked.append(ack_info)
+        else:
+            self.nacked.append(ack_info)
+
+
+class SinkBufferTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.writes = []
+
+    async def write(self, elements):
+        self.writes.append(elements)
+        if elements == ["bad"]:
+            raise ValueError("bad element")
+        return len(elements)
+
+    def test_flush_on_max_rows(self):
+        buffer = base.SinkBuffer(self.write, max_rows=3)
+
+        async def run():
+            return await asyncio.gather(buffer.add([1]), buffer.add([2, 3]))
+
+        self.assertEqual([None, None], asyncio.run(run()))
+        self.assertEqual([[1, 2, 3]], self.writes)
+
+    def test_flush_on_max_latency(self):
+        buffer = base.SinkBuffer(self.write, max_rows=100, max_latency_secs=0.05)
+
+        async def run():
+            return await asyncio.gather(buffer.add([1]), buffer.add([2]))
+
+        self.assertEqual([None, None], asyncio.run(run()))
+        self.assertEqual([[1, 2]], self.writes)
+
+    def test_flush_on_max_bytes(self):
+        buffer = base.SinkBuffer(self.write, max_bytes=20)
+
+        async def run():
+            return await asyncio.gather(
+                buffer.add([{"a": "0123456789"}]), buffer.add([{"a": "0123456789"}])
+            )
+
+        self.assertEqual([None, None], asyncio.run(run()))
+
+    def test_size_only_buffer_flushes_partial_tail(self):
+        with mock.patch.object(base, "_DEFAULT_MAX_BATCH_LATENCY_SECS", 0.05):
+            buffer = base.SinkBuffer(self.write, max_rows=100)
+
+        async def run():
+            return await asyncio.wait_for(
+                asyncio.gather(buffer.add([1]), buffer.add([2, 3])), timeout=5
+            )
+
+        self.assertEqual([None, None], asyncio.run(run()))
+        self.assertEqual([[1, 2, 3]], self.writes)
+
+    def test_flush_writes_buffered_rows(self):
+        buffer = base.SinkBuffer(self.write, max_rows=100, max_latency_secs=60)
+
+        async def run():
+            add = asyncio.ensure_future(buffer.add([1]))
+            await asyncio.sleep(0)
+            await buffer.flush()
+            return await add
+
+        self.assertIsNone(asyncio.run(run()))
+        self.assertEqual([[1]], self.writes)
+
+    def test_failed_write_fails_every_caller(self):
+        buffer = base.SinkBuffer(self.write, max_latency_secs=0.01)
+
+        async def run():
+            return await asyncio.gather(buffer.add(["bad"]), return_exceptions=True)
+
+        (result,) = asyncio.run(run())
+        self.assertIsInstance(result, ValueError)
+
+    def test_record_batches_are_concatenated(self):
+        buffer = base.SinkBuffer(self.write, max_rows=2)
+
+        async def run():
+            await asyncio.gather(
+                buffer.add(base.to_record_batch([{"a": 1}])),
+                buffer.add(base.to_record_batch([{"a": 2}])),
+            )
+
+        asyncio.run(run())
+
+        self.assertEqual([{"a": 1}, {"a": 2}], base.to_rows(self.writes[0]))
+
+
+class CreditGateTest(unittest.TestCase):
+    def test_acquire_blocks_until_release(self):
+        gate = base.CreditGate(max_records=10, max_bytes=100)
+
+        async def run():
+            await gate.acquire(8, 10)
+            blocked = asyncio.ensure_future(gate.acquire(5, 10))
+            await asyncio.sleep(0.01)
+            self.assertFalse(blocked.done())
+            await gate.release(8, 10)
+            await blocked
+            return gate.outstanding_records, gate.outstanding_bytes
+
+        self.assertEqual((5, 10), asyncio.run(run()))
+
+    def test_oversized_batch_is_allowed_when_idle(self):
+        gate = base.CreditGate(max_bytes=100)
+
+        async def run():
+            await gate.acquire(1, 1000)
+            return gate.outstanding_bytes
+
+        self.assertEqual(1000, asyncio.run(run()))
+
+
+class _BlockingStreamingSource(base.StreamingRaySource):
+    def __init__(self, ray_sinks, num_batches: int) -> None:
+        super().__init__(ray_sinks, None, max_in_flight_batches=4)
+        self.num_batches = num_batches
+        self.pulls = 0
+        self.concurrent_pulls = 0
+        self.max_concurrent_pulls = 0
+        self.lock = threading.Lock()
+
+    def _blocking_pull(self):
+        with self.lock:
+            self.concurrent_pulls += 1
+            self.max_concurrent_pulls = max(
+                self.max_concurrent_pulls, self.concurrent_pulls
+            )
+        time.sleep(0.1)
+        with self.lock:
+            self.concurrent_pulls -= 1
+
+    async def pull(self) -> base.PulledBatch:
+        if self.pulls >= self.num_batches:
+            self.running = False
+            return base.PulledBatch([])
+        self.pulls += 1
+        await self.run_blocking(self._blocking_pull)
+        return base.PulledBatch([self.pulls])
+
+
+class _OrderingSink:
+    def __init__(self) -> None:
+        self.events = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def write(self, elements):
+        self.events.append(("start", elements))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.05)
+        self.in_flight -= 1
+        self.events.append(("end", elements))
+        if "bad" in elements:
+            raise ValueError("bad element")
+        return elements
+
+
+class _OrderedStreamingSource(base.StreamingRaySource):
+    ordered = True
+
+    def __init__(self, ray_sinks, batches) -> None:
+        super().__init__(ray_sinks, None, max_in_flight_batches=2)
+        self.batches = batches
+        self.acked = []
+        self.nacked = []
+
+    async def pull(self) -> base.PulledBatch:
+        await asyncio.sleep(0)
+        if not self.batches:
+            self.running = False
+            return base.PulledBatch([])
+        batch = self.batches.pop(0)
+        values = [value for _, value in batch]
+        return base.PulledBatch(
+            values, ack_info=values, ordering_keys=[key for key, _ in batch]
+        )
+
+    async def ack(self, ack_info, success: bool):
+        if success:
+            self.acked.extend(ack_info)
+        else:
+            self.nacked.extend(ack_info)
+
+
+class _Passthrough:
+    async def process_batch(self, elements):
+        return elements
+
+
+class _BufferedSink(base.RaySink):
+    def __init__(self) -> None:
+        super().__init__(base.LocalActorHandle(_Passthrough()))
+        self.writes = []
+
+    async def _write(self, elements):
+        self.writes.append(elements)
+
+
+class StreamingRaySourceTest(unittest.TestCase):
+    def test_run_flushes_sinks_when_stopping(self):
+        sink = _BufferedSink()
+        sink.configure_batching(max_rows=100, max_bytes=None, max_latency_secs=60)
+        source = _FakeStreamingSource(
+            {"sink": base.LocalActorHandle(sink)},
+            [[1], [2]],
+            max_in_flight_batches=2,
+        )
+
+        async def run():
+            await asyncio.wait_for(source.run(), timeout=5)
+
+        asyncio.run(run())
+
+        self.assertEqual([1, 2], sorted(source.acked))
+        self.assertEqual([1, 2], sorted(sum(sink.writes, [])))
+
+    def test_run_limits_in_flight_batches(self):
+        sink = _SlowSink()
+        source = _FakeStreamingSource(
+            {"sink": base.LocalActorHandle(sink)},
+            [[i] for i in range(6)],
+            max_in_flight_batches=3,
+        )
+
+        asyncio.run(source.run())
+
+        self.assertEqual(3, sink.max_in_flight)
+        self.assertEqual(list(range(6)), sorted(source.acked))
+        self.assertEqual([], source.nacked)
+
+    def test_run_nacks_failed_batches(self):
+        sink = _SlowSink()
+        source = _FakeStreamingSource(
+            {"sink": base.LocalActorHandle(sink)},
+            [["good"], ["bad"]],
+            max_in_flight_batches=2,
+        )
+
+        asyncio.run(source.run())
+
+        self.assertEqual(["good"], source.acked)
+        self.assertEqual(["bad"], source.nacked)
+
+    def test_run_waits_for_credits(self):
+        sink = _SlowSink()
+        source = _FakeStreamingSource(
+            {"sink": base.LocalActorHandle(sink)},
+            [[i] for i in range(6)],
+            max_in_flight_batches=5,
+        )
+        source.configure_flow_control(
+            max_outstanding_records=2, max_outstanding_bytes=None
+        )
+
+        asyncio.run(source.run())
+
+        self.assertEqual(2, sink.max_in_flight)
+        self.assertEqual(list(range(6)), sorted(source.acked))
+        self.assertEqual(0, source.metrics()[3])
+
+    def test_run_blocking_pull_loops_overlap(self):
+        source = _BlockingStreamingSource(
+            {"sink": base.LocalActorHandle(_SlowSink())}, num_batches=8
+        )
+        source.configure_concurrency(4)
+
+        start = time.monotonic()
+        asyncio.run(source.run())
+
+        self.assertEqual(4, source.max_concurrent_pulls)
+        # 8 blocking pulls of 0.1s each, 4 at a time.
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    @mock.patch.object(base, "_AUTOTUNE_PROBE_SECS", 0.2)
+    def test_auto_concurrency(self):
+        source = _BlockingStreamingSource(
+            {"sink": base.LocalActorHandle(_SlowSink())}, num_batches=1000
+        )
+        source.configure_concurrency(base.AUTO_CONCURRENCY)
+
+        async def run():
+            task = asyncio.ensure_future(source.run())
+            await asyncio.sleep(2)
+            source.running = False
+            await task
+
+        asyncio.run(run())
+
+        # Pulls are blocking and take a fixed amount of time, so more loops
+        # keep helping until the max is reached or the pool is saturated.
+        self.assertGreater(source.concurrency, 1)
+
+    def test_run_reports_metrics(self):
+        aggregator = metrics_aggregator.MetricsAggregatorActor.__ray_actor_class__()
+        source = _FakeStreamingSource(
+            {"sink": base.LocalActorHandle(_SlowSink())},
+            [[i] for i in range(6)],
+            max_in_flight_batches=2,
+        )
+        source.configure_metrics_reporting(
+            base.LocalActorHandle(aggregator), "replica", interval_secs=0.01
+        )
+
+        asyncio.run(source.run())
+
+        metrics = aggregator.collect()
+        self.assertEqual(6, metrics["replica"].num_events)
+        self.assertEqual(0, metrics["replica"].queue_depth)
+
+    def test_metrics_are_only_reset_by_reports(self):
+        aggregator = metrics_aggregator.MetricsAggregatorActor.__ray_actor_class__()
+        source = _FakeStreamingSource(
+            {"sink": base.LocalActorHandle(_SlowSink())}, [], max_in_flight_batches=1
+        )
+        source.configure_metrics_reporting(base.LocalActorHandle(aggregator), "replica")
+        source.update_metrics(3)
+        source.update_metrics(0)
+
+        self.assertEqual((3, 0.5, 2, 0), source.metrics())
+        self.assertEqual((3, 0.5, 2, 0), source.metrics())
+
+        asyncio.run(source._report_metrics())
+
+        self.assertEqual(3, aggregator.collect()["replica"].num_events)
+        self.assertEqual((0, 0, 0, 0), source.metrics())
+
+    def test_run_reports_message_ages(self):
+        aggregator = metrics_aggregator.MetricsAggregatorActor.__ray_actor_class__()
+        source = _FakeStreamingSource(
+            {"sink": base.LocalActorHandle(_SlowSink())},
+            [[i] for i in range(6)],
+            max_in_flight_batches=2,
+            publish_time=time.time() - 5,
+        )
+        source.configure_metrics_reporting(
+            base.LocalActorHandle(aggregator), "replica", interval_secs=0.01
+        )
+
+        asyncio.run(source.run())
+
+        message_ages = aggregator.collect()["replica"].message_ages
+        self.assertEqual(6, len(message_ages))
+        for age in message_ages:
+            self.assertGreaterEqual(age, 5)
+
+    def test_split_by_ordering_key(self):
+        batch = base.PulledBatch(
+            ["a1", "b1", "a2", "c1"],
+            ack_info=[1, 2, 3, 4],
+            num_bytes=8,
+            publish_times=[10, 20, 30, 40],
+            ordering_keys=["a", "b", "a", ""],
+        )
+
+        split = base.split_by_ordering_key(batch)
+
+        self.assertEqual(["a", "b", ""], list(split))
+        self.assertEqual(["a1", "a2"], split["a"].payloads)
+        self.assertEqual([1, 3], split["a"].ack_info)
+        self.assertEqual(4, split["a"].num_bytes)
+        self.assertEqual([10, 30], split["a"].publish_times)
+        self.assertEqual(["c1"], split[""].payloads)
+
+    def test_run_orders_messages_by_key(self):
+        sink = _OrderingSink()
+        source = _OrderedStreamingSource(
+            {"sink": base.LocalActorHandle(sink)},
+            [[("a", "a1"), ("b", "b1")], [("a", "a2"), ("b", "b2")]],
+        )
+
+        asyncio.run(source.run())
+
+        # Different keys are written in parallel.
+        self.assertEqual(2, sink.max_in_flight)
+        # The batch of a key only starts once the previous one finished.
+        for key in ["a", "b"]:
+            self.assertLess(
+                sink.events.index(("end", [f"{key}1"])),
+                sink.events.index(("start", [f"{key}2"])),
+            )
+        self.assertCountEqual(["a1", "a2", "b1", "b2"], source.acked)
+
+    def test_run_nacks_messages_after_failed_key(self):
+        sink = _OrderingSink()
+        source = _OrderedStreamingSource(
+            {"sink": base.LocalActorHandle(sink)},
+            [[("a", "bad"), ("b", "b1")], [("a", "a2"), ("b", "b2")]],
+        )
+
+        asyncio.run(source.run())
+
+        self.assertCountEqual(["b1", "b2"], source.acked)
+        self.assertEqual(["bad", "a2"], source.nacked)
+        self.assertNotIn(("start", ["a2"]), sink.events)
+
+    def test_invalid_max_in_flight_batches(self):
+        with self.assertRaises(ValueError):
+            _FakeStreamingSource({}, [], max_in_flight_batches=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
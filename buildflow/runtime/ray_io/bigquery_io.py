@@ -11,6 +11,7 @@ from typing import Any, Callable, Dict, Iterable, List, Optional, Type, Union
 from google.api_core import exceptions
 from google.cloud import bigquery, bigquery_storage_v1
 import pyarrow as pa
+import pyarrow.parquet as pq
 import ray
 
 from buildflow import utils
@@ -253,6 +254,9 @@ class BigQuerySink(io.Sink):
     def actor(self, remote_fn: Callable, is_streaming: bool):
         return BigQuerySinkActor.remote(remote_fn, self, is_streaming)
 
+    def local_actor(self, remote_fn: Callable, is_streaming: bool):
+        return base.local_actor(BigQuerySinkActor, remote_fn, self, is_streaming)
+
 
 @ray.remote
 def _load_arrow_table_from_stream(stream: str, project: str) -> pa.Table:
@@ -351,6 +355,30 @@ def json_rows_load_job(
     )
 
 
+@ray.remote
+def record_batch_load_job(
+    record_batch: pa.RecordBatch,
+    bigquery_table_id: str,
+    gcs_bucket: str,
+    project: str,
+    billing_project: str,
+) -> str:
+    storage_client = clients.get_storage_client(billing_project)
+    bucket = storage_client.bucket(gcs_bucket)
+    job_uuid = utils.uuid()
+    buffer = pa.BufferOutputStream()
+    pq.write_table(pa.Table.from_batches([record_batch]), buffer)
+    batch_blob = bucket.blob(f"{job_uuid}/{job_uuid}.parquet")
+    batch_blob.upload_from_string(buffer.getvalue().to_pybytes())
+    gcs_glob_uri = f"gs://{gcs_bucket}/{job_uuid}/*"
+    return run_load_job_and_wait(
+        bigquery_table_id,
+        gcs_glob_uri,
+        bigquery.SourceFormat.PARQUET,
+        project,
+    )
+
+
 @ray.remote
 def ray_dataset_load_job(
     dataset: ray.data.Dataset, bigquery_table_id: str, gcs_bucket: str, project: str
@@ -387,15 +415,42 @@ class BigQuerySinkActor(base.RaySink):
 
     async def _write(
         self,
-        elements: Union[ray.data.Dataset, Iterable[Dict[str, Any]]],
+        elements: Union[ray.data.Dataset, pa.RecordBatch, Iterable[Dict[str, Any]]],
     ):
+        # Load jobs are scheduled outside of the replica's placement group,
+        # which only reserves resources for the replica's actors.
         tasks = []
         if isinstance(elements, ray.data.Dataset):
             tasks.append(
-                ray_dataset_load_job.remote(
+                ray_dataset_load_job.options(scheduling_strategy="DEFAULT").remote(
                     elements, self.bq_table_id, self.temp_gcs_bucket, self.project
                 )
             )
+        elif isinstance(elements, pa.RecordBatch):
+            for i in range(0, elements.num_rows, self._BATCH_SIZE):
+                batch = elements.slice(i, self._BATCH_SIZE)
+                if self.use_streaming:
+                    # The streaming API only accepts json rows, so we only pay
+                    # for the row conversion right before the insert.
+                    errors = self.bq_client.insert_rows_json(
+                        self.bq_table_id, batch.to_pylist()
+                    )
+                    if errors:
+                        raise RuntimeError(
+                            f"BigQuery streaming insert failed: {errors}"
+                        )
+                else:
+                    tasks.append(
+                        record_batch_load_job.options(
+                            scheduling_strategy="DEFAULT"
+                        ).remote(
+                            batch,
+                            self.bq_table_id,
+                            self.temp_gcs_bucket,
+                            self.project,
+                            self.project,
+                        )
+                    )
         else:
             for i in range(0, len(elements), self._BATCH_SIZE):
                 batch = elements[i : i + self._BATCH_SIZE]
@@ -408,13 +463,17 @@ class BigQuerySinkActor(base.RaySink):
                 elif isinstance(batch[0], ray.data.Dataset):
                     for ds in batch:
                         tasks.append(
-                            ray_dataset_load_job.remote(
+                            ray_dataset_load_job.options(
+                                scheduling_strategy="DEFAULT"
+                            ).remote(
                                 ds, self.bq_table_id, self.temp_gcs_bucket, self.project
                             )
                         )
                 else:
                     tasks.append(
-                        json_rows_load_job.remote(
+                        json_rows_load_job.options(
+                            scheduling_strategy="DEFAULT"
+                        ).remote(
                             batch, self.bq_table_id, self.temp_gcs_bucket, self.project
                         )
                     )
@@ -0,0 +1,267 @@
+"""Codecs for the payloads of streaming connectors.
+
+A codec converts output elements into message payloads and back. Sinks stamp
+every message with the content type of their codec (and the compression of
+the payload, if any), so sources pick the matching decoder per message, and a
+topic can be migrated from one codec to another without draining it first.
+
+Codecs that need an optional dependency check for it when they're created,
+so you only need to install the packages of the codecs you use:
+    - JsonCodec uses orjson if it's installed, and the json module otherwise
+    - MsgPackCodec needs msgpack
+    - AvroCodec needs fastavro
+    - Compression.ZSTD needs zstandard
+"""
+
+import enum
+import io
+import json
+import logging
+from typing import Any, Dict, Mapping, Optional, Type
+
+from buildflow.runtime import encoders
+
+try:
+    import fastavro
+except ImportError:
+    fastavro = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The message attributes the content type and compression are stamped in.
+CONTENT_TYPE_ATTRIBUTE = "content-type"
+CONTENT_ENCODING_ATTRIBUTE = "content-encoding"
+# Attributes that are only used to decode payloads, so they're not handed to
+# processors.
+RESERVED_ATTRIBUTES = frozenset([CONTENT_TYPE_ATTRIBUTE, CONTENT_ENCODING_ATTRIBUTE])
+
+
+def _require(module: Any, name: str, feature: str):
+    if module is None:
+        raise ImportError(
+            f"{feature} requires the {name} package, install it with: "
+            f"pip install {name}"
+        )
+
+
+class Codec:
+    """Base class for all codecs."""
+
+    content_type = ""
+
+    def encode(self, value: Any) -> bytes:
+        raise NotImplementedError(
+            f"`encode` method not implemented for class {self.__class__}"
+        )
+
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError(
+            f"`decode` method not implemented for class {self.__class__}"
+        )
+
+
+class JsonCodec(Codec):
+    """Encodes elements as utf-8 json."""
+
+    content_type = "application/json"
+
+    def encode(self, value: Any) -> bytes:
+        if orjson is None:
+            return encoders.to_json_bytes(value)
+        try:
+            return orjson.dumps(encoders.encode(value))
+        except TypeError:
+            # orjson is stricter than the json module, e.g. it doesn't support
+            # integers that don't fit in 64 bits.
+            return encoders.to_json_bytes(value)
+
+    def decode(self, data: bytes) -> Any:
+        if not data:
+            return {}
+        if orjson is None:
+            return json.loads(data)
+        return orjson.loads(data)
+
+
+class MsgPackCodec(Codec):
+    """Encodes elements as MessagePack, a more compact binary json."""
+
+    content_type = "application/msgpack"
+
+    def __init__(self) -> None:
+        _require(msgpack, "msgpack", "MsgPackCodec")
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(encoders.encode(value))
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+class RawCodec(Codec):
+    """Passes payloads through as bytes.
+
+    Strings are encoded as utf-8, any other element has to be bytes.
+    """
+
+    content_type = "application/octet-stream"
+
+    def encode(self, value: Any) -> bytes:
+        if isinstance(value, str):
+            return value.encode("utf-8")
+        if not isinstance(value, (bytes, bytearray)):
+            raise ValueError(
+                f"RawCodec can only encode bytes or strings, got: {type(value)}"
+            )
+        return bytes(value)
+
+    def decode(self, data: bytes) -> Any:
+        return data
+
+
+class AvroCodec(Codec):
+    """Encodes elements as schemaless Avro records of `schema`.
+
+    `schema` is the Avro schema as a dictionary, it isn't included in the
+    payloads so the sink and source have to use the same schema.
+    """
+
+    content_type = "avro/binary"
+
+    def __init__(self, schema: Dict[str, Any]) -> None:
+        _require(fastavro, "fastavro", "AvroCodec")
+        self.schema = schema
+        self._parsed_schema = fastavro.parse_schema(schema)
+
+    def encode(self, value: Any) -> bytes:
+        buffer = io.BytesIO()
+        fastavro.schemaless_writer(buffer, self._parsed_schema, encoders.encode(value))
+        return buffer.getvalue()
+
+    def decode(self, data: bytes) -> Any:
+        return fastavro.schemaless_reader(io.BytesIO(data), self._parsed_schema)
+
+
+class ProtobufCodec(Codec):
+    """Encodes elements as serialized protocol buffers of `message_type`.
+
+    Elements can be instances of `message_type` or dictionaries with its
+    fields. Payloads are decoded into instances of `message_type`.
+    """
+
+    content_type = "application/x-protobuf"
+
+    def __init__(self, message_type: Type) -> None:
+        self.message_type = message_type
+
+    def encode(self, value: Any) -> bytes:
+        if isinstance(value, self.message_type):
+            return value.SerializeToString()
+        from google.protobuf import json_format
+
+        return json_format.ParseDict(
+            encoders.encode(value), self.message_type()
+        ).SerializeToString()
+
+    def decode(self, data: bytes) -> Any:
+        return self.message_type.FromString(data)
+
+
+class Compression(enum.Enum):
+    NONE = ""
+    ZSTD = "zstd"
+
+
+# Codecs that can decode payloads from their content type alone.
+_CODECS_BY_CONTENT_TYPE = {
+    JsonCodec.content_type: JsonCodec,
+    MsgPackCodec.content_type: MsgPackCodec,
+    RawCodec.content_type: RawCodec,
+}
+
+
+class WireFormat:
+    """Encodes elements into message payloads and decodes them.
+
+    Payloads are encoded with `codec` and compressed with `compression`. When
+    decoding, the content type and encoding attributes of the message take
+    precedence, and `codec` and `compression` are used for messages without
+    them. Messages with a content type but no encoding are not compressed.
+    """
+
+    def __init__(
+        self, codec: Codec, compression: Compression = Compression.NONE
+    ) -> None:
+        if compression == Compression.ZSTD:
+            _require(zstandard, "zstandard", "zstd compression")
+        self.codec = codec
+        self.compression = compression
+        self._compressor = None
+        self._decompressor = None
+        self._codecs: Dict[str, Optional[Codec]] = {codec.content_type: codec}
+
+    def attributes(self) -> Dict[str, str]:
+        """Returns the attributes to stamp every encoded message with."""
+        attributes = {CONTENT_TYPE_ATTRIBUTE: self.codec.content_type}
+        if self.compression != Compression.NONE:
+            attributes[CONTENT_ENCODING_ATTRIBUTE] = self.compression.value
+        return attributes
+
+    def encode(self, value: Any) -> bytes:
+        data = self.codec.encode(value)
+        if self.compression == Compression.ZSTD:
+            if self._compressor is None:
+                self._compressor = zstandard.ZstdCompressor()
+            data = self._compressor.compress(data)
+        return data
+
+    def _codec_for(self, content_type: Optional[str]) -> Codec:
+        if not content_type:
+            return self.codec
+        codec = self._codecs.get(content_type)
+        if codec is None and content_type not in self._codecs:
+            codec_class = _CODECS_BY_CONTENT_TYPE.get(content_type)
+            if codec_class is None:
+                logging.warning(
+                    "no codec for content type: %s, decoding it with %s",
+                    content_type,
+                    self.codec.__class__.__name__,
+                )
+            else:
+                codec = codec_class()
+            self._codecs[content_type] = codec
+        return codec or self.codec
+
+    def _decompress(self, data: bytes, content_encoding: str) -> bytes:
+        if content_encoding != Compression.ZSTD.value:
+            raise ValueError(f"unsupported content encoding: {content_encoding}")
+        if self._decompressor is None:
+            _require(zstandard, "zstandard", "zstd compression")
+            self._decompressor = zstandard.ZstdDecompressor()
+        # Payloads compressed in streaming mode don't know their content size.
+        return self._decompressor.decompressobj().decompress(data)
+
+    def decode(self, data: bytes, attributes: Optional[Mapping[str, str]] = None):
+        """Decodes a payload with the codec of its attributes."""
+        attributes = attributes or {}
+        if CONTENT_TYPE_ATTRIBUTE in attributes:
+            # Sinks only stamp the encoding of compressed payloads, so a
+            # stamped message without one isn't compressed.
+            content_encoding = attributes.get(CONTENT_ENCODING_ATTRIBUTE, "")
+        else:
+            content_encoding = attributes.get(
+                CONTENT_ENCODING_ATTRIBUTE, self.compression.value
+            )
+        if content_encoding and data:
+            data = self._decompress(data, content_encoding)
+        return self._codec_for(attributes.get(CONTENT_TYPE_ATTRIBUTE)).decode(data)
@@ -0,0 +1,132 @@
+import dataclasses
+import datetime
+import pickle
+import unittest
+from unittest import mock
+
+from google.protobuf import descriptor_pb2
+
+from buildflow.runtime.ray_io import codecs
+
+
+@dataclasses.dataclass
+class _Output:
+    field: int
+    timestamp: datetime.datetime
+
+
+class CodecsTest(unittest.TestCase):
+    def test_json_round_trip(self):
+        codec = codecs.JsonCodec()
+        output = _Output(1, datetime.datetime(2023, 1, 2, 3, 4, 5))
+
+        decoded = codec.decode(codec.encode(output))
+
+        self.assertEqual({"field": 1, "timestamp": "2023-01-02T03:04:05"}, decoded)
+        self.assertEqual({}, codec.decode(b""))
+
+    def test_json_falls_back_for_big_integers(self):
+        codec = codecs.JsonCodec()
+
+        self.assertEqual(
+            {"field": 2**70}, codec.decode(codec.encode({"field": 2**70}))
+        )
+
+    @unittest.skipIf(codecs.msgpack is None, "requires msgpack")
+    def test_msgpack_round_trip(self):
+        codec = codecs.MsgPackCodec()
+
+        decoded = codec.decode(codec.encode({"field": [1, "a", b"b"]}))
+
+        self.assertEqual({"field": [1, "a", b"b"]}, decoded)
+
+    def test_raw_round_trip(self):
+        codec = codecs.RawCodec()
+
+        self.assertEqual(b"payload", codec.decode(codec.encode(b"payload")))
+        self.assertEqual(b"payload", codec.encode("payload"))
+        with self.assertRaises(ValueError):
+            codec.encode({"field": 1})
+
+    @unittest.skipIf(codecs.fastavro is None, "requires fastavro")
+    def test_avro_round_trip(self):
+        codec = codecs.AvroCodec(
+            {
+                "type": "record",
+                "name": "Output",
+                "fields": [{"name": "field", "type": "long"}],
+            }
+        )
+
+        self.assertEqual({"field": 1}, codec.decode(codec.encode({"field": 1})))
+
+    def test_protobuf_round_trip(self):
+        codec = codecs.ProtobufCodec(descriptor_pb2.FileDescriptorProto)
+        message = descriptor_pb2.FileDescriptorProto(name="file", package="pkg")
+
+        self.assertEqual(message, codec.decode(codec.encode(message)))
+        self.assertEqual(
+            message, codec.decode(codec.encode({"name": "file", "package": "pkg"}))
+        )
+
+    def test_codecs_can_be_pickled(self):
+        codec = pickle.loads(
+            pickle.dumps(codecs.ProtobufCodec(descriptor_pb2.FileDescriptorProto))
+        )
+
+        self.assertIs(descriptor_pb2.FileDescriptorProto, codec.message_type)
+
+
+class WireFormatTest(unittest.TestCase):
+    def test_attributes(self):
+        wire_format = codecs.WireFormat(codecs.JsonCodec())
+
+        self.assertEqual({"content-type": "application/json"}, wire_format.attributes())
+
+    @unittest.skipIf(codecs.msgpack is None, "requires msgpack")
+    def test_decoder_is_picked_by_content_type(self):
+        writer = codecs.WireFormat(codecs.MsgPackCodec())
+        reader = codecs.WireFormat(codecs.JsonCodec())
+
+        decoded = reader.decode(writer.encode({"field": 1}), writer.attributes())
+
+        self.assertEqual({"field": 1}, decoded)
+
+    def test_unknown_content_type_uses_codec(self):
+        wire_format = codecs.WireFormat(codecs.JsonCodec())
+
+        decoded = wire_format.decode(b'{"field": 1}', {"content-type": "text/unknown"})
+
+        self.assertEqual({"field": 1}, decoded)
+
+    def test_stamped_message_without_encoding_is_not_decompressed(self):
+        writer = codecs.WireFormat(codecs.JsonCodec())
+        zstandard = mock.Mock()
+        zstandard.ZstdDecompressor.side_effect = AssertionError("decompressed")
+        with mock.patch.object(codecs, "zstandard", zstandard):
+            reader = codecs.WireFormat(codecs.JsonCodec(), codecs.Compression.ZSTD)
+
+            decoded = reader.decode(writer.encode({"a": 1}), writer.attributes())
+
+        self.assertEqual({"a": 1}, decoded)
+
+    @unittest.skipIf(codecs.zstandard is None, "requires zstandard")
+    def test_zstd_round_trip(self):
+        writer = codecs.WireFormat(codecs.JsonCodec(), codecs.Compression.ZSTD)
+        reader = codecs.WireFormat(codecs.JsonCodec())
+        element = {"field": "a" * 1000}
+
+        data = writer.encode(element)
+
+        self.assertLess(len(data), 100)
+        self.assertEqual("zstd", writer.attributes()["content-encoding"])
+        self.assertEqual(element, reader.decode(data, writer.attributes()))
+
+    @unittest.skipIf(codecs.zstandard is not None, "zstandard is installed")
+    def test_zstd_requires_zstandard(self):
+        with self.assertRaisesRegex(ImportError, "pip install zstandard"):
+            codecs.WireFormat(codecs.JsonCodec(), codecs.Compression.ZSTD)
+
+
+if __name__ == "__main__":
+    unittest.main()
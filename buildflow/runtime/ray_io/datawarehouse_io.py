@@ -38,3 +38,6 @@ class DataWarehouseSink(io.Sink):
         return bigquery_io.BigQuerySinkActor.remote(
             remote_fn, self._cloud_sink, is_streaming
         )
+
+    def local_actor(self, remote_fn: Callable, is_streaming: bool):
+        return self._cloud_sink.local_actor(remote_fn, is_streaming)
@@ -7,6 +7,7 @@ from typing import Any, Callable, Dict, Iterable, Union
 
 import duckdb
 import pandas as pd
+import pyarrow as pa
 import ray
 
 from buildflow.api import io
@@ -79,7 +80,7 @@ class DuckDBSinkActor(base.RaySink):
 
     def _write(
         self,
-        element: Union[Dict[str, Any], Iterable[Dict[str, Any]]],
+        element: Union[Dict[str, Any], pa.RecordBatch, Iterable[Dict[str, Any]]],
     ):
         connect_tries = 0
         while connect_tries < _MAX_CONNECT_TRIES:
@@ -101,7 +102,9 @@ class DuckDBSinkActor(base.RaySink):
                     time.sleep(2)
                 else:
                     raise e
-        if isinstance(element, dict):
+        if isinstance(element, pa.RecordBatch):
+            df = element.to_pandas()
+        elif isinstance(element, dict):
             df = pd.DataFrame([element])
         else:
             df = pd.DataFrame(element)
@@ -13,6 +13,8 @@ from buildflow.runtime.ray_io import base
 @dataclasses.dataclass
 class EmptySource(io.Source):
     inputs: List[Any]
+    # If true inputs are sent to the processor as a pyarrow RecordBatch.
+    columnar: bool = False
 
     def actor(self, ray_sinks, proc_input_type: Optional[Type]):
         return EmptySourceActor.remote(ray_sinks, proc_input_type, self)
@@ -23,6 +25,9 @@ class EmptySink(io.Sink):
     def actor(self, remote_fn: Callable, is_streaming: bool):
         return EmptySinkActor.remote(remote_fn)
 
+    def local_actor(self, remote_fn: Callable, is_streaming: bool):
+        return base.local_actor(EmptySinkActor, remote_fn)
+
 
 @ray.remote(num_cpus=EmptySource.num_cpus())
 class EmptySourceActor(base.RaySource):
@@ -32,7 +37,7 @@ class EmptySourceActor(base.RaySource):
         proc_ionput_type: Optional[Type],
         empty_ref: EmptySource,
     ) -> None:
-        super().__init__(ray_sinks, proc_ionput_type)
+        super().__init__(ray_sinks, proc_ionput_type, empty_ref.columnar)
         self.inputs = empty_ref.inputs
         if not self.inputs:
             logging.warning(
@@ -51,4 +56,4 @@ class EmptySinkActor(base.RaySink):
         self,
         elements: Iterable[Any],
     ):
-        return elements
+        return base.to_rows(elements)
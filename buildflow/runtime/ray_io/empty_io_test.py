@@ -1,8 +1,12 @@
 """Rays for ray IO."""
 
 from dataclasses import asdict, dataclass
+from typing import List
 import unittest
 
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import pytest
 
 import buildflow
@@ -97,6 +101,87 @@ class EmptyTest(unittest.TestCase):
         self.assertEqual(len(output), 1)
         self.assertEqual(output, {"process": {"local": [{"a": 1}, {"a": 2}, {"a": 3}]}})
 
+    def test_end_to_end_columnar(self):
+        @self.app.processor(
+            source=buildflow.EmptySource(
+                inputs=[{"a": 1}, {"a": 2}, {"a": 3}], columnar=True
+            )
+        )
+        def process(elem):
+            return {"a": elem["a"] * 2}
+
+        output = self.app.run()
+
+        self.assertEqual(len(output), 1)
+        self.assertEqual(output, {"process": {"local": [{"a": 2}, {"a": 4}, {"a": 6}]}})
+
+    def test_end_to_end_columnar_with_data_class(self):
+        @self.app.processor(
+            source=buildflow.EmptySource(
+                inputs=[asdict(Input(1)), asdict(Input(2))], columnar=True
+            )
+        )
+        def process(elem: Input) -> Input:
+            return Input(elem.a + 1)
+
+        output = self.app.run()
+
+        self.assertEqual(len(output), 1)
+        self.assertEqual(output, {"process": {"local": [{"a": 2}, {"a": 3}]}})
+
+    def test_end_to_end_vectorized_pandas(self):
+        @self.app.processor(
+            source=buildflow.EmptySource(inputs=[{"a": 1}, {"a": 2}, {"a": 3}]),
+            vectorized=True,
+        )
+        def process(batch: pd.DataFrame) -> pd.DataFrame:
+            batch["a"] = batch["a"] * 2
+            return batch
+
+        output = self.app.run()
+
+        self.assertEqual(output, {"process": {"local": [{"a": 2}, {"a": 4}, {"a": 6}]}})
+
+    def test_end_to_end_vectorized_arrow_columnar(self):
+        @self.app.processor(
+            source=buildflow.EmptySource(
+                inputs=[{"a": 1}, {"a": 2}, {"a": 3}], columnar=True
+            ),
+            vectorized=True,
+        )
+        def process(batch: pa.Table) -> pa.Table:
+            return batch.set_column(0, "a", pc.add(batch["a"], 1))
+
+        output = self.app.run()
+
+        self.assertEqual(output, {"process": {"local": [{"a": 2}, {"a": 3}, {"a": 4}]}})
+
+    def test_end_to_end_vectorized_list_data_class(self):
+        @self.app.processor(
+            source=buildflow.EmptySource(inputs=[asdict(Input(1)), asdict(Input(2))]),
+            vectorized=True,
+        )
+        def process(batch: List[Input]) -> List[Input]:
+            return [Input(elem.a * 10) for elem in batch]
+
+        output = self.app.run()
+
+        self.assertEqual(output, {"process": {"local": [{"a": 10}, {"a": 20}]}})
+
+    def test_end_to_end_vectorized_class(self):
+        class MyProcessor(buildflow.Processor):
+            def source(self):
+                return buildflow.EmptySource([1, 2, 3])
+
+            def process_batch(self, batch: list):
+                return [sum(batch)]
+
+        self.app.add_processor(MyProcessor())
+
+        output = self.app.run()
+
+        self.assertEqual(output, {"MyProcessor": {"local": [6]}})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -50,6 +50,9 @@ class FileSink(io.Sink):
     def actor(self, remote_fn: Callable, is_streaming: bool):
         return FileSinkActor.remote(remote_fn, self)
 
+    def local_actor(self, remote_fn: Callable, is_streaming: bool):
+        return base.local_actor(FileSinkActor, remote_fn, self)
+
 
 @ray.remote(num_cpus=FileSink.num_cpus())
 class FileSinkActor(base.RaySink):
@@ -61,17 +64,21 @@ class FileSinkActor(base.RaySink):
         # s3:// = S3
         self._path = file_sink.file_path
 
-    async def _write(self, elements: Union[ray.data.Dataset, Iterable[Dict[str, Any]]]):
+    async def _write(
+        self,
+        elements: Union[ray.data.Dataset, pa.RecordBatch, Iterable[Dict[str, Any]]],
+    ):
         """Based on the instance of `elements` param, write the values
         to the supported file types.
 
         For Ray Dataset, file path becomes a folder and individual
         dictionary become individual file.
-        For Iterable type, file path results in a single file of
-        the `FileFormat` type.
+        For RecordBatch and Iterable types, file path results in a single
+        file of the `FileFormat` type.
 
         :param elements: Data
-        :type elements: Union[ray.data.Dataset, Iterable[Dict[str, Any]]]
+        :type elements: Union[ray.data.Dataset, pa.RecordBatch,
+            Iterable[Dict[str, Any]]]
         """
         if isinstance(elements, ray.data.Dataset):
             if self._format == FileFormat.PARQUET:
@@ -80,6 +87,20 @@ class FileSinkActor(base.RaySink):
                 elements.write_csv(self._path)
             elif self._format == FileFormat.JSON:
                 elements.write_json(self._path)
+        elif isinstance(elements, pa.RecordBatch):
+            if not elements.num_rows:
+                return
+            if self._format == FileFormat.PARQUET:
+                exists = os.path.exists(self._path)
+                fastparquet.write(self._path, elements.to_pandas(), append=exists)
+            elif self._format == FileFormat.CSV:
+                table = pa.Table.from_batches([elements])
+                if Path(self._path).exists():
+                    table = pa.concat_tables([table, pcsv.read_csv(self._path)])
+                pcsv.write_csv(table, self._path)
+            elif self._format == FileFormat.JSON:
+                with open(self._path, "a") as output_file:
+                    json.dump(elements.to_pylist(), output_file)
         else:
             if self._format == FileFormat.PARQUET:
                 exists = os.path.exists(self._path)
@@ -69,6 +69,24 @@ class FileIoTest(unittest.TestCase):
         table = pq.read_table(path)
         self.assertEqual([{"field": 1}, {"field": 2}], table.to_pylist())
 
+    def test_write_columnar(self):
+        path = os.path.join(self.output_path, "output.parquet")
+
+        @self.app.processor(
+            source=buildflow.EmptySource(
+                inputs=[{"field": 1}, {"field": 2}], columnar=True
+            ),
+            sink=buildflow.FileSink(
+                file_path=path, file_format=buildflow.FileFormat.PARQUET
+            ),
+        )
+        def process(elem):
+            return elem
+
+        self.app.run()
+        table = pq.read_table(path)
+        self.assertEqual([{"field": 1}, {"field": 2}], table.to_pylist())
+
     def test_write_csv_from_dictionaries(self):
         path = os.path.join(self.output_path, "output.csv")
 
@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 import google.auth
 from google.auth import exceptions
@@ -57,9 +58,18 @@ def get_async_subscriber_client(project: str):
     return SubscriberAsyncClient(credentials=creds)
 
 
-def get_publisher_client(project: str):
+def get_publisher_client(
+    project: str,
+    batch_settings: Optional[pubsub.types.BatchSettings] = None,
+    publisher_options: Optional[pubsub.types.PublisherOptions] = None,
+):
     creds = _get_gcp_creds(project)
-    return pubsub.PublisherClient(credentials=creds)
+    kwargs = {}
+    if batch_settings is not None:
+        kwargs["batch_settings"] = batch_settings
+    if publisher_options is not None:
+        kwargs["publisher_options"] = publisher_options
+    return pubsub.PublisherClient(credentials=creds, **kwargs)
 
 
 def get_subscriber_client(project: str):
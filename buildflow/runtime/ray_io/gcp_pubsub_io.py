@@ -1,19 +1,23 @@
 """IO connectors for Pub/Sub and Ray."""
 
+import asyncio
+import collections
 import dataclasses
 import datetime
 from google.cloud.monitoring_v3 import query
 import inspect
 import logging
-import json
-from typing import Any, Callable, Dict, Iterable, Optional, Union, Type
+import math
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type, Union
 
+from google.cloud import pubsub
 import ray
 
-from buildflow import utils
 from buildflow.api import io
 from buildflow.api.depends import Publisher
 from buildflow.runtime.ray_io import base
+from buildflow.runtime.ray_io import codecs
 from buildflow.runtime.ray_io import gcp_pubsub_utils
 from buildflow.runtime.ray_io.gcp import clients
 
@@ -33,6 +37,11 @@ fetch pubsub_subscription
 """
 
 
+# Pub/Sub allows ack deadlines between 10 and 600 seconds.
+_MIN_ACK_DEADLINE_SECS = 10
+_MAX_ACK_DEADLINE_SECS = 600
+
+
 @dataclasses.dataclass(frozen=True)
 class _PubSubSourcePlan:
     topic: str
@@ -45,17 +54,24 @@ class _PubSubSinkPlan:
 
 
 class PubSubPublisher(Publisher):
-    def __init__(self, topic: str, project: str):
+    def __init__(
+        self,
+        topic: str,
+        project: str,
+        codec: Optional[codecs.Codec] = None,
+        compression: codecs.Compression = codecs.Compression.NONE,
+    ):
         self.client = clients.get_publisher_client(project)
         self.topic = topic
+        self.wire_format = codecs.WireFormat(codec or codecs.JsonCodec(), compression)
+        self.attributes = self.wire_format.attributes()
 
     def publish(self, element: Union[Dict[str, Any], Any]):
-        if dataclasses.is_dataclass(element):
-            element = utils.dataclass_to_json(element)
-        elif not isinstance(element, dict):
+        if not dataclasses.is_dataclass(element) and not isinstance(element, dict):
             raise ValueError("only dataclasses and dicts may be published")
-        json_element = json.dumps(element)
-        return self.client.publish(self.topic, json_element.encode("utf-8"))
+        return self.client.publish(
+            self.topic, self.wire_format.encode(element), **self.attributes
+        )
 
 
 @dataclasses.dataclass(frozen=True)
@@ -73,16 +89,62 @@ class GCPPubSubSource(io.StreamingSource):
     # subscription does not exist we will create it.
     topic: str = ""
     # Whether or not to include the pubsub attributes. If this is true you will
-    # get a buildflow.PubsubMessage class as your input.
+    # get a buildflow.PubsubMessage class as your input. The content-type and
+    # content-encoding attributes are used to decode the message and are not
+    # included.
     include_attributes: bool = False
     # The project to bill for Pub/Sub usage. If not set we use the project that
     # the subscription exists in.
     billing_project: str = ""
+    # Whether or not to send pulled messages to the processor as a pyarrow
+    # RecordBatch. This is much cheaper to move between actors but requires
+    # that every message is a flat json object.
+    columnar: bool = False
+    # The max number of batches that can be processed at once. The next batch
+    # is pulled while earlier batches are still being processed.
+    max_in_flight_batches: int = 2
+    # Whether to receive messages over a StreamingPull stream instead of
+    # polling with unary pull requests. The stream delivers messages as soon
+    # as they are published without spending requests on empty responses, and
+    # the leases of received messages are extended until they are acked.
+    streaming_pull: bool = False
+    # The max number of messages and bytes that have been received over the
+    # stream but not acked yet. Pub/Sub stops delivering messages once either
+    # is reached. Only used with streaming_pull.
+    max_outstanding_messages: int = 1000
+    max_outstanding_bytes: int = 100 * 1024 * 1024
+    # The max time the leases of a received message are extended for. After
+    # that the message is redelivered if it still hasn't been acked.
+    max_lease_duration_secs: int = 3600
+    # The ack deadline of the subscription if it's created by us, between 10
+    # and 600 seconds. Leases of messages that are still being processed are
+    # extended either way, so this only bounds how long messages that were
+    # pulled by a replica that died wait to be redelivered.
+    ack_deadline_seconds: int = 600
+    # Whether to respect the ordering keys of messages. Messages with
+    # different keys are processed in parallel, while the messages of a key
+    # are processed in the order they were published. If the subscription is
+    # created by us it's created with message ordering enabled.
+    enable_message_ordering: bool = False
+    # The codec and compression of messages that don't have a content-type
+    # and content-encoding attribute. Messages written by a buildflow sink
+    # have them, and are decoded with the codec they were encoded with.
+    codec: codecs.Codec = dataclasses.field(default_factory=codecs.JsonCodec)
+    compression: codecs.Compression = codecs.Compression.NONE
 
     def __post_init__(self):
         if not self.billing_project:
             split_sub = self.subscription.split("/")
             self.billing_project = split_sub[1]
+        if not (
+            _MIN_ACK_DEADLINE_SECS
+            <= self.ack_deadline_seconds
+            <= _MAX_ACK_DEADLINE_SECS
+        ):
+            raise ValueError(
+                f"ack_deadline_seconds must be between {_MIN_ACK_DEADLINE_SECS} and "
+                f"{_MAX_ACK_DEADLINE_SECS}."
+            )
 
     def plan(self, process_arg_spec: inspect.FullArgSpec) -> Dict[str, Any]:
         plan_dict = dataclasses.asdict(
@@ -97,11 +159,16 @@ class GCPPubSubSource(io.StreamingSource):
             pubsub_subscription=self.subscription,
             pubsub_topic=self.topic,
             billing_project=self.billing_project,
+            enable_message_ordering=self.enable_message_ordering,
+            ack_deadline_seconds=self.ack_deadline_seconds,
         )
 
     def actor(self, ray_sinks, proc_input_type: Optional[Type]):
         return PubSubSourceActor.remote(ray_sinks, proc_input_type, self)
 
+    def local_actor(self, ray_sinks, proc_input_type: Optional[Type]):
+        return base.local_actor(PubSubSourceActor, ray_sinks, proc_input_type, self)
+
     def backlog(self) -> Optional[int]:
         split_sub = self.subscription.split("/")
         project = split_sub[1]
@@ -143,7 +210,9 @@ class GCPPubSubSource(io.StreamingSource):
         return 4
 
     def publisher(self):
-        return PubSubPublisher(self.topic, self.billing_project)
+        return PubSubPublisher(
+            self.topic, self.billing_project, self.codec, self.compression
+        )
 
 
 @dataclasses.dataclass
@@ -154,6 +223,25 @@ class GCPPubSubSink(io.Sink):
     # The project to bill for Pub/Sub usage. If not set we use the project that
     # the topic exists in.
     billing_project: str = ""
+    # The publisher client batches messages into publish requests, a request
+    # is sent once it has this many messages or bytes, or once its first
+    # message has waited for this long.
+    max_batch_messages: int = 1000
+    max_batch_bytes: int = 1_000_000
+    max_batch_latency_secs: float = 0.01
+    # The number of times messages that failed to publish are retried before
+    # the write fails.
+    max_publish_retries: int = 3
+    # The field of the output elements to use as the ordering key of their
+    # messages. If set messages are published with ordering enabled, so
+    # messages with the same key are delivered in the order they were written.
+    # Elements without the field are published without a key.
+    ordering_key_field: str = ""
+    # How messages are encoded and compressed. Every message is stamped with
+    # content-type and content-encoding attributes, which sources use to pick
+    # the matching decoder.
+    codec: codecs.Codec = dataclasses.field(default_factory=codecs.JsonCodec)
+    compression: codecs.Compression = codecs.Compression.NONE
 
     def __post_init__(self):
         if not self.billing_project:
@@ -168,10 +256,340 @@ class GCPPubSubSink(io.Sink):
     def actor(self, remote_fn: Callable, is_streaming: bool):
         return PubSubSinkActor.remote(remote_fn, self)
 
+    def local_actor(self, remote_fn: Callable, is_streaming: bool):
+        return base.local_actor(PubSubSinkActor, remote_fn, self)
+
     def plan(self, process_arg_spec: inspect.FullArgSpec) -> Dict[str, Any]:
         return dataclasses.asdict(_PubSubSinkPlan(topic=self.topic))
 
 
+# Pub/Sub allows at most 2500 ack IDs per acknowledge request.
+_MAX_ACK_IDS_PER_REQUEST = 2500
+# How often pending acks are flushed if the size limit isn't reached.
+_ACK_FLUSH_INTERVAL_SECS = 0.1
+_MAX_ACK_RETRIES = 3
+
+
+class _AckManager:
+    """Sends acks and nacks for a source actor in the background.
+
+    Ack IDs are coalesced across batches (and across all of the actor's `run`
+    loops) and flushed when enough of them are pending or every
+    _ACK_FLUSH_INTERVAL_SECS, so acking doesn't add an RPC round trip before
+    the next pull.
+    """
+
+    def __init__(self, pubsub_client, subscription: str) -> None:
+        self._pubsub_client = pubsub_client
+        self._subscription = subscription
+        self._pending_acks: List[str] = []
+        self._pending_nacks: List[str] = []
+        self._flush_task = None
+        self._wakeup = asyncio.Event()
+
+    def _ensure_started(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_loop())
+
+    def ack(self, ack_ids: List[str]):
+        self._ensure_started()
+        self._pending_acks.extend(ack_ids)
+        if len(self._pending_acks) >= _MAX_ACK_IDS_PER_REQUEST:
+            self._wakeup.set()
+
+    def nack(self, ack_ids: List[str]):
+        self._ensure_started()
+        self._pending_nacks.extend(ack_ids)
+        if len(self._pending_nacks) >= _MAX_ACK_IDS_PER_REQUEST:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=_ACK_FLUSH_INTERVAL_SECS
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _send_with_retries(self, send_fn: Callable, ack_ids: List[str]):
+        for attempt in range(_MAX_ACK_RETRIES):
+            try:
+                await send_fn(ack_ids)
+                return
+            except Exception:
+                if attempt == _MAX_ACK_RETRIES - 1:
+                    # The messages will be redelivered once their ack deadline
+                    # expires.
+                    logging.exception(
+                        "failed to send %s ack IDs for subscription: %s",
+                        len(ack_ids),
+                        self._subscription,
+                    )
+                    return
+                await asyncio.sleep(0.1 * 2**attempt)
+
+    async def _acknowledge(self, ack_ids: List[str]):
+        await self._pubsub_client.acknowledge(
+            ack_ids=ack_ids, subscription=self._subscription
+        )
+
+    async def _nack(self, ack_ids: List[str]):
+        # This nacks the messages. See:
+        # https://github.com/googleapis/python-pubsub/pull/123/files
+        await self._pubsub_client.modify_ack_deadline(
+            subscription=self._subscription,
+            ack_ids=ack_ids,
+            ack_deadline_seconds=0,
+        )
+
+    async def flush(self):
+        """Sends all pending acks and nacks."""
+        acks, self._pending_acks = self._pending_acks, []
+        nacks, self._pending_nacks = self._pending_nacks, []
+        requests = []
+        for i in range(0, len(acks), _MAX_ACK_IDS_PER_REQUEST):
+            chunk = acks[i : i + _MAX_ACK_IDS_PER_REQUEST]
+            requests.append(self._send_with_retries(self._acknowledge, chunk))
+        for i in range(0, len(nacks), _MAX_ACK_IDS_PER_REQUEST):
+            chunk = nacks[i : i + _MAX_ACK_IDS_PER_REQUEST]
+            requests.append(self._send_with_retries(self._nack, chunk))
+        if requests:
+            await asyncio.gather(*requests)
+
+    async def close(self):
+        """Stops the background flush and sends anything still pending."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+
+# How often the leases of in flight messages are checked.
+_LEASE_CHECK_INTERVAL_SECS = 1
+# Leases are extended once they expire within this many seconds, which leaves
+# time for the modify_ack_deadline request.
+_LEASE_RENEWAL_MARGIN_SECS = 5
+# The number of recent processing times that leases are based on.
+_MAX_PROCESSING_TIME_SAMPLES = 1000
+_LEASE_PERCENTILE = 99
+
+
+class _LeaseManager:
+    """Extends the leases of messages that are still being processed.
+
+    Messages received with unary pulls are redelivered once their ack deadline
+    passes, even if their batch is still being processed, e.g. by a slow
+    processor or a load job in the sink. The lease manager tracks the ack IDs
+    of every batch in flight and extends their leases with
+    `modify_ack_deadline` shortly before they expire.
+
+    Leases are extended by the 99th percentile of the time recent batches took
+    from pull to ack, so messages of a replica that died are redelivered
+    quickly if batches are processed quickly. Messages are leased for at most
+    `max_lease_duration_secs`.
+    """
+
+    def __init__(
+        self,
+        pubsub_client,
+        subscription: str,
+        ack_deadline_secs: int,
+        max_lease_duration_secs: float,
+    ) -> None:
+        self._pubsub_client = pubsub_client
+        self._subscription = subscription
+        self.ack_deadline_secs = ack_deadline_secs
+        self._max_lease_duration_secs = max_lease_duration_secs
+        # When every in flight ack ID was pulled and when its lease expires.
+        self._received_at: Dict[str, float] = {}
+        self._expires_at: Dict[str, float] = {}
+        self._processing_times = collections.deque(maxlen=_MAX_PROCESSING_TIME_SAMPLES)
+        self._lease_task = None
+
+    def _ensure_started(self):
+        if self._lease_task is None or self._lease_task.done():
+            self._lease_task = asyncio.ensure_future(self._lease_loop())
+
+    def lease(self, ack_ids: List[str]):
+        """Starts extending the leases of a pulled batch."""
+        self._ensure_started()
+        now = time.monotonic()
+        for ack_id in ack_ids:
+            self._received_at[ack_id] = now
+            self._expires_at[ack_id] = now + self.ack_deadline_secs
+
+    def release(self, ack_ids: List[str]):
+        """Stops extending the leases of a batch that was acked or nacked."""
+        now = time.monotonic()
+        received_at = None
+        for ack_id in ack_ids:
+            received_at = self._received_at.pop(ack_id, received_at)
+            self._expires_at.pop(ack_id, None)
+        if received_at is not None:
+            self._processing_times.append(now - received_at)
+
+    def lease_secs(self) -> int:
+        """Returns how long leases are extended for."""
+        if not self._processing_times:
+            return self.ack_deadline_secs
+        processing_times = sorted(self._processing_times)
+        index = math.ceil(len(processing_times) * _LEASE_PERCENTILE / 100) - 1
+        # The lease has to outlast the batch plus the margin it's renewed at.
+        secs = math.ceil(processing_times[index]) + _LEASE_RENEWAL_MARGIN_SECS
+        return max(min(secs, _MAX_ACK_DEADLINE_SECS), _MIN_ACK_DEADLINE_SECS)
+
+    async def _modify_ack_deadline(self, ack_ids: List[str], lease_secs: int):
+        try:
+            await self._pubsub_client.modify_ack_deadline(
+                subscription=self._subscription,
+                ack_ids=ack_ids,
+                ack_deadline_seconds=lease_secs,
+            )
+        except Exception:
+            logging.exception(
+                "failed to extend the leases of %s messages for subscription: %s",
+                len(ack_ids),
+                self._subscription,
+            )
+            # Try again on the next check.
+            now = time.monotonic()
+            for ack_id in ack_ids:
+                if ack_id in self._expires_at:
+                    self._expires_at[ack_id] = now
+
+    async def extend_expiring(self):
+        """Extends the leases that expire soon."""
+        now = time.monotonic()
+        lease_secs = self.lease_secs()
+        expiring = []
+        expired = []
+        for ack_id, expires_at in self._expires_at.items():
+            if expires_at - now > _LEASE_RENEWAL_MARGIN_SECS:
+                continue
+            if now - self._received_at[ack_id] >= self._max_lease_duration_secs:
+                expired.append(ack_id)
+            else:
+                expiring.append(ack_id)
+        if expired:
+            logging.warning(
+                "%s messages reached the max lease duration of %s seconds for "
+                "subscription: %s, they will be redelivered.",
+                len(expired),
+                self._max_lease_duration_secs,
+                self._subscription,
+            )
+            for ack_id in expired:
+                # The ack ID stays in flight so the batch's processing time is
+                # still recorded.
+                del self._expires_at[ack_id]
+        for ack_id in expiring:
+            self._expires_at[ack_id] = now + lease_secs
+        requests = []
+        for i in range(0, len(expiring), _MAX_ACK_IDS_PER_REQUEST):
+            chunk = expiring[i : i + _MAX_ACK_IDS_PER_REQUEST]
+            requests.append(self._modify_ack_deadline(chunk, lease_secs))
+        if requests:
+            await asyncio.gather(*requests)
+
+    async def _lease_loop(self):
+        while True:
+            await asyncio.sleep(_LEASE_CHECK_INTERVAL_SECS)
+            await self.extend_expiring()
+
+    async def close(self):
+        """Stops extending leases."""
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+            try:
+                await self._lease_task
+            except asyncio.CancelledError:
+                pass
+            self._lease_task = None
+
+
+# How long a pull waits for messages from the stream before it returns an
+# empty batch.
+_STREAMING_PULL_WAIT_SECS = 1
+
+
+class _StreamingPullReceiver:
+    """Receives messages over a StreamingPull stream.
+
+    The subscriber client runs the stream in background threads. It stops
+    delivering messages while too many are outstanding (see `flow_control`),
+    and extends the leases of delivered messages until they are acked or
+    nacked. Messages are handed to the event loop through a queue, which is
+    shared by all of the source's pull loops.
+    """
+
+    def __init__(
+        self,
+        subscriber_client,
+        subscription: str,
+        flow_control: pubsub.types.FlowControl,
+    ) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._messages = asyncio.Queue()
+        self._streaming_pull_future = subscriber_client.subscribe(
+            subscription, callback=self._callback, flow_control=flow_control
+        )
+
+    def _callback(self, message):
+        # This is called from the subscriber client's threads.
+        self._loop.call_soon_threadsafe(self._messages.put_nowait, message)
+
+    @property
+    def done(self) -> bool:
+        """Whether the stream has stopped, e.g. due to an error."""
+        return self._streaming_pull_future.done()
+
+    async def receive(self, max_messages: int, timeout_secs: float) -> List[Any]:
+        """Returns up to `max_messages` messages that have been delivered.
+
+        This waits up to `timeout_secs` for the first message, and returns an
+        empty list if none arrive.
+        """
+        try:
+            message = await asyncio.wait_for(self._messages.get(), timeout_secs)
+        except asyncio.TimeoutError:
+            if self.done:
+                # Raises the error that stopped the stream.
+                self._streaming_pull_future.result()
+            return []
+        messages = [message]
+        while len(messages) < max_messages and not self._messages.empty():
+            messages.append(self._messages.get_nowait())
+        return messages
+
+    def _stop(self):
+        self._streaming_pull_future.cancel()
+        try:
+            self._streaming_pull_future.result()
+        except Exception:
+            pass
+
+    async def close(self, run_blocking: Callable):
+        """Stops the stream.
+
+        Waiting for the stream to stop blocks, so it's done with
+        `run_blocking`. Messages that were delivered but not received yet are
+        nacked so they are redelivered right away. The queue is only used on
+        the event loop, including for messages delivered while stopping.
+        """
+        await run_blocking(self._stop)
+        # Let the deliveries the client scheduled before it stopped run.
+        await asyncio.sleep(0)
+        while not self._messages.empty():
+            self._messages.get_nowait().nack()
+
+
 @ray.remote(num_cpus=GCPPubSubSource.num_cpus())
 class PubSubSourceActor(base.StreamingRaySource):
     def __init__(
@@ -180,66 +598,196 @@ class PubSubSourceActor(base.StreamingRaySource):
         processor_input_type: Optional[Type],
         pubsub_ref: GCPPubSubSource,
     ) -> None:
-        super().__init__(ray_sinks, processor_input_type)
+        super().__init__(
+            ray_sinks,
+            processor_input_type,
+            pubsub_ref.columnar,
+            pubsub_ref.max_in_flight_batches,
+        )
         self.subscription = pubsub_ref.subscription
         self.include_attributes = pubsub_ref.include_attributes
         self.billing_project = pubsub_ref.billing_project
         self.batch_size = 1000
-        self.running = True
+        self.streaming_pull = pubsub_ref.streaming_pull
+        self.ordered = pubsub_ref.enable_message_ordering
+        self.wire_format = codecs.WireFormat(pubsub_ref.codec, pubsub_ref.compression)
+        self._flow_control = pubsub.types.FlowControl(
+            max_messages=pubsub_ref.max_outstanding_messages,
+            max_bytes=pubsub_ref.max_outstanding_bytes,
+            max_lease_duration=pubsub_ref.max_lease_duration_secs,
+        )
+        self.ack_deadline_seconds = pubsub_ref.ack_deadline_seconds
+        self.max_lease_duration_secs = pubsub_ref.max_lease_duration_secs
+        # The async client has to be created inside of the actor's event loop
+        # so it is created on the first pull.
+        self._pubsub_client = None
+        self._ack_manager = None
+        self._lease_manager = None
+        self._subscriber_client = None
+        self._receiver = None
 
     async def run(self):
-        pubsub_client = clients.get_async_subscriber_client(self.billing_project)
-        while self.running:
-            ack_ids = []
-            payloads = []
-            try:
-                response = await pubsub_client.pull(
-                    subscription=self.subscription,
-                    max_messages=self.batch_size,
-                    return_immediately=True,
+        await super().run()
+        # Every batch has been acked or nacked at this point. Send the pending
+        # acks before we stop extending leases.
+        if self._ack_manager is not None:
+            await self._ack_manager.close()
+        if self._lease_manager is not None:
+            await self._lease_manager.close()
+        if self._receiver is not None:
+            await self._receiver.close(self.run_blocking)
+
+    def _to_payload(self, data: bytes, attributes: Any) -> Any:
+        decoded = self.wire_format.decode(data, attributes)
+        if self.include_attributes:
+            return PubsubMessage(
+                decoded,
+                {
+                    key: value
+                    for key, value in attributes.items()
+                    if key not in codecs.RESERVED_ATTRIBUTES
+                },
+            )
+        return decoded
+
+    def _try_to_payload(self, data: bytes, attributes: Any) -> Tuple[bool, Any]:
+        try:
+            return True, self._to_payload(data, attributes)
+        except Exception:
+            # The message is nacked on its own so the rest of its batch is still
+            # processed. Configure a dead letter topic on the subscription to
+            # stop a message that can never be decoded from being redelivered.
+            logging.exception(
+                "failed to decode message from subscription: %s, nacking it.",
+                self.subscription,
+            )
+            return False, None
+
+    async def pull(self) -> base.PulledBatch:
+        if self.streaming_pull:
+            return await self._streaming_pull()
+        if self._pubsub_client is None:
+            self._pubsub_client = clients.get_async_subscriber_client(
+                self.billing_project
+            )
+            self._ack_manager = _AckManager(self._pubsub_client, self.subscription)
+            self._lease_manager = _LeaseManager(
+                self._pubsub_client,
+                self.subscription,
+                await self._get_ack_deadline_secs(),
+                self.max_lease_duration_secs,
+            )
+        response = await self._pubsub_client.pull(
+            subscription=self.subscription,
+            max_messages=self.batch_size,
+            return_immediately=True,
+        )
+        ack_ids = []
+        payloads = []
+        publish_times = []
+        ordering_keys = []
+        undecodable = []
+        num_bytes = 0
+        for received_message in response.received_messages:
+            decoded, payload = self._try_to_payload(
+                received_message.message.data, received_message.message.attributes
+            )
+            if not decoded:
+                undecodable.append(received_message.ack_id)
+                continue
+            num_bytes += len(received_message.message.data)
+            payloads.append(payload)
+            ack_ids.append(received_message.ack_id)
+            ordering_keys.append(received_message.message.ordering_key)
+            if received_message.message.publish_time is not None:
+                publish_times.append(received_message.message.publish_time.timestamp())
+        if undecodable:
+            self._ack_manager.nack(undecodable)
+        self._lease_manager.lease(ack_ids)
+        # payloads will be empty if the pull times out (usually because
+        # there's no data to pull).
+        return base.PulledBatch(
+            payloads,
+            ack_ids,
+            num_bytes,
+            publish_times,
+            ordering_keys if self.ordered else None,
+        )
+
+    async def _get_ack_deadline_secs(self) -> int:
+        # The subscription may have been created with a different deadline
+        # than the one we would have created it with.
+        try:
+            subscription = await self._pubsub_client.get_subscription(
+                subscription=self.subscription
+            )
+            return subscription.ack_deadline_seconds
+        except Exception:
+            logging.warning(
+                "failed to get the ack deadline of subscription: %s, assuming "
+                "it is %s seconds.",
+                self.subscription,
+                self.ack_deadline_seconds,
+            )
+            return self.ack_deadline_seconds
+
+    async def _streaming_pull(self) -> base.PulledBatch:
+        if self._receiver is None or self._receiver.done:
+            if self._receiver is not None:
+                logging.warning("StreamingPull stream stopped, reopening it.")
+            if self._subscriber_client is None:
+                self._subscriber_client = clients.get_subscriber_client(
+                    self.billing_project
                 )
-            except Exception as e:
-                logging.error("pubsub pull failed with: %s", e)
+            self._receiver = _StreamingPullReceiver(
+                self._subscriber_client, self.subscription, self._flow_control
+            )
+        messages = await self._receiver.receive(
+            self.batch_size, _STREAMING_PULL_WAIT_SECS
+        )
+        decoded_messages = []
+        payloads = []
+        publish_times = []
+        num_bytes = 0
+        for message in messages:
+            decoded, payload = self._try_to_payload(message.data, message.attributes)
+            if not decoded:
+                message.nack()
                 continue
-            for received_message in response.received_messages:
-                json_loaded = {}
-                if received_message.message.data:
-                    decoded_data = received_message.message.data.decode()
-                    json_loaded = json.loads(decoded_data)
-                if self.include_attributes:
-                    att_dict = {}
-                    attributes = received_message.message.attributes
-                    for key, value in attributes.items():
-                        att_dict[key] = value
-                    payload = PubsubMessage(json_loaded, att_dict)
-                else:
-                    payload = json_loaded
-                payloads.append(payload)
-                ack_ids.append(received_message.ack_id)
-
-            # payloads will be empty if the pull times out (usually because
-            # there's no data to pull).
-            if payloads:
-                try:
-                    await self._send_batch_to_sinks_and_await(payloads)
-                    await pubsub_client.acknowledge(
-                        ack_ids=ack_ids, subscription=self.subscription
-                    )
-                except Exception:
-                    logging.exception("Failed to process message, will not be acked.")
-                    # This nacks the messages. See:
-                    # https://github.com/googleapis/python-pubsub/pull/123/files
-                    ack_deadline_seconds = 0
-                    await pubsub_client.modify_ack_deadline(
-                        subscription=self.subscription,
-                        ack_ids=ack_ids,
-                        ack_deadline_seconds=ack_deadline_seconds,
-                    )
-            # For pub/sub we determine the utilization based on the number of
-            # messages received versus how many we received.
-            self.update_metrics(len(payloads))
+            decoded_messages.append(message)
+            num_bytes += len(message.data)
+            payloads.append(payload)
+            if message.publish_time is not None:
+                publish_times.append(message.publish_time.timestamp())
+        # The messages themselves are used to ack, their leases are extended
+        # until then.
+        ordering_keys = None
+        if self.ordered:
+            ordering_keys = [message.ordering_key for message in decoded_messages]
+        return base.PulledBatch(
+            payloads, decoded_messages, num_bytes, publish_times, ordering_keys
+        )
 
-    def shutdown(self):
+    async def ack(self, ack_info: List[Any], success: bool):
+        if self.streaming_pull:
+            # Acks are sent in the background by the subscriber client.
+            for message in ack_info:
+                if success:
+                    message.ack()
+                else:
+                    message.nack()
+            return
+        self._lease_manager.release(ack_info)
+        # Acks are sent in the background so they don't delay the next pull.
+        if success:
+            self._ack_manager.ack(ack_info)
+        else:
+            self._ack_manager.nack(ack_info)
+
+    async def shutdown(self):
+        # The ack and lease managers are closed by `run` once every batch in
+        # flight has been acked, so slow batches keep their leases while the
+        # replica drains.
         self.running = False
         print("Shutting down Pub/Sub subscription")
         return True
@@ -253,22 +801,101 @@ class PubSubSinkActor(base.RaySink):
         pubsub_ref: GCPPubSubSink,
     ) -> None:
         super().__init__(remote_fn)
-        self.pubslisher_client = clients.get_publisher_client(
-            pubsub_ref.billing_project
+        self.ordering_key_field = pubsub_ref.ordering_key_field
+        publisher_options = None
+        if self.ordering_key_field:
+            publisher_options = pubsub.types.PublisherOptions(
+                enable_message_ordering=True
+            )
+        self.publisher_client = clients.get_publisher_client(
+            pubsub_ref.billing_project,
+            pubsub.types.BatchSettings(
+                max_messages=pubsub_ref.max_batch_messages,
+                max_bytes=pubsub_ref.max_batch_bytes,
+                max_latency=pubsub_ref.max_batch_latency_secs,
+            ),
+            publisher_options,
         )
         self.topic = pubsub_ref.topic
+        self.max_publish_retries = pubsub_ref.max_publish_retries
+        self.wire_format = codecs.WireFormat(pubsub_ref.codec, pubsub_ref.compression)
+        self.attributes = self.wire_format.attributes()
+
+    def _ordering_key(self, element: Any) -> str:
+        if not self.ordering_key_field:
+            return ""
+        if isinstance(element, dict):
+            key = element.get(self.ordering_key_field)
+        else:
+            key = getattr(element, self.ordering_key_field, None)
+        return "" if key is None else str(key)
+
+    def _publish_one(self, message: bytes, ordering_key: str) -> asyncio.Future:
+        try:
+            return asyncio.wrap_future(
+                self.publisher_client.publish(
+                    self.topic, message, ordering_key=ordering_key, **self.attributes
+                )
+            )
+        except Exception as e:
+            # Publishing to an ordering key that is paused by an earlier
+            # failure raises right away.
+            future = asyncio.get_event_loop().create_future()
+            future.set_exception(e)
+            return future
+
+    async def _publish(
+        self, messages: List[bytes], ordering_keys: List[str]
+    ) -> List[Optional[Exception]]:
+        """Publishes all messages concurrently and returns their errors."""
+        # Publishing only queues the message, the client sends the requests
+        # from its own threads. Messages with the same ordering key are sent in
+        # the order they were published.
+        futures = [
+            self._publish_one(message, ordering_key)
+            for message, ordering_key in zip(messages, ordering_keys)
+        ]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return [result if isinstance(result, Exception) else None for result in results]
 
     async def _write(
         self,
         elements: Union[ray.data.Dataset, Iterable[Dict[str, Any]]],
     ):
+        elements = base.to_rows(elements)
+
         # TODO: need to support writing to Pub/Sub in batch mode.
-        def publish_element(item):
-            future = self.pubslisher_client.publish(
-                self.topic, json.dumps(item).encode("UTF-8")
+        messages = [self.wire_format.encode(element) for element in elements]
+        ordering_keys = [self._ordering_key(element) for element in elements]
+        for attempt in range(self.max_publish_retries + 1):
+            if attempt:
+                await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+            errors = await self._publish(messages, ordering_keys)
+            failed = [
+                (message, ordering_key, error)
+                for message, ordering_key, error in zip(messages, ordering_keys, errors)
+                if error is not None
+            ]
+            if not failed:
+                return
+            # Failed messages keep their order, so the messages of a key are
+            # still published in order when they're retried.
+            messages = [message for message, _, _ in failed]
+            ordering_keys = [ordering_key for _, ordering_key, _ in failed]
+            # The publisher pauses an ordering key after a failure, so nothing
+            # is published out of order, until it's resumed.
+            for ordering_key in set(ordering_keys):
+                if ordering_key:
+                    self.publisher_client.resume_publish(self.topic, ordering_key)
+            logging.warning(
+                "failed to publish %s messages to %s: %s",
+                len(failed),
+                self.topic,
+                failed[0][2],
             )
-            future.result()
-
-        for elem in elements:
-            publish_element(elem)
-        return
+        # The batch is nacked by the source, so the messages that were
+        # published will be published again when it's redelivered.
+        raise RuntimeError(
+            f"failed to publish {len(failed)} messages to {self.topic} after "
+            f"{self.max_publish_retries} retries: {failed[0][2]}"
+        )
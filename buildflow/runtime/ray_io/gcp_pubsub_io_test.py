@@ -1,3 +1,11 @@
+import asyncio
+import concurrent.futures
+import datetime
+import json
+import os
+import threading
+import time
+import types
 import unittest
 from unittest import mock
 
@@ -5,6 +13,8 @@ from google.api_core import exceptions
 
 import buildflow
 from buildflow.api import NodePlan, ProcessorPlan
+from buildflow.runtime.ray_io import base
+from buildflow.runtime.ray_io import codecs
 from buildflow.runtime.ray_io import gcp_pubsub_io as io
 
 
@@ -216,5 +226,561 @@ class PubsubIOTest(unittest.TestCase):
         self.assertEqual(expected_plan, plan)
 
 
+class _FakeAsyncSubscriber:
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.acked = []
+        self.nacked = []
+
+    async def acknowledge(self, ack_ids, subscription):
+        if self.failures:
+            self.failures -= 1
+            raise exceptions.ServiceUnavailable("unavailable")
+        self.acked.append(list(ack_ids))
+
+    async def modify_ack_deadline(self, subscription, ack_ids, ack_deadline_seconds):
+        self.nacked.append((list(ack_ids), ack_deadline_seconds))
+
+
+class AckManagerTest(unittest.TestCase):
+    def test_acks_are_coalesced(self):
+        client = _FakeAsyncSubscriber()
+
+        async def run():
+            manager = io._AckManager(client, "sub")
+            manager.ack(["1", "2"])
+            manager.ack(["3"])
+            manager.nack(["4"])
+            await asyncio.sleep(io._ACK_FLUSH_INTERVAL_SECS * 3)
+            await manager.close()
+
+        asyncio.run(run())
+
+        self.assertEqual([["1", "2", "3"]], client.acked)
+        self.assertEqual([(["4"], 0)], client.nacked)
+
+    def test_failed_acks_are_retried(self):
+        client = _FakeAsyncSubscriber(failures=2)
+
+        async def run():
+            manager = io._AckManager(client, "sub")
+            manager.ack(["1"])
+            await manager.close()
+
+        asyncio.run(run())
+
+        self.assertEqual([["1"]], client.acked)
+
+    def test_close_flushes_pending_acks(self):
+        client = _FakeAsyncSubscriber()
+
+        async def run():
+            manager = io._AckManager(client, "sub")
+            manager.ack([str(i) for i in range(io._MAX_ACK_IDS_PER_REQUEST + 1)])
+            await manager.close()
+
+        asyncio.run(run())
+
+        self.assertEqual(
+            [io._MAX_ACK_IDS_PER_REQUEST, 1], [len(ids) for ids in client.acked]
+        )
+
+
+class _FakeAsyncPullSubscriber(_FakeAsyncSubscriber):
+    def __init__(self, received_messages) -> None:
+        super().__init__()
+        self.received_messages = received_messages
+
+    async def get_subscription(self, subscription):
+        return types.SimpleNamespace(ack_deadline_seconds=600)
+
+    async def pull(self, subscription, max_messages, return_immediately):
+        # The real client waits on the network, which lets the event loop run.
+        await asyncio.sleep(0.01)
+        received_messages, self.received_messages = self.received_messages, []
+        return types.SimpleNamespace(received_messages=received_messages)
+
+
+def _received_message(ack_id: str, data: bytes):
+    message = types.SimpleNamespace(
+        data=data, attributes={}, ordering_key="", publish_time=None
+    )
+    return types.SimpleNamespace(ack_id=ack_id, message=message)
+
+
+class UnaryPullTest(unittest.TestCase):
+    def test_undecodable_messages_are_nacked(self):
+        client = _FakeAsyncPullSubscriber(
+            [
+                _received_message("good", b'{"field": 1}'),
+                _received_message("bad", b"not json"),
+            ]
+        )
+        sink = _CollectingSink()
+        pubsub_ref = io.GCPPubSubSource(subscription="projects/p/subscriptions/sub")
+        source = io.PubSubSourceActor.__ray_actor_class__(
+            {"sink": base.LocalActorHandle(sink)}, None, pubsub_ref
+        )
+
+        with mock.patch.object(
+            io.clients, "get_async_subscriber_client", return_value=client
+        ):
+            asyncio.run(_run_until_received(source, sink, 1))
+
+        self.assertEqual([{"field": 1}], sink.elements)
+        self.assertEqual([["good"]], client.acked)
+        self.assertEqual([(["bad"], 0)], client.nacked)
+
+
+class LeaseManagerTest(unittest.TestCase):
+    def test_lease_secs_follows_processing_times(self):
+        manager = io._LeaseManager(_FakeAsyncSubscriber(), "sub", 600, 3600)
+        self.assertEqual(600, manager.lease_secs())
+
+        manager._processing_times.extend([2.0] * 50 + [40.0] * 50)
+        self.assertEqual(40 + io._LEASE_RENEWAL_MARGIN_SECS, manager.lease_secs())
+
+        manager._processing_times.clear()
+        manager._processing_times.append(0.5)
+        self.assertEqual(io._MIN_ACK_DEADLINE_SECS, manager.lease_secs())
+
+        manager._processing_times.append(10_000)
+        self.assertEqual(io._MAX_ACK_DEADLINE_SECS, manager.lease_secs())
+
+    def test_extends_expiring_leases(self):
+        client = _FakeAsyncSubscriber()
+
+        async def run():
+            manager = io._LeaseManager(client, "sub", 10, 3600)
+            manager.lease(["1"])
+            manager.lease(["2"])
+            manager.release(["2"])
+            # Still far from the deadline.
+            await manager.extend_expiring()
+            with mock.patch.object(
+                io.time, "monotonic", return_value=time.monotonic() + 8
+            ):
+                await manager.extend_expiring()
+                # The lease was just extended.
+                await manager.extend_expiring()
+            await manager.close()
+
+        asyncio.run(run())
+
+        self.assertEqual([(["1"], io._MIN_ACK_DEADLINE_SECS)], client.nacked)
+
+    def test_leases_are_not_extended_past_max_duration(self):
+        client = _FakeAsyncSubscriber()
+
+        async def run():
+            manager = io._LeaseManager(client, "sub", 10, 5)
+            manager.lease(["1"])
+            with mock.patch.object(
+                io.time, "monotonic", return_value=time.monotonic() + 8
+            ):
+                await manager.extend_expiring()
+            await manager.close()
+
+        asyncio.run(run())
+
+        self.assertEqual([], client.nacked)
+
+    def test_shutdown_keeps_extending_leases_until_run_returns(self):
+        client = _FakeAsyncSubscriber()
+        pubsub_ref = io.GCPPubSubSource(subscription="projects/p/subscriptions/sub")
+        source = io.PubSubSourceActor.__ray_actor_class__({}, None, pubsub_ref)
+
+        async def run():
+            source._lease_manager = io._LeaseManager(client, "sub", 10, 3600)
+            source._lease_manager.lease(["1"])
+            await source.shutdown()
+            # The batch is still being processed while the replica drains.
+            self.assertFalse(source._lease_manager._lease_task.done())
+            source._lease_manager.release(["1"])
+            await source._lease_manager.close()
+
+        asyncio.run(run())
+
+    def test_invalid_ack_deadline(self):
+        with self.assertRaises(ValueError):
+            io.GCPPubSubSource(
+                subscription="projects/p/subscriptions/sub", ack_deadline_seconds=5
+            )
+
+
+class _FakeMessage:
+    def __init__(
+        self, element, publish_time: datetime.datetime, ordering_key: str = ""
+    ) -> None:
+        self.data = json.dumps(element).encode()
+        self.attributes = {}
+        self.publish_time = publish_time
+        self.ordering_key = ordering_key
+        self.acked = False
+        self.nacked = False
+
+    def ack(self):
+        self.acked = True
+
+    def nack(self):
+        self.nacked = True
+
+
+class _FakeStreamingPullFuture(concurrent.futures.Future):
+    def cancel(self):
+        # The subscriber client resolves the future once the stream closes.
+        if not self.done():
+            self.set_result(None)
+        return True
+
+
+class _FakeStreamingSubscriber:
+    def __init__(self, messages) -> None:
+        self.messages = messages
+        self.flow_control = None
+
+    def subscribe(self, subscription, callback, flow_control):
+        self.flow_control = flow_control
+
+        def deliver():
+            for message in self.messages:
+                callback(message)
+
+        threading.Thread(target=deliver).start()
+        return _FakeStreamingPullFuture()
+
+
+class _CollectingSink:
+    def __init__(self) -> None:
+        self.elements = []
+
+    async def write(self, elements):
+        self.elements.extend(elements)
+        return elements
+
+
+async def _run_until_received(source, sink: _CollectingSink, num_elements: int):
+    run_task = asyncio.ensure_future(source.run())
+    deadline = time.monotonic() + 30
+    while len(sink.elements) < num_elements and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    await source.shutdown()
+    await run_task
+
+
+class StreamingPullTest(unittest.TestCase):
+    def test_streaming_pull(self):
+        publish_time = datetime.datetime.now(datetime.timezone.utc)
+        messages = [_FakeMessage({"field": i}, publish_time) for i in range(5)]
+        subscriber = _FakeStreamingSubscriber(messages)
+        sink = _CollectingSink()
+        pubsub_ref = io.GCPPubSubSource(
+            subscription="projects/p/subscriptions/sub",
+            streaming_pull=True,
+            max_outstanding_messages=10,
+            max_outstanding_bytes=1000,
+        )
+        source = io.PubSubSourceActor.__ray_actor_class__(
+            {"sink": base.LocalActorHandle(sink)}, None, pubsub_ref
+        )
+
+        with mock.patch.object(
+            io.clients, "get_subscriber_client", return_value=subscriber
+        ):
+            asyncio.run(_run_until_received(source, sink, len(messages)))
+
+        self.assertEqual([{"field": i} for i in range(5)], sink.elements)
+        self.assertTrue(all(message.acked for message in messages))
+        self.assertEqual(10, subscriber.flow_control.max_messages)
+        self.assertEqual(1000, subscriber.flow_control.max_bytes)
+        self.assertEqual(5, len(source._message_ages))
+
+    def test_failed_batches_are_nacked(self):
+        message = _FakeMessage({"field": 1}, None)
+
+        class _FailingSink:
+            async def write(self, elements):
+                raise ValueError("failed")
+
+        pubsub_ref = io.GCPPubSubSource(
+            subscription="projects/p/subscriptions/sub", streaming_pull=True
+        )
+        source = io.PubSubSourceActor.__ray_actor_class__(
+            {"sink": base.LocalActorHandle(_FailingSink())}, None, pubsub_ref
+        )
+
+        async def run():
+            run_task = asyncio.ensure_future(source.run())
+            deadline = time.monotonic() + 30
+            while not message.nacked and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            await source.shutdown()
+            await run_task
+
+        with mock.patch.object(
+            io.clients,
+            "get_subscriber_client",
+            return_value=_FakeStreamingSubscriber([message]),
+        ):
+            asyncio.run(run())
+
+        self.assertTrue(message.nacked)
+        self.assertFalse(message.acked)
+
+    def test_close_nacks_queued_messages_on_the_event_loop(self):
+        messages = [_FakeMessage({"field": i}, None) for i in range(3)]
+        nack_threads = []
+        for message in messages:
+            message.nack = lambda: nack_threads.append(threading.current_thread())
+
+        async def run_blocking(fn):
+            return await asyncio.get_running_loop().run_in_executor(None, fn)
+
+        async def run():
+            receiver = io._StreamingPullReceiver(
+                _FakeStreamingSubscriber(messages), "sub", None
+            )
+            deadline = time.monotonic() + 30
+            while receiver._messages.qsize() < 3 and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            await receiver.close(run_blocking)
+
+        asyncio.run(run())
+
+        self.assertEqual([threading.main_thread()] * 3, nack_threads)
+
+    def test_codec_attributes_are_not_included(self):
+        writer = codecs.WireFormat(codecs.JsonCodec())
+        message = _FakeMessage({"field": 1}, None)
+        message.attributes = {**writer.attributes(), "user": "value"}
+        sink = _CollectingSink()
+        pubsub_ref = io.GCPPubSubSource(
+            subscription="projects/p/subscriptions/sub",
+            streaming_pull=True,
+            include_attributes=True,
+        )
+        source = io.PubSubSourceActor.__ray_actor_class__(
+            {"sink": base.LocalActorHandle(sink)}, None, pubsub_ref
+        )
+
+        with mock.patch.object(
+            io.clients,
+            "get_subscriber_client",
+            return_value=_FakeStreamingSubscriber([message]),
+        ):
+            asyncio.run(_run_until_received(source, sink, 1))
+
+        self.assertEqual(
+            [io.PubsubMessage({"field": 1}, {"user": "value"})], sink.elements
+        )
+
+    def test_undecodable_messages_are_nacked(self):
+        good = _FakeMessage({"field": 1}, None)
+        bad = _FakeMessage({}, None)
+        bad.data = b"not json"
+        sink = _CollectingSink()
+        pubsub_ref = io.GCPPubSubSource(
+            subscription="projects/p/subscriptions/sub", streaming_pull=True
+        )
+        source = io.PubSubSourceActor.__ray_actor_class__(
+            {"sink": base.LocalActorHandle(sink)}, None, pubsub_ref
+        )
+
+        with mock.patch.object(
+            io.clients,
+            "get_subscriber_client",
+            return_value=_FakeStreamingSubscriber([bad, good]),
+        ):
+            asyncio.run(_run_until_received(source, sink, 1))
+
+        self.assertEqual([{"field": 1}], sink.elements)
+        self.assertTrue(good.acked)
+        self.assertTrue(bad.nacked)
+        self.assertFalse(bad.acked)
+
+    @unittest.skipIf(codecs.msgpack is None, "requires msgpack")
+    def test_messages_are_decoded_by_content_type(self):
+        writer = codecs.WireFormat(codecs.MsgPackCodec())
+        message = _FakeMessage({}, None)
+        message.data = writer.encode({"field": 1})
+        message.attributes = writer.attributes()
+        sink = _CollectingSink()
+        pubsub_ref = io.GCPPubSubSource(
+            subscription="projects/p/subscriptions/sub", streaming_pull=True
+        )
+        source = io.PubSubSourceActor.__ray_actor_class__(
+            {"sink": base.LocalActorHandle(sink)}, None, pubsub_ref
+        )
+
+        with mock.patch.object(
+            io.clients,
+            "get_subscriber_client",
+            return_value=_FakeStreamingSubscriber([message]),
+        ):
+            asyncio.run(_run_until_received(source, sink, 1))
+
+        self.assertEqual([{"field": 1}], sink.elements)
+
+    def test_ordering_keys_are_processed_in_order(self):
+        messages = [
+            _FakeMessage({"key": key, "field": i}, None, ordering_key=key)
+            for i in range(3)
+            for key in ["a", "b"]
+        ]
+
+        class _OrderingSink(_CollectingSink):
+            async def write(self, elements):
+                # Later writes finish first unless they're sequenced.
+                await asyncio.sleep(0.2 if elements[0]["field"] == 0 else 0.01)
+                return await super().write(elements)
+
+        sink = _OrderingSink()
+        pubsub_ref = io.GCPPubSubSource(
+            subscription="projects/p/subscriptions/sub",
+            streaming_pull=True,
+            max_in_flight_batches=4,
+            enable_message_ordering=True,
+        )
+        source = io.PubSubSourceActor.__ray_actor_class__(
+            {"sink": base.LocalActorHandle(sink)}, None, pubsub_ref
+        )
+        source.batch_size = 1
+        source.configure_concurrency(2)
+
+        with mock.patch.object(
+            io.clients,
+            "get_subscriber_client",
+            return_value=_FakeStreamingSubscriber(messages),
+        ):
+            asyncio.run(_run_until_received(source, sink, len(messages)))
+
+        for key in ["a", "b"]:
+            self.assertEqual(
+                [0, 1, 2],
+                [e["field"] for e in sink.elements if e["key"] == key],
+            )
+        self.assertTrue(all(message.acked for message in messages))
+
+
+class _FakePublisher:
+    def __init__(self, failures_per_message: int = 0) -> None:
+        self.failures_per_message = failures_per_message
+        self.attempts = {}
+        self.published = []
+        self.ordering_keys = []
+        self.attributes = []
+        self.resumed = []
+
+    def resume_publish(self, topic, ordering_key):
+        self.resumed.append(ordering_key)
+
+    def publish(self, topic, data, ordering_key="", **attributes):
+        self.ordering_keys.append(ordering_key)
+        self.attributes.append(attributes)
+        future = concurrent.futures.Future()
+        attempts = self.attempts.get(data, 0)
+        self.attempts[data] = attempts + 1
+
+        def resolve():
+            if attempts < self.failures_per_message:
+                future.set_exception(exceptions.ServiceUnavailable("unavailable"))
+            else:
+                self.published.append(json.loads(data))
+                future.set_result("message-id")
+
+        # The publisher client resolves futures from its own threads.
+        threading.Timer(0.01, resolve).start()
+        return future
+
+
+class PubSubSinkTest(unittest.TestCase):
+    def sink(self, publisher: _FakePublisher, **kwargs):
+        with mock.patch.object(
+            io.clients, "get_publisher_client", return_value=publisher
+        ) as get_client:
+            sink = io.PubSubSinkActor.__ray_actor_class__(
+                None, io.GCPPubSubSink("projects/p/topics/topic", **kwargs)
+            )
+        return sink, get_client
+
+    def test_publishes_batch_concurrently(self):
+        publisher = _FakePublisher()
+        sink, get_client = self.sink(
+            publisher, max_batch_messages=500, max_batch_latency_secs=0.05
+        )
+        elements = [{"field": i} for i in range(1000)]
+
+        start = time.monotonic()
+        asyncio.run(sink._write(elements))
+
+        # Publishing one message at a time would take at least 10 seconds.
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertCountEqual(elements, publisher.published)
+        self.assertEqual({"content-type": "application/json"}, publisher.attributes[0])
+        batch_settings = get_client.call_args.args[1]
+        self.assertEqual(500, batch_settings.max_messages)
+        self.assertEqual(0.05, batch_settings.max_latency)
+
+    def test_failed_messages_are_retried(self):
+        publisher = _FakePublisher(failures_per_message=2)
+        sink, _ = self.sink(publisher, max_publish_retries=2)
+
+        asyncio.run(sink._write([{"field": 1}, {"field": 2}]))
+
+        self.assertCountEqual([{"field": 1}, {"field": 2}], publisher.published)
+
+    def test_write_fails_after_retries(self):
+        publisher = _FakePublisher(failures_per_message=3)
+        sink, _ = self.sink(publisher, max_publish_retries=2)
+
+        with self.assertRaisesRegex(RuntimeError, "failed to publish 1 messages"):
+            asyncio.run(sink._write([{"field": 1}]))
+
+    def test_publishes_with_ordering_keys(self):
+        publisher = _FakePublisher(failures_per_message=1)
+        sink, get_client = self.sink(publisher, ordering_key_field="key")
+
+        asyncio.run(sink._write([{"key": "a", "field": 1}, {"field": 2}]))
+
+        self.assertTrue(get_client.call_args.args[2].enable_message_ordering)
+        self.assertEqual(["a", "", "a", ""], publisher.ordering_keys)
+        # The key is paused after the failure and resumed before the retry.
+        self.assertEqual(["a"], publisher.resumed)
+        self.assertCountEqual(
+            [{"key": "a", "field": 1}, {"field": 2}], publisher.published
+        )
+
+
+@unittest.skipUnless(
+    os.environ.get("PUBSUB_EMULATOR_HOST"), "requires the Pub/Sub emulator"
+)
+class StreamingPullEmulatorTest(unittest.TestCase):
+    def test_streaming_pull(self):
+        from google.cloud import pubsub
+
+        project = "buildflow-test"
+        suffix = str(time.time_ns())
+        topic = f"projects/{project}/topics/streaming-pull-{suffix}"
+        subscription = f"projects/{project}/subscriptions/streaming-pull-{suffix}"
+        publisher = pubsub.PublisherClient()
+        publisher.create_topic(name=topic)
+        pubsub.SubscriberClient().create_subscription(name=subscription, topic=topic)
+        for i in range(10):
+            publisher.publish(topic, json.dumps({"field": i}).encode()).result()
+        sink = _CollectingSink()
+        source = io.PubSubSourceActor.__ray_actor_class__(
+            {"sink": base.LocalActorHandle(sink)},
+            None,
+            io.GCPPubSubSource(subscription=subscription, streaming_pull=True),
+        )
+
+        asyncio.run(_run_until_received(source, sink, 10))
+
+        self.assertEqual(
+            [{"field": i} for i in range(10)],
+            sorted(sink.elements, key=lambda element: element["field"]),
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,6 @@
 """Utils for working with pubsub."""
 
+import logging
 from typing import List
 
 from google.api_core import exceptions
@@ -54,10 +55,22 @@ def maybe_create_subscription(
     pubsub_topic: str,
     billing_project: str,
     publisher_members: List[str] = [],
+    enable_message_ordering: bool = False,
+    ack_deadline_seconds: int = 600,
 ):
     subscriber_client = clients.get_subscriber_client(billing_project)
     try:
-        subscriber_client.get_subscription(subscription=pubsub_subscription)
+        subscription = subscriber_client.get_subscription(
+            subscription=pubsub_subscription
+        )
+        if enable_message_ordering and not subscription.enable_message_ordering:
+            # Ordering can only be enabled when a subscription is created.
+            logging.warning(
+                "subscription: %s does not have message ordering enabled, "
+                "messages with the same ordering key may be delivered out of "
+                "order.",
+                pubsub_subscription,
+            )
     except exceptions.NotFound:
         if not pubsub_topic:
             raise ValueError(
@@ -71,14 +84,16 @@ def maybe_create_subscription(
             publisher_members=publisher_members,
             billing_project=billing_project,
         )
+        kwargs = {}
+        if enable_message_ordering:
+            kwargs["enable_message_ordering"] = True
         try:
             print(f"Creating subscription: {pubsub_subscription}")
             subscriber_client.create_subscription(
                 name=pubsub_subscription,
                 topic=pubsub_topic,
-                # TODO: we should make this
-                # configurable.
-                ack_deadline_seconds=600,
+                ack_deadline_seconds=ack_deadline_seconds,
+                **kwargs,
             )
         except exceptions.PermissionDenied:
             raise ValueError(
@@ -181,5 +181,8 @@ class GCSFileNotifications(io.StreamingSource):
             ray_sinks, proc_input_type, self._pubsub_ref
         )
 
+    def local_actor(self, ray_sinks, proc_input_type: Optional[Type]):
+        return self._pubsub_ref.local_actor(ray_sinks, proc_input_type)
+
     def backlog(self) -> Optional[float]:
         return self._pubsub_ref.backlog()
@@ -39,11 +39,14 @@ class PubSubSource(io.StreamingSource):
     def actor(self, ray_sinks, proc_input_type: Optional[Type]):
         if self.cloud == io.Cloud.GCP:
             return gcp_pubsub_io.PubSubSourceActor.remote(
-                ray_sinks, self._cloud_source, proc_input_type
+                ray_sinks, proc_input_type, self._cloud_source
             )
         else:
             raise ValueError(f"Unsupported cloud: {self.cloud}")
 
+    def local_actor(self, ray_sinks, proc_input_type: Optional[Type]):
+        return self._cloud_source.local_actor(ray_sinks, proc_input_type)
+
     def publisher(self) -> Publisher:
         return self._cloud_source.publisher()
 
@@ -74,3 +77,6 @@ class PubSubSink(io.Sink):
 
     def actor(self, remote_fn: Callable, is_streaming: bool):
         return gcp_pubsub_io.PubSubSinkActor.remote(remote_fn, self._cloud_sink)
+
+    def local_actor(self, remote_fn: Callable, is_streaming: bool):
+        return self._cloud_sink.local_actor(remote_fn, is_streaming)
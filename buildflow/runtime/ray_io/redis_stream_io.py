@@ -11,6 +11,10 @@ import redis
 
 from buildflow import io
 from buildflow.runtime.ray_io import base
+from buildflow.runtime.ray_io import codecs
+
+# The entry field that holds the payload of entries written with a codec.
+_DATA_FIELD = "data"
 
 
 @dataclasses.dataclass
@@ -22,10 +26,25 @@ class RedisStreamSource(io.Source):
     streams: List[str]
     start_positions: Dict[str, str] = dataclasses.field(default_factory=dict)
     read_timeout_secs: int = -1
+    # Whether or not to send stream entries to the processor as a pyarrow
+    # RecordBatch.
+    columnar: bool = False
+    # The max number of batches that can be processed at once. Defaults to one
+    # so entries are written to the sinks in stream order.
+    max_in_flight_batches: int = 1
+    # If set every entry is read as a single payload in its "data" field that
+    # is decoded with the codec. Entries written by a sink with a codec are
+    # always decoded with the codec they were encoded with. Otherwise the
+    # fields of an entry are read as strings.
+    codec: Optional[codecs.Codec] = None
+    compression: codecs.Compression = codecs.Compression.NONE
 
     def actor(self, ray_sinks, proc_input_type: Optional[Type]):
         return RedisStreamInput.remote(ray_sinks, proc_input_type, self)
 
+    def local_actor(self, ray_sinks, proc_input_type: Optional[Type]):
+        return base.local_actor(RedisStreamInput, ray_sinks, proc_input_type, self)
+
     @classmethod
     def is_streaming(cls) -> bool:
         return True
@@ -38,10 +57,18 @@ class RedisStreamSink(io.Sink):
     host: str
     port: str
     streams: List[str]
+    # If set every element is written as an entry with a single "data" field
+    # holding the encoded element, plus its content-type and content-encoding.
+    # Otherwise the fields of the element are written as the entry's fields.
+    codec: Optional[codecs.Codec] = None
+    compression: codecs.Compression = codecs.Compression.NONE
 
     def actor(self, remote_fn: Callable, is_streaming: bool):
         return RedisStreamOutput.remote(remote_fn, self)
 
+    def local_actor(self, remote_fn: Callable, is_streaming: bool):
+        return base.local_actor(RedisStreamOutput, remote_fn, self)
+
 
 @ray.remote(num_cpus=RedisStreamSource.num_cpus())
 class RedisStreamInput(base.StreamingRaySource):
@@ -51,13 +78,22 @@ class RedisStreamInput(base.StreamingRaySource):
         proc_input_type: Optional[Type],
         redis_stream_ref: RedisStreamSource,
     ) -> None:
-        super().__init__(ray_sinks, proc_input_type)
+        super().__init__(
+            ray_sinks,
+            proc_input_type,
+            redis_stream_ref.columnar,
+            redis_stream_ref.max_in_flight_batches,
+        )
         self.redis_client = redis.Redis(
             host=redis_stream_ref.host, port=redis_stream_ref.port
         )
         self.timeout_secs = redis_stream_ref.read_timeout_secs
+        self.decode_entries = redis_stream_ref.codec is not None
+        self.wire_format = codecs.WireFormat(
+            redis_stream_ref.codec or codecs.JsonCodec(), redis_stream_ref.compression
+        )
         self.streams = {}
-        self.running = True
+        self._start = time.time()
         for stream in redis_stream_ref.streams:
             if stream in redis_stream_ref.start_positions:
                 start = redis_stream_ref.start_positions[stream]
@@ -79,25 +115,50 @@ class RedisStreamInput(base.StreamingRaySource):
             "Started listening to the following streams at the s" "pecified ID: %s",
             self.streams,
         )
-        start = time.time()
-        while self.running:
-            if self.timeout_secs > 0 and time.time() - start > self.timeout_secs:
-                break
-            stream_data = self.redis_client.xread(streams=self.streams)
-            for stream in stream_data:
-                stream_name = stream[0]
-                stream_data = stream[1]
-                items = []
-                for id_item in stream_data:
-                    item_id, item = id_item
-                    self.streams[stream_name.decode()] = item_id.decode()
-                    decoded_item = {}
-                    for key, value in item.items():
-                        decoded_item[key.decode()] = value.decode()
-                    items.append(decoded_item)
-                await self._send_batch_to_sinks_and_await(items)
-
+        self._start = time.time()
+        self._read_lock = asyncio.Lock()
+        return await super().run()
+
+    async def pull(self) -> base.PulledBatch:
+        if self.timeout_secs > 0 and time.time() - self._start > self.timeout_secs:
+            self.running = False
+            return base.PulledBatch([])
+        # Reading and advancing the stream positions has to happen atomically,
+        # otherwise concurrent pull loops would read the same entries.
+        async with self._read_lock:
+            stream_data = await self.run_blocking(
+                self.redis_client.xread, streams=self.streams
+            )
+            items, num_bytes = self._decode_stream_data(stream_data)
+        if not items:
             await asyncio.sleep(1)
+        return base.PulledBatch(items, num_bytes=num_bytes)
+
+    def _decode_stream_data(self, stream_data):
+        items = []
+        num_bytes = 0
+        for stream in stream_data:
+            stream_name = stream[0]
+            stream_data = stream[1]
+            for id_item in stream_data:
+                item_id, item = id_item
+                self.streams[stream_name.decode()] = item_id.decode()
+                for key, value in item.items():
+                    num_bytes += len(key) + len(value)
+                items.append(self._decode_item(item))
+        return items, num_bytes
+
+    def _decode_item(self, item: Dict[bytes, bytes]) -> Any:
+        content_type = item.get(codecs.CONTENT_TYPE_ATTRIBUTE.encode())
+        if content_type is None and not self.decode_entries:
+            return {key.decode(): value.decode() for key, value in item.items()}
+        attributes = {}
+        if content_type is not None:
+            attributes[codecs.CONTENT_TYPE_ATTRIBUTE] = content_type.decode()
+        content_encoding = item.get(codecs.CONTENT_ENCODING_ATTRIBUTE.encode())
+        if content_encoding is not None:
+            attributes[codecs.CONTENT_ENCODING_ATTRIBUTE] = content_encoding.decode()
+        return self.wire_format.decode(item.get(_DATA_FIELD.encode(), b""), attributes)
 
     def shutdown(self):
         self.running = False
@@ -116,11 +177,19 @@ class RedisStreamOutput(base.RaySink):
             host=redis_stream_ref.host, port=redis_stream_ref.port
         )
         self.streams = redis_stream_ref.streams
+        self.wire_format = None
+        if redis_stream_ref.codec is not None:
+            self.wire_format = codecs.WireFormat(
+                redis_stream_ref.codec, redis_stream_ref.compression
+            )
 
     async def _write(
         self,
         elements: Union[Iterable[Iterable[Dict[str, Any]]], Iterable[Dict[str, Any]]],
     ):
+        elements = base.to_rows(elements)
+        if self.wire_format is not None:
+            elements = self._encode(elements)
         for stream in self.streams:
             for elem in elements:
                 if isinstance(elem, dict):
@@ -128,3 +197,14 @@ class RedisStreamOutput(base.RaySink):
                 else:
                     for subelem in elem:
                         self.redis_client.xadd(stream, subelem)
+
+    def _encode(self, elements: Iterable[Any]) -> List[Dict[str, Any]]:
+        attributes = self.wire_format.attributes()
+        entries = []
+        for elem in elements:
+            subelems = elem if isinstance(elem, (list, tuple)) else [elem]
+            for subelem in subelems:
+                entries.append(
+                    {_DATA_FIELD: self.wire_format.encode(subelem), **attributes}
+                )
+        return entries
@@ -9,6 +9,7 @@ import unittest
 import pytest
 
 import buildflow
+from buildflow.runtime.ray_io import redis_stream_io
 
 
 @dataclasses.dataclass
@@ -16,6 +17,36 @@ class Output:
     field: str
 
 
+class RedisStreamCodecTest(unittest.TestCase):
+    def test_entries_are_decoded_with_their_codec(self):
+        sink_ref = buildflow.RedisStreamSink(
+            host="localhost",
+            port=8765,
+            streams=["output_stream"],
+            codec=buildflow.JsonCodec(),
+        )
+        sink = redis_stream_io.RedisStreamOutput.__ray_actor_class__(None, sink_ref)
+        source_ref = buildflow.RedisStreamSource(
+            host="localhost",
+            port=8765,
+            streams=["input_stream"],
+            start_positions={"input_stream": 0},
+        )
+        source = redis_stream_io.RedisStreamInput.__ray_actor_class__(
+            {}, None, source_ref
+        )
+
+        [entry] = sink._encode([Output(field="value")])
+        entry = {
+            key.encode(): value if isinstance(value, bytes) else value.encode()
+            for key, value in entry.items()
+        }
+
+        self.assertEqual({"field": "value"}, source._decode_item(entry))
+        # Entries without a content type are read field by field.
+        self.assertEqual({"field": "value"}, source._decode_item({b"field": b"value"}))
+
+
 @pytest.mark.usefixtures("ray_fix")
 @pytest.mark.usefixtures("event_loop_instance")
 class RedisStreamTest(unittest.TestCase):
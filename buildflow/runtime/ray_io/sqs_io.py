@@ -1,7 +1,7 @@
 import asyncio
 from dataclasses import asdict, dataclass
 import logging
-from typing import Any, Dict, Optional, Type
+from typing import Any, Dict, List, Optional, Type
 
 import boto3
 import ray
@@ -31,6 +31,12 @@ class SQSSource(io.StreamingSource):
     region: str = ""
     queue_owner_aws_account_id: str = ""
     batch_size: int = 10
+    # Whether or not to send received messages to the processor as a pyarrow
+    # RecordBatch.
+    columnar: bool = False
+    # The max number of batches that can be processed at once. The next batch
+    # is pulled while earlier batches are still being processed.
+    max_in_flight_batches: int = 2
 
     _queue_url: str = ""
     # Client used for testing locally.
@@ -81,6 +87,9 @@ class SQSSource(io.StreamingSource):
     def actor(self, ray_sinks, proc_input_type: Optional[Type]):
         return SQSSourceActor.remote(ray_sinks, proc_input_type, self)
 
+    def local_actor(self, ray_sinks, proc_input_type: Optional[Type]):
+        return base.local_actor(SQSSourceActor, ray_sinks, proc_input_type, self)
+
     def backlog(self) -> Optional[float]:
         client = self.get_boto_client()
         queue_url = self.get_queue_url()
@@ -100,7 +109,12 @@ class SQSSourceActor(base.StreamingRaySource):
         proc_input_type: Optional[Type],
         source: SQSSource,
     ) -> None:
-        super().__init__(ray_sinks, proc_input_type)
+        super().__init__(
+            ray_sinks,
+            proc_input_type,
+            source.columnar,
+            source.max_in_flight_batches,
+        )
         if source._test_sqs_client is not None:
             self.sqs_client = source._test_sqs_client
         else:
@@ -115,49 +129,46 @@ class SQSSourceActor(base.StreamingRaySource):
         )
         # This is the max messages allowed by SQS.
         self.batch_size = source.batch_size
-        self.running = True
 
-    async def run(self):
-        while self.running:
-            try:
-                response = self.sqs_client.receive_message(
-                    QueueUrl=self.queue_url,
-                    AttributeNames=["All"],
-                    MaxNumberOfMessages=self.batch_size,
-                )
-                num_messages = 0
-                if "Messages" in response:
-                    num_messages = len(response["Messages"])
-                    await self._send_batch_to_sinks_and_await(response["Messages"])
-                    to_delete = []
-                    for message in response["Messages"]:
-                        to_delete.append(
-                            {
-                                "Id": message["MessageId"],
-                                "ReceiptHandle": message["ReceiptHandle"],
-                            }
-                        )
-                    self.sqs_client.delete_message_batch(
-                        QueueUrl=self.queue_url, Entries=to_delete
-                    )
-                # TODO: we should look into abstracting the while loop in
-                # base.StreamingRaySource then new sources wouldn't have to
-                # worry about the shutdown / reporting metrics
-                self.update_metrics(num_messages)
-                # Since SQS doesn't have an async client we need to
-                # sleep here to yield back the event loop. This allows us to
-                # collect metrics and shut down correctly.
-                # Ideally we wouldn't have to put this sleep in here though.
-                # TODO: look at using promethius metrics to get metrics
-                # instead.
-                await asyncio.sleep(0.1)
-            except Exception as error:
-                logging.error(
-                    "Couldn't process messages from queue: %s. The message "
-                    "will not be removed and can be retried later. error: %s",
-                    self.queue_url,
-                    error,
-                )
+    async def pull(self) -> base.PulledBatch:
+        # The boto client is blocking, so it runs in a thread to let multiple
+        # pull loops overlap.
+        response = await self.run_blocking(
+            self.sqs_client.receive_message,
+            QueueUrl=self.queue_url,
+            AttributeNames=["All"],
+            MaxNumberOfMessages=self.batch_size,
+        )
+        messages = response.get("Messages", [])
+        if not messages:
+            # Back off a little when the queue is empty.
+            await asyncio.sleep(0.1)
+        to_delete = [
+            {"Id": message["MessageId"], "ReceiptHandle": message["ReceiptHandle"]}
+            for message in messages
+        ]
+        num_bytes = sum(len(message.get("Body", "")) for message in messages)
+        # SentTimestamp is in milliseconds since the epoch.
+        publish_times = [
+            int(message["Attributes"]["SentTimestamp"]) / 1000
+            for message in messages
+            if "SentTimestamp" in message.get("Attributes", {})
+        ]
+        return base.PulledBatch(messages, to_delete, num_bytes, publish_times)
+
+    async def ack(self, to_delete: List[Dict[str, str]], success: bool):
+        if not success:
+            logging.error(
+                "Couldn't process messages from queue: %s. The message "
+                "will not be removed and can be retried later.",
+                self.queue_url,
+            )
+            return
+        await self.run_blocking(
+            self.sqs_client.delete_message_batch,
+            QueueUrl=self.queue_url,
+            Entries=to_delete,
+        )
 
     def shutdown(self):
         print("Shutting down SQS source")
@@ -127,6 +127,50 @@ class SqsIoTest(unittest.TestCase):
 
         self.get_async_result(runner.shutdown())
 
+    def test_sqs_source_fused_replicas(self):
+        path = os.path.join(self.output_path, "output.parquet")
+
+        fake_sqs = FakeSqsClient(
+            responses=[
+                {
+                    "Messages": [
+                        {
+                            "MessageId": "1",
+                            "ReceiptHandle": "2",
+                            "Body": {"field": 1},
+                        },
+                        {
+                            "MessageId": "3",
+                            "ReceiptHandle": "4",
+                            "Body": {"field": 2},
+                        },
+                    ]
+                }
+            ]
+        )
+
+        input_sqs = buildflow.SQSSource(
+            queue_name="queue_name", region="us-east-2", _test_sqs_client=fake_sqs
+        )
+
+        @self.app.processor(
+            source=input_sqs,
+            sink=buildflow.FileSink(
+                file_path=path, file_format=buildflow.FileFormat.PARQUET
+            ),
+            fuse_replicas=True,
+        )
+        def process(element):
+            return element["Body"]
+
+        runner = self.app.run(blocking=False)
+
+        time.sleep(10)
+        table = pq.read_table(path)
+        self.assertEqual([{"field": 1}, {"field": 2}], table.to_pylist())
+
+        self.get_async_result(runner.shutdown())
+
     @mock.patch("boto3.client")
     def test_sqs_source_disable_resource_creation(self, boto_mock: mock.MagicMock):
         path = os.path.join(self.output_path, "output.parquet")
@@ -1,8 +1,8 @@
-import dataclasses
-import datetime
 from typing import Any, Dict, Optional
 from uuid import uuid4
 
+from buildflow.runtime.encoders import get_encoder as _get_encoder
+
 
 def uuid(max_len: Optional[int] = None) -> str:
     if max_len is not None:
@@ -17,16 +17,6 @@ def dataclass_to_json(dataclass_instance) -> Dict[str, Any]:
     # This also converts some field types that we know aren't serializable to
     # json.
     #   - datetime.datetime, datetime.date, datetime.time
-
-    # TODO: need to ensure we convert containers of dataclasses to json
-    to_ret = {}
-    for k in dataclass_instance.__dataclass_fields__:
-        val = getattr(dataclass_instance, k)
-        if isinstance(val, (datetime.datetime, datetime.date, datetime.time)):
-            val = val.isoformat()
-        if dataclasses.is_dataclass(val):
-            val = dataclass_to_json(val)
-        if isinstance(val, list) and len(val) > 0 and dataclasses.is_dataclass(val[0]):
-            val = [dataclass_to_json(v) for v in val]
-        to_ret[k] = val
-    return to_ret
+    # The encoder is generated once per dataclass type and cached, see
+    # buildflow.runtime.encoders.
+    return _get_encoder(type(dataclass_instance))(dataclass_instance)